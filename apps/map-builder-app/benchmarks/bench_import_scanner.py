@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: so sánh tokenizer quét import mới của git_tracker với regex cũ
+trên các file TS/JS lớn được sinh tự động.
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from git_tracker import extract_import_specifiers  # noqa: E402
+
+# Regex cũ trong _extract_imports_from_file (lazy, không giới hạn phạm vi quét)
+LEGACY_IMPORT_REGEX = re.compile(r"(?:import|export)[\s\S]*?from\s*['\"](.*?)['\"]|require\s*\(\s*['\"](.*?)['\"]\s*\)")
+
+
+def legacy_extract(content: str) -> List[str]:
+    specifiers: Dict[str, None] = {}
+    for match in LEGACY_IMPORT_REGEX.finditer(content):
+        import_str = match.group(1) or match.group(2)
+        if import_str:
+            specifiers[import_str] = None
+    return list(specifiers)
+
+
+def generate_module(line_count: int, seed: int = 0) -> str:
+    """File TS điển hình: khối import ở đầu, sau đó là code có comment, chuỗi và template."""
+    rng = random.Random(seed)
+    lines = [f"import {{ dep{i} }} from './deps/dep{i}';" for i in range(40)]
+    lines.append("import './styles.css';")
+    body = [
+        "export const value{i} = compute({i}) / 2; // import fake from './comment'",
+        "const label{i} = `item ${{value{i}}} from template`;",
+        "function handler{i}(event: Event) {{ return event.type === 'click' ? {i} : -{i}; }}",
+        "/* export * from './block-comment' */ const re{i} = /from\\s+x/g;",
+        "const lazy{i} = () => import('./lazy/chunk{i}');",
+    ]
+    while len(lines) < line_count:
+        lines.append(rng.choice(body).format(i=len(lines)))
+    return '\n'.join(lines)
+
+
+def generate_pathological(line_count: int) -> str:
+    """
+    Nhiều token 'export' nhưng không có 'from' nào: với mỗi token, regex cũ quét đến tận cuối
+    file rồi mới thất bại, nên thời gian tăng theo bình phương kích thước.
+    """
+    lines = [f"export const value{i} = {i}; // exported value" for i in range(line_count)]
+    lines.append("module.exports = require('./tail');")
+    return '\n'.join(lines)
+
+
+def time_call(func: Callable[[str], List[str]], content: str, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(content)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='So sánh tốc độ quét import: tokenizer mới và regex cũ.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 4000, 16000], help='Số dòng của file sinh ra')
+    parser.add_argument('--repeat', type=int, default=3, help='Số lần đo, lấy thời gian tốt nhất')
+    args = parser.parse_args()
+
+    print(f"{'case':<14}{'lines':>8}{'bytes':>11}{'legacy (ms)':>14}{'scanner (ms)':>15}{'speedup':>10}")
+    for case_name, generator in (('module', generate_module), ('pathological', generate_pathological)):
+        for size in args.sizes:
+            content = generator(size)
+            legacy_s = time_call(legacy_extract, content, args.repeat)
+            scanner_s = time_call(extract_import_specifiers, content, args.repeat)
+            print(f"{case_name:<14}{size:>8}{len(content):>11}{legacy_s * 1000:>14.2f}{scanner_s * 1000:>15.2f}"
+                  f"{legacy_s / scanner_s if scanner_s else float('inf'):>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
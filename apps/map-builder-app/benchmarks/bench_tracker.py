@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Benchmark các entry point chính của git_tracker (--initial-scan, --check-update, --merge-deps, --merge-dir)
+trên một monorepo tổng hợp. Mỗi entry point được đo ở ba trạng thái:
+  cold   - chưa có output/metadata/index của tracker,
+  warm   - chạy lại ngay sau lần cold, không có gì thay đổi,
+  commit - sau một commit nhỏ (sửa vài module, thêm một module).
+Tracker được chạy như lúc hook gọi (một tiến trình CLI riêng cho mỗi lần đo). Kết quả ghi ra JSON
+và có thể so với một baseline đã lưu; trả về mã lỗi 1 nếu có phép đo chậm đi quá ngưỡng.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from monorepo_generator import generate_monorepo, small_commit  # noqa: E402
+
+TRACKER_SCRIPT = Path(__file__).resolve().parent.parent / 'git_tracker.py'
+GIT_CALLS_REGEX = re.compile(r'số tiến trình git đã tạo: (\d+)')
+
+
+class TrackerRunner:
+    """Chạy git_tracker.py trên repo benchmark với một thư mục output riêng và các tham số chung."""
+
+    def __init__(self, repo: Path, output_dir: Path, extra_args: List[str]):
+        self.repo = repo
+        self.output_dir = output_dir
+        self.extra_args = extra_args
+
+    def reset(self):
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def run(self, *action: str) -> Dict[str, Any]:
+        command = [sys.executable, str(TRACKER_SCRIPT), '--project-path', str(self.repo),
+                   '--output-dir', os.path.relpath(self.output_dir, self.repo), *self.extra_args, *action]
+        started = time.perf_counter()
+        result = subprocess.run(command, capture_output=True, text=True, encoding='utf-8')
+        elapsed = time.perf_counter() - started
+        if result.returncode != 0:
+            raise RuntimeError(f"Lệnh {' '.join(action)} lỗi (mã {result.returncode}):\n{result.stderr[-2000:]}")
+        git_calls = GIT_CALLS_REGEX.findall(result.stderr)
+        return {'seconds': elapsed, 'git_calls': int(git_calls[-1]) if git_calls else None}
+
+
+def measure_entry_point(runner: TrackerRunner, repo: Path, rng: random.Random, action: List[str],
+                        commit_files: int) -> Dict[str, Dict[str, Any]]:
+    """Một vòng đo cold -> warm -> commit cho một entry point."""
+    runner.reset()
+    samples = {'cold': runner.run(*action), 'warm': runner.run(*action)}
+    small_commit(repo, rng, modified=commit_files)
+    samples['commit'] = runner.run(*action)
+    return samples
+
+
+def summarize(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    seconds = [s['seconds'] for s in samples]
+    return {
+        'runs': len(seconds),
+        'best_s': round(min(seconds), 4),
+        'median_s': round(statistics.median(seconds), 4),
+        'git_calls': samples[-1]['git_calls'],
+        'samples_s': [round(s, 4) for s in seconds],
+    }
+
+
+def environment_info() -> Dict[str, Any]:
+    git_version = subprocess.run(['git', '--version'], capture_output=True, text=True).stdout.strip()
+    tracker_commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=TRACKER_SCRIPT.parent,
+                                    capture_output=True, text=True).stdout.strip() or None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'git': git_version,
+        'tracker_commit': tracker_commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare_with_baseline(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float,
+                          min_delta_s: float) -> List[Dict[str, Any]]:
+    """So median từng phép đo với baseline; đánh dấu chậm đi khi vượt cả ngưỡng tỉ lệ lẫn ngưỡng tuyệt đối."""
+    comparison = []
+    for name, current in results['measurements'].items():
+        previous = baseline.get('measurements', {}).get(name)
+        if not previous:
+            continue
+        ratio = current['median_s'] / previous['median_s'] if previous['median_s'] else float('inf')
+        delta = current['median_s'] - previous['median_s']
+        if ratio > threshold and delta > min_delta_s:
+            verdict = 'regression'
+        elif ratio < 1 / threshold and -delta > min_delta_s:
+            verdict = 'improvement'
+        else:
+            verdict = 'same'
+        comparison.append({'name': name, 'baseline_s': previous['median_s'], 'current_s': current['median_s'],
+                           'ratio': round(ratio, 3), 'verdict': verdict,
+                           'git_calls': [previous.get('git_calls'), current.get('git_calls')]})
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark các entry point của git_tracker trên monorepo tổng hợp.')
+    parser.add_argument('--files', type=int, default=2000, help='Số file của repo sinh ra (mặc định: 2000)')
+    parser.add_argument('--depth', type=int, default=4, help='Độ sâu thư mục tối đa (mặc định: 4)')
+    parser.add_argument('--fanout', type=int, default=5, help='Số import mỗi module (mặc định: 5)')
+    parser.add_argument('--packages', type=int, default=8, help='Số package (mặc định: 8)')
+    parser.add_argument('--alias-ratio', type=float, default=0.3, help='Tỉ lệ import qua alias tsconfig (mặc định: 0.3)')
+    parser.add_argument('--binary-ratio', type=float, default=0.05, help='Tỉ lệ asset nhị phân (mặc định: 0.05)')
+    parser.add_argument('--lines-per-file', type=int, default=40, help='Số dòng code mỗi file (mặc định: 40)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed cho repo và các commit nhỏ (mặc định: 0)')
+    parser.add_argument('--commit-files', type=int, default=3, help='Số module bị sửa trong commit nhỏ (mặc định: 3)')
+    parser.add_argument('--repeat', type=int, default=3, help='Số vòng đo cho mỗi entry point (mặc định: 3)')
+    parser.add_argument('--only', nargs='+', choices=['initial_scan', 'check_update', 'merge_deps', 'merge_dir'],
+                        help='Chỉ đo các entry point này')
+    parser.add_argument('--tracker-arg', action='append', default=[], metavar='ARG',
+                        help="Tham số thêm cho git_tracker, ví dụ --tracker-arg=--metadata-backend=sqlite")
+    parser.add_argument('--workdir', type=Path, help='Thư mục làm việc (mặc định: thư mục tạm, bị xóa khi xong)')
+    parser.add_argument('--output', type=Path, help='Ghi kết quả JSON ra file này')
+    parser.add_argument('--baseline', type=Path, help='File JSON kết quả cũ để so sánh')
+    parser.add_argument('--threshold', type=float, default=1.15,
+                        help='Tỉ lệ median mới/cũ bị coi là chậm đi (mặc định: 1.15)')
+    parser.add_argument('--min-delta-ms', type=float, default=20.0,
+                        help='Chênh lệch tuyệt đối tối thiểu (ms) để tính là thay đổi, tránh nhiễu (mặc định: 20)')
+    args = parser.parse_args()
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix='git-tracker-bench-'))
+    repo = workdir / 'repo'
+    if repo.exists():
+        shutil.rmtree(repo)
+    print(f"Sinh repo {args.files} file tại {repo} ...", file=sys.stderr)
+    started = time.perf_counter()
+    repo_info = generate_monorepo(repo, args.files, args.depth, args.fanout, args.packages, args.alias_ratio,
+                                  args.binary_ratio, args.lines_per_file, args.seed)
+    print(f"  xong sau {time.perf_counter() - started:.1f}s ({repo_info['modules']} module TS)", file=sys.stderr)
+
+    runner = TrackerRunner(repo, workdir / 'tracker-output', args.tracker_arg)
+    rng = random.Random(args.seed)
+
+    entry_points = {
+        'initial_scan': ['--initial-scan'],
+        'check_update': ['--check-update'],
+        'merge_deps': ['--merge-deps', repo_info['deps_target']],
+        'merge_dir': ['--merge-dir', repo_info['dir_target']],
+    }
+    samples: Dict[str, List[Dict[str, Any]]] = {}
+    try:
+        for name, action in entry_points.items():
+            if args.only and name not in args.only:
+                continue
+            for round_index in range(args.repeat):
+                print(f"Đo {name} (vòng {round_index + 1}/{args.repeat}) ...", file=sys.stderr)
+                for state, sample in measure_entry_point(runner, repo, rng, action, args.commit_files).items():
+                    samples.setdefault(f"{name}.{state}", []).append(sample)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'environment': environment_info(),
+        'repo': repo_info,
+        'tracker_args': args.tracker_arg,
+        'repeat': args.repeat,
+        'measurements': {name: summarize(runs) for name, runs in samples.items()},
+    }
+
+    print(f"\n{'measurement':<24}{'median (ms)':>13}{'best (ms)':>11}{'git calls':>11}")
+    for name, summary in results['measurements'].items():
+        print(f"{name:<24}{summary['median_s'] * 1000:>13.1f}{summary['best_s'] * 1000:>11.1f}{summary['git_calls'] or '-':>11}")
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('repo', {}).get('params') != repo_info['params']:
+            print("\nCảnh báo: baseline được đo trên repo với tham số khác, so sánh có thể không có ý nghĩa.")
+        if baseline.get('tracker_args', []) != args.tracker_arg:
+            print(f"\nCảnh báo: baseline chạy tracker với tham số {baseline.get('tracker_args', [])}, lần này là {args.tracker_arg}.")
+        results['comparison'] = compare_with_baseline(results, baseline, args.threshold, args.min_delta_ms / 1000)
+        print(f"\n{'so với baseline':<24}{'cũ (ms)':>10}{'mới (ms)':>10}{'tỉ lệ':>8}  kết luận")
+        for row in results['comparison']:
+            print(f"{row['name']:<24}{row['baseline_s'] * 1000:>10.1f}{row['current_s'] * 1000:>10.1f}"
+                  f"{row['ratio']:>8.2f}  {row['verdict']}")
+        if any(row['verdict'] == 'regression' for row in results['comparison']):
+            exit_code = 1
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nĐã ghi kết quả: {args.output}")
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Sinh một git repo monorepo TS tổng hợp, có thể tái lập theo seed, để benchmark git_tracker:
+nhiều package, thư mục lồng nhau, import chéo (tương đối và qua alias tsconfig), asset nhị phân.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Commit cố định tác giả/thời gian để OID của commit giống nhau giữa các lần sinh
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'bench', 'GIT_AUTHOR_EMAIL': 'bench@example.com',
+    'GIT_COMMITTER_NAME': 'bench', 'GIT_COMMITTER_EMAIL': 'bench@example.com',
+    'GIT_AUTHOR_DATE': '2024-01-01T00:00:00Z', 'GIT_COMMITTER_DATE': '2024-01-01T00:00:00Z',
+}
+# mtime của file sinh ra được lùi về quá khứ để không rơi vào cửa sổ "racy" của stat cache
+BACKDATE_SECONDS = 3600
+
+
+def run_git(root: Path, *args: str):
+    subprocess.run(['git', *args], cwd=root, check=True, capture_output=True, env={**os.environ, **GIT_ENV})
+
+
+def _import_specifier(importer: str, target: str, rng: random.Random, alias_ratio: float) -> str:
+    """Specifier để `importer` import `target` (bỏ extension): qua alias @pkgN/ hoặc đường dẫn tương đối."""
+    target_stem = os.path.splitext(target)[0]
+    parts = target_stem.split('/')
+    if rng.random() < alias_ratio:
+        return f"@{parts[1]}/{'/'.join(parts[3:])}" # packages/pkgN/src/... -> @pkgN/...
+    relative = os.path.relpath(target_stem, os.path.dirname(importer)).replace(os.sep, '/')
+    return relative if relative.startswith('.') else f"./{relative}"
+
+
+def _module_source(index: int, specifiers: List[str], lines: int) -> str:
+    out = [f"import {{ value as dep{i} }} from '{spec}';" for i, spec in enumerate(specifiers)]
+    out.append("")
+    out.append(f"// Module {index}: code sinh tự động cho benchmark")
+    deps_sum = ' + '.join(f"dep{i}" for i in range(len(specifiers))) or '0'
+    out.append(f"export const value = {index} + {deps_sum};")
+    for line_no in range(lines):
+        out.append(f"export function handler{index}_{line_no}(input: number): string {{ return `m{index}:${{input * {line_no}}}`; }}")
+    return '\n'.join(out) + '\n'
+
+
+def generate_monorepo(root: Path, files: int = 2000, depth: int = 4, fanout: int = 5, packages: int = 8,
+                      alias_ratio: float = 0.3, binary_ratio: float = 0.05, lines_per_file: int = 40,
+                      seed: int = 0) -> Dict[str, Any]:
+    """
+    Sinh repo tại `root` (phải chưa tồn tại hoặc rỗng) và commit toàn bộ. Trả về mô tả repo:
+    tham số sinh, file nên dùng làm đích --merge-deps (module bị import nhiều nhất), thư mục cho --merge-dir.
+    """
+    rng = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    run_git(root, 'init', '-q')
+
+    paths = {f"@pkg{p}/*": [f"packages/pkg{p}/src/*"] for p in range(packages)}
+    (root / 'tsconfig.json').write_text(
+        '{\n  // tsconfig gốc: alias cho từng package\n'
+        f'  "compilerOptions": {json.dumps({"baseUrl": ".", "strict": True, "paths": paths})}\n}}\n', encoding='utf-8')
+    (root / '.gitignore').write_text('node_modules/\ndist/\n')
+    (root / 'README.md').write_text('# Synthetic monorepo\n')
+    for p in range(packages):
+        package_dir = root / 'packages' / f'pkg{p}'
+        package_dir.mkdir(parents=True, exist_ok=True)
+        (package_dir / 'tsconfig.json').write_text('{ "extends": "../../tsconfig.json" }\n')
+        (package_dir / 'package.json').write_text(f'{{ "name": "@bench/pkg{p}", "version": "1.0.0" }}\n')
+
+    modules: List[str] = []
+    import_counts: Dict[str, int] = {}
+    kinds = ['ts'] * 14 + ['tsx'] * 3 + ['css', 'json', 'md']
+    for index in range(files):
+        package = rng.randrange(packages)
+        dirs = [f"dir{rng.randrange(4)}" for _ in range(rng.randint(0, max(0, depth - 1)))]
+        base = '/'.join(['packages', f'pkg{package}', 'src', *dirs])
+        if rng.random() < binary_ratio:
+            rel_path = f"{base}/asset{index}.png"
+            content = b'\x89PNG\r\n\x1a\n' + rng.randbytes(rng.randint(2048, 65536))
+            (root / rel_path).parent.mkdir(parents=True, exist_ok=True)
+            (root / rel_path).write_bytes(content)
+            continue
+        kind = rng.choice(kinds)
+        rel_path = f"{base}/mod{index}.{kind}"
+        full_path = root / rel_path
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        if kind in ('ts', 'tsx'):
+            targets = rng.sample(modules, min(fanout, len(modules))) if modules else []
+            for target in targets:
+                import_counts[target] = import_counts.get(target, 0) + 1
+            specifiers = [_import_specifier(rel_path, t, rng, alias_ratio) for t in targets]
+            full_path.write_text(_module_source(index, specifiers, lines_per_file), encoding='utf-8')
+            modules.append(rel_path)
+        elif kind == 'css':
+            full_path.write_text(''.join(f".c{index}-{i} {{ margin: {i}px; }}\n" for i in range(lines_per_file)))
+        elif kind == 'json':
+            full_path.write_text('{\n' + ',\n'.join(f'  "k{i}": {i}' for i in range(lines_per_file)) + '\n}\n')
+        else:
+            full_path.write_text(f"# Doc {index}\n\n" + 'Lorem ipsum dolor sit amet.\n' * lines_per_file)
+
+    # node_modules không được commit, nhưng có mặt như trong một checkout thật
+    node_modules = root / 'node_modules' / 'left-pad'
+    node_modules.mkdir(parents=True, exist_ok=True)
+    (node_modules / 'index.js').write_text('module.exports = (s) => s;\n')
+
+    backdate_tree(root)
+    run_git(root, 'add', '-A')
+    run_git(root, 'commit', '-q', '-m', 'synthetic monorepo')
+
+    most_imported = max(modules, key=lambda m: (import_counts.get(m, 0), m)) if modules else None
+    return {
+        'params': {'files': files, 'depth': depth, 'fanout': fanout, 'packages': packages, 'alias_ratio': alias_ratio,
+                   'binary_ratio': binary_ratio, 'lines_per_file': lines_per_file, 'seed': seed},
+        'modules': len(modules),
+        'deps_target': most_imported,
+        'dir_target': 'packages/pkg0',
+    }
+
+
+def backdate_tree(root: Path):
+    past = time.time() - BACKDATE_SECONDS
+    for dir_path, dir_names, file_names in os.walk(root):
+        if '.git' in dir_names:
+            dir_names.remove('.git')
+        for name in file_names:
+            os.utime(os.path.join(dir_path, name), (past, past))
+
+
+def small_commit(root: Path, rng: random.Random, modified: int = 3, message: str = 'small change') -> List[str]:
+    """Commit nhỏ điển hình: sửa vài module và thêm một module mới import một module có sẵn."""
+    tracked = subprocess.run(['git', 'ls-files', '-z', '*.ts'], cwd=root, check=True, capture_output=True, text=True)
+    modules = sorted(f for f in tracked.stdout.split('\0') if f)
+    changed = rng.sample(modules, min(modified, len(modules)))
+    for rel_path in changed:
+        with open(root / rel_path, 'a', encoding='utf-8') as f:
+            f.write(f"export const touched{rng.randrange(1 << 30)} = true;\n")
+    if modules:
+        target = rng.choice(modules)
+        new_path = f"{os.path.dirname(target)}/added{rng.randrange(1 << 30)}.ts"
+        specifier = './' + os.path.splitext(os.path.basename(target))[0]
+        (root / new_path).write_text(f"import {{ value }} from '{specifier}';\nexport const added = value;\n")
+        changed.append(new_path)
+    run_git(root, 'add', '-A')
+    run_git(root, 'commit', '-q', '-m', message)
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sinh monorepo TS tổng hợp (git repo) để benchmark git_tracker.')
+    parser.add_argument('root', type=Path, help='Thư mục đích (chưa tồn tại hoặc rỗng)')
+    parser.add_argument('--files', type=int, default=2000, help='Số file (mặc định: 2000)')
+    parser.add_argument('--depth', type=int, default=4, help='Độ sâu thư mục tối đa bên dưới src/ (mặc định: 4)')
+    parser.add_argument('--fanout', type=int, default=5, help='Số import mỗi module TS (mặc định: 5)')
+    parser.add_argument('--packages', type=int, default=8, help='Số package (mặc định: 8)')
+    parser.add_argument('--alias-ratio', type=float, default=0.3, help='Tỉ lệ import qua alias tsconfig (mặc định: 0.3)')
+    parser.add_argument('--binary-ratio', type=float, default=0.05, help='Tỉ lệ asset nhị phân (mặc định: 0.05)')
+    parser.add_argument('--lines-per-file', type=int, default=40, help='Số dòng code mỗi file (mặc định: 40)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    info = generate_monorepo(args.root, args.files, args.depth, args.fanout, args.packages, args.alias_ratio,
+                             args.binary_ratio, args.lines_per_file, args.seed)
+    print(f"Đã sinh {args.files} file ({info['modules']} module TS) tại {args.root}")
+
+
+if __name__ == '__main__':
+    main()
@@ -13,10 +13,24 @@ from datetime import datetime
 from typing import Dict, List, Set, Any # Added Any for errorDict typing
 import argparse
 import logging
-import fnmatch
 import sys
 import math # Di chuyển lên đầu file
 import re
+import stat
+import time
+import functools
+import mmap
+import sqlite3
+import codecs
+import errno
+import select
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+try:
+    import fcntl # Khóa file cho worker nền của hook (chỉ có trên Unix)
+except ImportError:
+    fcntl = None
 
 
 core_files = [
@@ -263,11 +277,2103 @@ fileList: List[str] = []
 
 # ============================================
 
+# ===== START: TS/JS IMPORT SCANNER =====
+# Scanner một lượt, thời gian tuyến tính: phần code không liên quan được bỏ qua bằng một lệnh
+# regex search (chạy trong C); chỉ từ các keyword import/export/require mới tokenize chi tiết.
+# Comment, chuỗi, template string và regex literal được nhận diện để không bắt nhầm import
+# nằm bên trong. Các regex dưới đây đều không backtrack (dạng "unrolled loop").
+# Chuỗi và comment được regex search "nuốt" trọn trong một lần gọi; '//' và '/*' không bao giờ mở đầu
+# một regex literal nên có thể khớp trước nhánh '/'. Comment khối chưa đóng rơi xuống nhánh '/'.
+_SCAN_SKIPPABLE = r"""'[^'\\\n]*(?:\\.[^'\\\n]*)*'?|"[^"\\\n]*(?:\\.[^"\\\n]*)*"?|//[^\n]*|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/"""
+_SCAN_INTERESTING = re.compile(_SCAN_SKIPPABLE + r"""|[`/]|\b(?:import|export|require)\b""")
+_SCAN_INTERESTING_IN_TEMPLATE = re.compile(_SCAN_SKIPPABLE + r"""|[`/{}]|\b(?:import|export|require)\b""")
+_SCAN_TOKEN = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<str>'[^'\\\n]*(?:\\.[^'\\\n]*)*'?|"[^"\\\n]*(?:\\.[^"\\\n]*)*"?)
+  | (?P<ident>[A-Za-z_$\u0080-\uffff][\w$\u0080-\uffff]*)
+  | (?P<num>\d[\w.]*)
+  | (?P<punct>.)
+""", re.VERBOSE | re.DOTALL)
+_TEMPLATE_CHUNK = re.compile(r'[^`\\$]*(?:(?:\\.|\$(?!\{))[^`\\$]*)*', re.DOTALL)
+_REGEX_LITERAL = re.compile(r'/[^/\\\[\n]*(?:(?:\\.|\[[^\]\\\n]*(?:\\.[^\]\\\n]*)*\]?)[^/\\\[\n]*)*/?[A-Za-z]*')
+# Sau các keyword này, dấu '/' mở đầu một regex literal chứ không phải phép chia
+_REGEX_PRECEDING_KEYWORDS = frozenset({
+    'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void', 'throw',
+    'case', 'do', 'else', 'yield', 'await',
+})
+_CLAUSE_PUNCT = frozenset({'{', '}', ',', '*'})
+
+
+def _slash_starts_regex(content: str, pos: int) -> bool:
+    """Dấu '/' tại pos mở đầu regex literal hay là phép chia, dựa vào ký tự có nghĩa đứng trước."""
+    j = pos - 1
+    while j >= 0 and content[j] in ' \t\r\n':
+        j -= 1
+    if j < 0:
+        return True
+    prev_char = content[j]
+    if prev_char.isalnum() or prev_char in '_$':
+        i = j
+        while i >= 0 and (content[i].isalnum() or content[i] in '_$'):
+            i -= 1
+        return content[i + 1:j + 1] in _REGEX_PRECEDING_KEYWORDS
+    return prev_char not in ')]}\'"`'
+
+
+def _scan_import_statement(content: str, pos: int, specifiers: Dict[str, None]) -> int:
+    """
+    Tokenize từ keyword import/export/require tại pos cho đến khi câu lệnh được nhận diện xong
+    hoặc gặp token không hợp lệ. Trả về vị trí bắt đầu của token đầu tiên không thuộc câu lệnh,
+    để vòng quét chính xử lý tiếp (token đó có thể là chuỗi, template, hoặc một keyword khác).
+    """
+    length = len(content)
+    match = _SCAN_TOKEN.match(content, pos)
+    state = match.group() # 'import' | 'export' | 'require'
+    pos = match.end()
+    pending: str | None = None # Specifier của import()/require() chờ dấu đóng ngoặc
+
+    while pos < length:
+        if content.startswith('//', pos):
+            end = content.find('\n', pos)
+            pos = length if end < 0 else end
+            continue
+        if content.startswith('/*', pos):
+            end = content.find('*/', pos + 2)
+            pos = length if end < 0 else end + 2
+            continue
+        if content[pos] in '/`':
+            return pos
+        match = _SCAN_TOKEN.match(content, pos)
+        kind = match.lastgroup
+        if kind == 'ws':
+            pos = match.end()
+            continue
+        value = match.group()
+        if kind == 'str':
+            # Chuỗi chưa đóng (bị ngắt dòng) không được coi là specifier
+            value = value[1:-1] if len(value) >= 2 and value[-1] == value[0] else ''
+
+        if state == 'import':
+            if kind == 'str':
+                if value: specifiers[value] = None
+                return match.end()
+            elif value == '(':
+                state = 'call'
+            elif kind == 'ident' or value in _CLAUSE_PUNCT:
+                state = 'clause'
+            else: # import.meta, ...
+                return pos
+        elif state == 'export':
+            if value not in ('{', '*', 'type'):
+                return pos
+            state = 'clause'
+        elif state == 'require':
+            if value != '(':
+                return pos
+            state = 'call'
+        elif state == 'call':
+            if kind != 'str':
+                return pos
+            pending, state = value, 'call_end'
+        elif state == 'call_end':
+            if value in (')', ',') and pending:
+                specifiers[pending] = None
+                return match.end()
+            return pos
+        elif state == 'clause':
+            if kind == 'ident' and value == 'from':
+                state = 'from'
+            elif not (kind == 'ident' or value in _CLAUSE_PUNCT):
+                return pos
+        elif state == 'from':
+            if kind == 'str':
+                if value: specifiers[value] = None
+                return match.end()
+            elif kind == 'ident' or value in _CLAUSE_PUNCT: # 'from' chỉ là tên binding
+                state = 'clause'
+            else:
+                return pos
+        pos = match.end()
+    return pos
+
+
+def extract_import_specifiers(content: str) -> List[str]:
+    """
+    Trả về các chuỗi import (specifier) thô trong mã nguồn, theo thứ tự xuất hiện, không trùng lặp.
+    Hỗ trợ `import x from 'a'`, `import 'a'`, `import('a')`, `export * from 'a'`,
+    `export { x } from 'a'` và `require('a')`; bỏ qua nội dung trong comment/chuỗi/template.
+    """
+    if 'import' not in content and 'require' not in content and 'export' not in content:
+        return []
+
+    specifiers: Dict[str, None] = {}
+    length = len(content)
+    pos = 0
+    template_depths: List[int] = [] # Số '{' đang mở bên trong mỗi ${...} lồng nhau
+
+    while pos < length:
+        pattern = _SCAN_INTERESTING_IN_TEMPLATE if template_depths else _SCAN_INTERESTING
+        match = pattern.search(content, pos)
+        if not match:
+            break
+        pos = match.start()
+        char = content[pos]
+
+        if char in '\'"' or (char == '/' and match.end() - pos > 1): # Chuỗi hoặc comment đã được khớp trọn
+            pos = match.end()
+        elif char == '/':
+            next_char = content[pos + 1:pos + 2]
+            if next_char == '/':
+                end = content.find('\n', pos)
+                pos = length if end < 0 else end
+            elif next_char == '*':
+                end = content.find('*/', pos + 2)
+                pos = length if end < 0 else end + 2
+            elif _slash_starts_regex(content, pos):
+                pos = _REGEX_LITERAL.match(content, pos).end()
+            else:
+                pos += 1
+        elif char == '`' or (char == '}' and template_depths[-1] == 0):
+            if char == '}':
+                template_depths.pop()
+            pos = _TEMPLATE_CHUNK.match(content, pos + 1).end()
+            if content.startswith('${', pos):
+                template_depths.append(0)
+                pos += 2
+            else:
+                pos += 1 # Dấu ` đóng template
+        elif char == '{':
+            template_depths[-1] += 1
+            pos += 1
+        elif char == '}':
+            template_depths[-1] -= 1
+            pos += 1
+        elif pos > 0 and content[pos - 1] in '.$': # foo.import(...), $require
+            pos = match.end()
+        else:
+            pos = _scan_import_statement(content, pos, specifiers)
+
+    return list(specifiers)
+# ===== END: TS/JS IMPORT SCANNER =====
+
+
+def scan_import_batch(project_path: str, files: List[str]) -> List[tuple[str, List[str]]]:
+    """
+    Worker cho ProcessPoolExecutor: đọc một lô file và trả về các bản ghi gọn (file, specifiers).
+    Việc resolve đường dẫn import được thực hiện tập trung ở tiến trình chính.
+    """
+    records = []
+    for file_path_str in files:
+        try:
+            with open(os.path.join(project_path, file_path_str), 'rb') as f:
+                raw = f.read()
+        except OSError:
+            records.append((file_path_str, []))
+            continue
+        try:
+            content = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            content = raw.decode('latin-1')
+        records.append((file_path_str, extract_import_specifiers(content)))
+    return records
+
+
+class ContentHasher:
+    """
+    Hash nội dung file theo từng chunk cố định (hoặc qua mmap với file lớn) để không phải
+    nạp cả file vào bộ nhớ. Nhiều file được hash song song trên thread pool vì hashlib
+    nhả GIL khi xử lý các buffer lớn.
+    """
+    SUPPORTED_ALGORITHMS = ('md5', 'sha1', 'sha256', 'blake2b', 'blake2s')
+    DEFAULT_CHUNK_SIZE = 1 << 20 # 1 MiB
+
+    def __init__(self, algorithm: str = 'md5', digest_size: int | None = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int | None = None):
+        if algorithm not in self.SUPPORTED_ALGORITHMS:
+            raise ValueError(f"Thuật toán hash không được hỗ trợ: {algorithm}")
+        if digest_size is not None:
+            max_digest_size = {'blake2b': hashlib.blake2b.MAX_DIGEST_SIZE, 'blake2s': hashlib.blake2s.MAX_DIGEST_SIZE}.get(algorithm)
+            if max_digest_size is None:
+                raise ValueError(f"Thuật toán '{algorithm}' không hỗ trợ tùy chọn digest size.")
+            if not 1 <= digest_size <= max_digest_size:
+                raise ValueError(f"Digest size của {algorithm} phải nằm trong khoảng 1..{max_digest_size} byte.")
+        self.algorithm = algorithm
+        self.digest_size = digest_size
+        self.chunk_size = max(4096, chunk_size)
+        # File lớn hơn ngưỡng này được hash qua mmap thay vì đọc từng chunk
+        self.mmap_threshold = self.chunk_size * 8
+        self.workers = workers if workers is not None else min(32, (os.cpu_count() or 1) + 4)
+        self.files_hashed = 0
+        self.bytes_hashed = 0
+
+    @property
+    def label(self) -> str:
+        """Nhãn mô tả thuật toán, ví dụ 'md5' hoặc 'blake2b-16'. Được ghi vào metadata."""
+        return f"{self.algorithm}-{self.digest_size}" if self.digest_size else self.algorithm
+
+    def _new_hasher(self):
+        if self.digest_size:
+            return hashlib.new(self.algorithm, digest_size=self.digest_size)
+        return hashlib.new(self.algorithm)
+
+    def hash_file(self, file_path: Path, git_blob: bool = False) -> str:
+        """
+        Hash một file theo từng chunk. Với git_blob=True, tính blob OID (SHA-1) giống `git hash-object`.
+        Ném OSError nếu không đọc được file.
+        """
+        digest, size = self._hash_file(file_path, git_blob)
+        self.files_hashed += 1
+        self.bytes_hashed += size
+        return digest
+
+    def _hash_file(self, file_path: Path, git_blob: bool) -> tuple[str, int]:
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if git_blob:
+                hasher = hashlib.sha1(f"blob {size}\0".encode())
+            else:
+                hasher = self._new_hasher()
+
+            if size >= self.mmap_threshold:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    hasher.update(mapped)
+            elif size <= self.chunk_size:
+                hasher.update(f.read())
+            else:
+                buffer = bytearray(self.chunk_size)
+                view = memoryview(buffer)
+                while True:
+                    read_count = f.readinto(buffer)
+                    if not read_count:
+                        break
+                    hasher.update(view[:read_count])
+        return hasher.hexdigest(), size
+
+    def hash_bytes(self, data: bytes, git_blob: bool = False) -> str:
+        """Hash một buffer đã có trong bộ nhớ, cùng định dạng với hash_file."""
+        hasher = hashlib.sha1(f"blob {len(data)}\0".encode()) if git_blob else self._new_hasher()
+        hasher.update(data)
+        self.files_hashed += 1
+        self.bytes_hashed += len(data)
+        return hasher.hexdigest()
+
+    def hash_files(self, file_paths: List[Path], git_blob: bool = False) -> Dict[Path, str | BaseException]:
+        """
+        Hash nhiều file, song song nếu có đủ việc cho thread pool.
+        Trả về dict path -> hash, hoặc path -> exception nếu file đó không hash được.
+        """
+        def hash_one(file_path: Path) -> tuple[str, int] | BaseException:
+            try:
+                return self._hash_file(file_path, git_blob)
+            except Exception as e:
+                return e
+
+        if self.workers <= 1 or len(file_paths) < 2 * self.workers:
+            outcomes = [hash_one(p) for p in file_paths]
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                outcomes = list(executor.map(hash_one, file_paths))
+        # Bộ đếm chỉ được cộng ở thread gọi, sau khi pool đã xong
+        results: Dict[Path, str | BaseException] = {}
+        for file_path, outcome in zip(file_paths, outcomes):
+            if isinstance(outcome, BaseException):
+                results[file_path] = outcome
+            else:
+                results[file_path] = outcome[0]
+                self.files_hashed += 1
+                self.bytes_hashed += outcome[1]
+        return results
+
+
+# Số byte đầu file dùng để đoán file nhị phân
+BINARY_SNIFF_SIZE = 8192
+# Byte điều khiển hiếm gặp trong file text (trừ \b, \t, \n, \f, \r, ESC)
+_BINARY_CONTROL_BYTES = bytes(b for b in range(32) if b not in (8, 9, 10, 12, 13, 27))
+
+
+def looks_binary(head: bytes) -> bool:
+    """
+    Đoán file nhị phân từ khối đầu: có byte NUL thì chắc chắn là nhị phân; nếu không phải UTF-8
+    hợp lệ thì coi là nhị phân khi hơn 10% số byte là ký tự điều khiển (Latin-1 text vẫn qua được).
+    """
+    if b'\0' in head:
+        return True
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return False
+    except UnicodeDecodeError:
+        pass
+    control_count = len(head) - len(head.translate(None, _BINARY_CONTROL_BYTES))
+    return control_count * 10 > len(head)
+
+
+def decode_text(raw: bytes) -> str:
+    """Decode UTF-8 (lỗi thì Latin-1) và chuẩn hóa newline về '\\n', giống khi đọc file ở text mode."""
+    try:
+        text = raw.decode('utf-8')
+    except UnicodeDecodeError:
+        text = raw.decode('latin-1')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+class AtomicOutputWriter:
+    """
+    Ghi output theo luồng vào một file tạm cạnh file đích, rồi công bố bằng `os.replace` khi
+    thoát context thành công. Nếu có lỗi giữa chừng, file tạm bị xóa và output cũ còn nguyên.
+    Dữ liệu không cần mã hóa lại (section cũ, file UTF-8 thuần) được copy trong kernel qua
+    `os.copy_file_range`/`os.sendfile`; phần còn lại đi qua một buffer cố định.
+    """
+    BUFFER_SIZE = 1 << 20 # 1 MiB
+    # File nhỏ hơn ngưỡng này được đọc/ghi qua buffer luôn, vì syscall copy không đáng công kiểm tra
+    ZERO_COPY_MIN_SIZE = 64 * 1024
+    _FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+    def __init__(self, target: Path):
+        self.target = Path(target)
+        self.tmp_path = self.target.with_name(f".{self.target.name}.{os.getpid()}.tmp")
+        self.position = 0 # Số byte đã ghi (kể cả phần còn trong buffer)
+        self.zero_copy_bytes = 0
+        self._fd: int | None = None
+        self._buffer = bytearray()
+        self._use_copy_file_range = hasattr(os, 'copy_file_range')
+        self._use_sendfile = hasattr(os, 'sendfile')
+
+    def __enter__(self) -> 'AtomicOutputWriter':
+        self.target.parent.mkdir(parents=True, exist_ok=True) # Thư mục output được tạo ở lần ghi đầu tiên
+        self._fd = os.open(self.tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        completed = False
+        try:
+            if exc_type is None:
+                self._flush()
+                completed = True
+        finally:
+            os.close(self._fd)
+            self._fd = None
+            if completed:
+                os.replace(self.tmp_path, self.target)
+            else:
+                self.tmp_path.unlink(missing_ok=True)
+        return False
+
+    def write_text(self, text: str):
+        self.write_bytes(text.encode('utf-8'))
+
+    def write_bytes(self, data: bytes):
+        self._buffer += data
+        self.position += len(data)
+        if len(self._buffer) >= self.BUFFER_SIZE:
+            self._flush()
+
+    def _flush(self):
+        written = 0
+        while written < len(self._buffer):
+            written += os.write(self._fd, self._buffer[written:] if written else self._buffer)
+        self._buffer.clear()
+
+    def truncate(self, position: int):
+        """Bỏ mọi thứ đã ghi sau `position` (dùng khi phải ghi lại một body với encoding khác)."""
+        self._flush()
+        os.ftruncate(self._fd, position)
+        os.lseek(self._fd, position, os.SEEK_SET)
+        self.position = position
+
+    def copy_range(self, src_fd: int, offset: int, length: int):
+        """Copy `length` byte từ `src_fd` (bắt đầu tại `offset`) vào output, ưu tiên copy trong kernel."""
+        self._flush()
+        end = offset + length
+        while offset < end:
+            copied = self._copy_chunk(src_fd, offset, min(end - offset, 1 << 30))
+            if not copied:
+                raise OSError(errno.EIO, f"File nguồn ngắn hơn dự kiến khi ghi {self.target.name}")
+            offset += copied
+            self.position += copied
+        self.zero_copy_bytes += length
+
+    def _copy_chunk(self, src_fd: int, offset: int, count: int) -> int:
+        # Các syscall ghi tại vị trí hiện tại của fd đích và tự dịch nó, nên vị trí fd luôn khớp self.position
+        if self._use_copy_file_range:
+            try:
+                return os.copy_file_range(src_fd, self._fd, count, offset)
+            except OSError as e:
+                if e.errno not in self._FALLBACK_ERRNOS:
+                    raise
+                self._use_copy_file_range = False
+        if self._use_sendfile:
+            try:
+                return os.sendfile(self._fd, src_fd, offset, count)
+            except OSError as e:
+                if e.errno not in self._FALLBACK_ERRNOS:
+                    raise
+                self._use_sendfile = False
+        data = os.pread(src_fd, min(count, self.BUFFER_SIZE), offset)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._fd, view):]
+        return len(data)
+
+    def write_file_text(self, src_fd: int, head: bytes = b'') -> int:
+        """
+        Ghi nội dung file nguồn `src_fd` dưới dạng text UTF-8, giống kết quả đọc ở text mode
+        (UTF-8, lỗi thì Latin-1; newline chuẩn hóa về '\\n'). `head` là phần đầu file đã đọc sẵn
+        (khi sniff). File nhỏ được đọc vào bộ nhớ một lần. File từ ZERO_COPY_MIN_SIZE trở lên được kiểm
+        tra UTF-8 và '\\r' theo từng chunk (không giữ chunk nào lại) rồi để kernel copy nguyên byte;
+        chỉ khi phải chuyển đổi mới đọc cả file vào bộ nhớ. Trả về số byte đã đọc từ file nguồn (kể cả
+        phần kernel copy). Caller chịu trách nhiệm giới hạn kích thước file.
+        """
+        bytes_read = len(head)
+        if os.fstat(src_fd).st_size >= self.ZERO_COPY_MIN_SIZE:
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            validated = 0
+            chunk = head
+            verbatim = True # UTF-8 hợp lệ và không có '\\r': byte trên đĩa trùng với output
+            while verbatim:
+                if not chunk:
+                    chunk = os.pread(src_fd, self.BUFFER_SIZE, validated)
+                    bytes_read += len(chunk)
+                    if not chunk:
+                        break
+                try:
+                    decoder.decode(chunk, final=False)
+                except UnicodeDecodeError:
+                    verbatim = False
+                verbatim = verbatim and b'\r' not in chunk
+                validated += len(chunk)
+                chunk = b''
+            if verbatim:
+                try:
+                    decoder.decode(b'', final=True)
+                except UnicodeDecodeError:
+                    verbatim = False
+            if verbatim:
+                # Để kernel copy thay vì encode rồi ghi lại
+                self.copy_range(src_fd, 0, validated)
+                return bytes_read + validated
+        data = bytearray(head)
+        while True:
+            chunk = os.pread(src_fd, self.BUFFER_SIZE, len(data))
+            if not chunk:
+                break
+            data += chunk
+        bytes_read += len(data) - len(head)
+        self.write_text(decode_text(bytes(data)))
+        return bytes_read
+
+
+# ===== START: CHANGE COLLECTOR =====
+class FileChange:
+    """
+    Một thay đổi file do git báo về trong một lần đọc duy nhất (`git diff --raw -z` hoặc
+    `git status --porcelain=v2 -z`).
+    status: 'added' | 'modified' | 'deleted' | 'renamed' | 'copied' | 'type_changed' | 'unmerged' | 'untracked'.
+    oid/old_oid: blob OID phía mới/cũ, None nếu git không biết (ví dụ file sửa trong working tree chưa add).
+    similarity: điểm giống nhau (0-100) của renamed/copied.
+    """
+    def __init__(self, status: str, path: str, old_path: str | None = None, oid: str | None = None,
+                 old_oid: str | None = None, similarity: int | None = None):
+        self.status = status
+        self.path = path
+        self.old_path = old_path
+        self.oid = oid
+        self.old_oid = old_oid
+        self.similarity = similarity
+
+    def __repr__(self) -> str:
+        if self.old_path:
+            return f"FileChange({self.status}: {self.old_path} -> {self.path})"
+        return f"FileChange({self.status}: {self.path})"
+
+
+_RAW_STATUS_NAMES = {'A': 'added', 'M': 'modified', 'D': 'deleted', 'R': 'renamed', 'C': 'copied',
+                     'T': 'type_changed', 'U': 'unmerged'}
+
+
+def _known_oid(oid: str) -> str | None:
+    """OID toàn số 0 nghĩa là git chưa có blob (nội dung working tree chưa được hash)."""
+    return oid if oid.strip('0') else None
+
+
+def parse_diff_raw(output: str) -> List[FileChange]:
+    """
+    Phân tích output của `git diff --raw -z --no-abbrev`: mỗi record là header
+    ':old_mode new_mode old_oid new_oid STATUS' rồi một đường dẫn (hai với rename/copy), ngăn bằng NUL.
+    """
+    tokens = output.split('\0')
+    changes: List[FileChange] = []
+    i = 0
+    while i < len(tokens):
+        header = tokens[i]
+        if not header.startswith(':'):
+            i += 1
+            continue
+        _, _, old_oid, new_oid, status = header[1:].split(' ', 4)
+        letter, score = status[0], status[1:]
+        if letter in 'RC':
+            old_path, path = tokens[i + 1], tokens[i + 2]
+            i += 3
+        else:
+            old_path, path = None, tokens[i + 1]
+            i += 2
+        changes.append(FileChange(_RAW_STATUS_NAMES.get(letter, 'modified'), path, old_path,
+                                  _known_oid(new_oid), _known_oid(old_oid), int(score) if score else None))
+    return changes
+
+
+def parse_status_v2(output: str, prefix: str = '') -> List[FileChange]:
+    """
+    Phân tích output của `git status --porcelain=v2 -z` (so với HEAD). Đường dẫn trong output tính từ
+    gốc repo: chỉ giữ các file nằm dưới `prefix` (thư mục dự án, dạng 'sub/dir/') và bỏ prefix đi.
+    """
+    tokens = output.split('\0')
+    changes: List[FileChange] = []
+    i = 0
+    while i < len(tokens):
+        record = tokens[i]
+        i += 1
+        kind = record[:1]
+        if kind == '1':
+            _, xy, _, _, _, _, head_oid, index_oid, path = record.split(' ', 8)
+            old_path, similarity = None, None
+            if 'D' in xy:
+                status = 'deleted'
+            elif xy[0] == 'A':
+                status = 'added'
+            elif 'T' in xy:
+                status = 'type_changed'
+            else:
+                status = 'modified'
+        elif kind == '2':
+            _, xy, _, _, _, _, head_oid, index_oid, score, path = record.split(' ', 9)
+            old_path = tokens[i]
+            i += 1
+            status = 'renamed' if score[0] == 'R' else 'copied'
+            similarity = int(score[1:])
+        elif kind == 'u':
+            path = record.split(' ', 10)[10]
+            xy, head_oid, index_oid, old_path, similarity, status = '..', '0', '0', None, None, 'unmerged'
+        elif kind == '?':
+            path = record[2:]
+            xy, head_oid, index_oid, old_path, similarity, status = '..', '0', '0', None, None, 'untracked'
+        else: # '#' header, '!' ignored, chuỗi rỗng cuối output
+            continue
+
+        if prefix:
+            if not path.startswith(prefix):
+                continue
+            path = path[len(prefix):]
+            if old_path is not None:
+                old_path = old_path[len(prefix):] if old_path.startswith(prefix) else None
+                if old_path is None and status == 'renamed':
+                    status = 'added' # Đổi tên từ ngoài dự án vào: với dự án đây là file mới
+        # OID index chỉ đúng với working tree khi phía worktree không có thay đổi (Y == '.')
+        oid = _known_oid(index_oid) if xy[1] == '.' and status != 'deleted' else None
+        changes.append(FileChange(status, path, old_path, oid, _known_oid(head_oid), similarity))
+    return changes
+# ===== END: CHANGE COLLECTOR =====
+
+
+# ===== START: CONTENT SOURCES =====
+def list_directory(directory: str) -> Dict[str, bool] | None:
+    """Liệt kê một thư mục trên đĩa: {tên: là thư mục}. None nếu không đọc được."""
+    try:
+        entries: Dict[str, bool] = {}
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir():
+                    entries[entry.name] = True
+                elif entry.is_file():
+                    entries[entry.name] = False
+        return entries
+    except OSError:
+        return None
+
+
+class WorktreeSource:
+    """Nguồn nội dung mặc định: đọc trực tiếp file trong working tree. Mọi đường dẫn là tuyệt đối."""
+    revision = None
+
+    def is_file(self, path: str) -> bool:
+        return os.path.isfile(path)
+
+    def read_bytes(self, path: str) -> bytes:
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def listing(self, directory: str) -> Dict[str, bool] | None:
+        return list_directory(directory)
+
+    def close(self):
+        pass
+
+
+class GitBlobReader:
+    """
+    Đọc blob qua một tiến trình `git cat-file --batch` sống suốt lần chạy: mỗi lần đọc chỉ ghi một OID
+    vào stdin và đọc lại header + nội dung, không tạo tiến trình mới cho từng file.
+    Tiến trình chỉ được tạo ở lần đọc đầu tiên.
+    """
+    def __init__(self, cwd: Path, on_spawn=None):
+        self.cwd = cwd
+        self._on_spawn = on_spawn # Callback khi tạo tiến trình (để đếm số tiến trình git)
+        self._process: subprocess.Popen | None = None
+        self.blobs_read = 0
+
+    def read(self, oid: str) -> bytes:
+        if self._process is None:
+            self._process = subprocess.Popen(['git', 'cat-file', '--batch'], cwd=self.cwd,
+                                             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                             env={**os.environ, 'GIT_OPTIONAL_LOCKS': '0'})
+            if self._on_spawn:
+                self._on_spawn()
+        try:
+            self._process.stdin.write(oid.encode('ascii') + b'\n')
+            self._process.stdin.flush()
+            header = self._process.stdout.readline()
+        except (BrokenPipeError, ValueError) as e:
+            raise OSError(f"git cat-file --batch đã dừng: {e}") from e
+        if not header:
+            raise OSError("git cat-file --batch đã dừng")
+        fields = header.split()
+        if len(fields) != 3: # '<oid> missing'
+            raise FileNotFoundError(errno.ENOENT, "Không tìm thấy object trong repo", oid)
+        data = self._process.stdout.read(int(fields[2]))
+        self._process.stdout.read(1) # '\n' kết thúc mỗi object
+        self.blobs_read += 1
+        return data
+
+    def close(self):
+        if self._process is not None:
+            self._process.stdin.close()
+            self._process.wait()
+            self._process.stdout.close()
+            self._process = None
+
+
+class GitTreeSource:
+    """
+    Nội dung dự án tại một revision mà không đụng tới working tree: danh sách file (kèm OID, kích thước)
+    lấy từ `git ls-tree -r -z -l`, nội dung đọc qua GitBlobReader. Listing thư mục cho resolver được
+    dựng từ chính cây đó. Đường dẫn ngoài dự án hoặc trong node_modules (không được commit) vẫn đọc
+    từ đĩa để resolve package và `extends` của tsconfig.
+    """
+    def __init__(self, project_path: Path, revision: str, commit: str, entries: Dict[str, tuple[str, int]],
+                 blob_reader: GitBlobReader):
+        self.project_path = str(project_path)
+        self.revision = revision
+        self.commit = commit
+        self.entries = entries # đường dẫn tương đối -> (blob OID, kích thước)
+        self.blob_reader = blob_reader
+        self._directories: Dict[str, Dict[str, bool]] = {'': {}} # thư mục tương đối -> {tên: là thư mục}
+        for path in entries:
+            parent = ''
+            for name in path.split('/')[:-1]:
+                self._directories[parent][name] = True
+                parent = f"{parent}/{name}" if parent else name
+                self._directories.setdefault(parent, {})
+            self._directories[parent][path.rsplit('/', 1)[-1]] = False
+
+    def _relative(self, path: str) -> str | None:
+        """Đường dẫn posix tương đối với dự án; None nếu đường dẫn phải được đọc từ đĩa."""
+        rel = os.path.relpath(path, self.project_path)
+        if rel == '.':
+            return ''
+        parts = rel.split(os.sep)
+        if parts[0] == '..' or 'node_modules' in parts:
+            return None
+        return '/'.join(parts)
+
+    def is_file(self, path: str) -> bool:
+        rel = self._relative(path)
+        return os.path.isfile(path) if rel is None else rel in self.entries
+
+    def size(self, path: str) -> int | None:
+        entry = self.entries.get(self._relative(path))
+        return entry[1] if entry else None
+
+    def read_bytes(self, path: str) -> bytes:
+        rel = self._relative(path)
+        if rel is None:
+            with open(path, 'rb') as f:
+                return f.read()
+        entry = self.entries.get(rel)
+        if entry is None:
+            raise FileNotFoundError(errno.ENOENT, f"Không có trong {self.revision}", path)
+        return self.blob_reader.read(entry[0])
+
+    def listing(self, directory: str) -> Dict[str, bool] | None:
+        rel = self._relative(directory)
+        return list_directory(directory) if rel is None else self._directories.get(rel)
+
+    def close(self):
+        self.blob_reader.close()
+# ===== END: CONTENT SOURCES =====
+
+
+class RepoSnapshot:
+    """
+    Ảnh chụp danh sách file tracked cho một lần chạy, dựng từ một lệnh `git ls-files -s -z` duy nhất.
+    Mọi bước trong cùng lần chạy (consolidate, cấu trúc, thống kê, hash) dùng chung snapshot này
+    thay vì gọi lại git. Thông tin stat được lấy lười và cache theo từng file.
+    Với `--at <rev>`, snapshot được dựng từ cây của revision (`source` là GitTreeSource) và mọi nội dung
+    được đọc qua source thay vì từ đĩa.
+    """
+    def __init__(self, project_path: Path, files: List[str], object_ids: Dict[str, str],
+                 classify, complete: bool = True, source: WorktreeSource | GitTreeSource | None = None,
+                 on_stat=None):
+        self.project_path = project_path
+        self.files = files # Đã lọc theo ignore patterns, giữ thứ tự của git
+        self.object_ids = object_ids # path -> blob OID trong index (stage 0) hoặc trong cây của revision
+        self.complete = complete # False nếu không đọc được từ git
+        self.source = source or WorktreeSource()
+        self._classify = classify
+        self._files_by_type: Dict[str, List[str]] | None = None
+        self._stats: Dict[str, os.stat_result | None] = {}
+        self._on_stat = on_stat # Callback cho mỗi lần gọi os.stat thật (để đếm)
+
+    @property
+    def files_by_type(self) -> Dict[str, List[str]]:
+        if self._files_by_type is None:
+            self._files_by_type = {}
+            for file_path_str in self.files:
+                self._files_by_type.setdefault(self._classify(file_path_str), []).append(file_path_str)
+        return self._files_by_type
+
+    def stat(self, file_path_str: str) -> os.stat_result | None:
+        """stat() của file tracked (theo symlink), cache trong suốt lần chạy. None nếu không stat được."""
+        if file_path_str not in self._stats:
+            if self._on_stat:
+                self._on_stat()
+            try:
+                self._stats[file_path_str] = os.stat(self.project_path / file_path_str)
+            except OSError:
+                self._stats[file_path_str] = None
+        return self._stats[file_path_str]
+
+    def size(self, file_path_str: str) -> int | None:
+        """Kích thước file (0 với thứ không phải file thường), None nếu không tồn tại."""
+        if self.source.revision is not None:
+            return self.source.size(str(self.project_path / file_path_str))
+        file_stat = self.stat(file_path_str)
+        if file_stat is None:
+            return None
+        return file_stat.st_size if stat.S_ISREG(file_stat.st_mode) else 0
+
+    def is_file(self, file_path_str: str) -> bool:
+        if self.source.revision is not None:
+            return self.source.is_file(str(self.project_path / file_path_str))
+        file_stat = self.stat(file_path_str)
+        return file_stat is not None and stat.S_ISREG(file_stat.st_mode)
+
+    def invalidate_stats(self, files: List[str] | None = None):
+        """Bỏ cache stat (toàn bộ hoặc của một số file) khi biết file đã thay đổi."""
+        if files is None:
+            self._stats.clear()
+        else:
+            for file_path_str in files:
+                self._stats.pop(file_path_str, None)
+
+    def inherit_stats(self, previous: 'RepoSnapshot'):
+        """Nhận lại cache stat của snapshot cũ (chế độ watch), cho các file vẫn còn tracked."""
+        for file_path_str, file_stat in previous._stats.items():
+            self._stats.setdefault(file_path_str, file_stat)
+
+
+class ImportGraphIndex:
+    """
+    Chỉ mục import graph lưu trên đĩa: mỗi file script có hash nội dung, danh sách specifier thô
+    và các file (đường dẫn tương đối) mà nó import; kèm reverse map file -> các file import nó.
+    Được cập nhật tăng dần theo file thay đổi nên việc tìm dependencies/usages chỉ là đọc index.
+    Mỗi node còn giữ các khóa đường dẫn mà specifier chưa resolve được của nó đang chờ (xem
+    ModuleResolver.unresolved_keys), để khi có file mới chỉ những file chờ đúng đường dẫn đó bị resolve lại.
+    """
+    VERSION = 2
+
+    def __init__(self, index_file: Path, hash_algorithm: str):
+        self.index_file = index_file
+        self.hash_algorithm = hash_algorithm
+        self.nodes: Dict[str, Dict[str, Any]] = {} # path -> {'hash', 'specifiers', 'imports', 'unresolved'}
+        self.reverse: Dict[str, Set[str]] = {} # path -> các file import nó
+        self.waiting: Dict[str, Set[str]] = {} # khóa đường dẫn -> các file có specifier chưa resolve chờ nó
+        self.dirty = False
+
+    @classmethod
+    def load(cls, index_file: Path, hash_algorithm: str) -> 'ImportGraphIndex':
+        """Đọc index từ đĩa; trả về index rỗng nếu chưa có, hỏng, hoặc khác version/thuật toán hash."""
+        graph = cls(index_file, hash_algorithm)
+        try:
+            with open(index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return graph
+        if data.get('version') != cls.VERSION or data.get('hash_algorithm') != hash_algorithm:
+            return graph
+        graph.nodes = data.get('files', {})
+        graph.reverse = {path: set(importers) for path, importers in data.get('reverse', {}).items()}
+        for path, node in graph.nodes.items():
+            for key in node['unresolved']:
+                graph.waiting.setdefault(key, set()).add(path)
+        return graph
+
+    def save(self):
+        data = {
+            'version': self.VERSION,
+            'hash_algorithm': self.hash_algorithm,
+            'files': self.nodes,
+            'reverse': {path: sorted(importers) for path, importers in sorted(self.reverse.items())},
+        }
+        tmp_file = self.index_file.with_name(self.index_file.name + '.tmp')
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_file, self.index_file)
+        self.dirty = False
+
+    def set_file(self, path: str, content_hash: str, specifiers: List[str], imports: List[str],
+                 unresolved: List[str]):
+        """Thêm/cập nhật node của một file và cập nhật các cạnh ngược tương ứng."""
+        self._unlink_imports(path)
+        self.nodes[path] = {'hash': content_hash, 'specifiers': specifiers, 'imports': imports,
+                            'unresolved': unresolved}
+        for imported in imports:
+            self.reverse.setdefault(imported, set()).add(path)
+        for key in unresolved:
+            self.waiting.setdefault(key, set()).add(path)
+        self.dirty = True
+
+    def set_imports(self, path: str, imports: List[str], unresolved: List[str]):
+        """Thay danh sách import đã resolve của một node mà không đổi hash/specifier."""
+        node = self.nodes[path]
+        if node['imports'] != imports or node['unresolved'] != unresolved:
+            self.set_file(path, node['hash'], node['specifiers'], imports, unresolved)
+
+    def rename_file(self, old_path: str, new_path: str) -> Set[str]:
+        """
+        Chuyển node sang đường dẫn mới, giữ hash và specifier (không cần đọc lại file). Các import
+        đã resolve bị xóa vì specifier tương đối phải được resolve lại từ vị trí mới.
+        Trả về các file từng import đường dẫn cũ (cần resolve lại).
+        """
+        node = self.nodes[old_path]
+        importers = self.usages_of(old_path)
+        self.remove_file(old_path)
+        self.nodes[new_path] = {'hash': node['hash'], 'specifiers': node['specifiers'], 'imports': [],
+                                'unresolved': []}
+        self.dirty = True
+        return importers
+
+    def remove_file(self, path: str):
+        if path in self.nodes:
+            self._unlink_imports(path)
+            del self.nodes[path]
+            self.dirty = True
+
+    def _unlink_imports(self, path: str):
+        node = self.nodes.get(path)
+        if not node:
+            return
+        for imported in node['imports']:
+            importers = self.reverse.get(imported)
+            if importers:
+                importers.discard(path)
+                if not importers:
+                    del self.reverse[imported]
+        for key in node['unresolved']:
+            waiters = self.waiting.get(key)
+            if waiters:
+                waiters.discard(path)
+                if not waiters:
+                    del self.waiting[key]
+
+    def dependencies_of(self, path: str) -> List[str]:
+        node = self.nodes.get(path)
+        return list(node['imports']) if node else []
+
+    def usages_of(self, path: str) -> Set[str]:
+        return set(self.reverse.get(path, ()))
+
+    def affected_by(self, paths: List[str], max_depth: int | None = None) -> tuple[Dict[str, int], Dict[str, str]]:
+        """
+        BFS theo cạnh ngược từ các file đã thay đổi: trả về (path -> độ sâu, path -> file nó import
+        trên đường đi ngắn nhất). Độ sâu 0 là chính các file thay đổi; chỉ phần graph bị ảnh hưởng
+        được duyệt. max_depth giới hạn số bước (None: đến hết).
+        """
+        depths = {path: 0 for path in paths}
+        via: Dict[str, str] = {}
+        frontier = list(depths)
+        depth = 0
+        while frontier and (max_depth is None or depth < max_depth):
+            depth += 1
+            next_frontier = []
+            for path in frontier:
+                for importer in sorted(self.reverse.get(path, ())):
+                    if importer not in depths:
+                        depths[importer] = depth
+                        via[importer] = path
+                        next_frontier.append(importer)
+            frontier = next_frontier
+        return depths, via
+
+    def files_waiting_for(self, keys: List[str]) -> Set[str]:
+        """Các file có specifier chưa resolve được mà một file mới khớp một trong các khóa có thể làm resolve được."""
+        return {path for key in keys for path in self.waiting.get(key, ())}
+
+
+# ===== START: METADATA STORES =====
+class JsonMetadataStore:
+    """Lưu metadata thành một file JSON duy nhất (định dạng gốc của tracker)."""
+    backend = 'json'
+
+    def __init__(self, path: Path, logger: logging.Logger):
+        self.path = path
+        self.logger = logger
+
+    def load(self) -> Dict[str, Any] | None:
+        if not self.path.exists():
+            return None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            self.logger.error(f"Error decoding JSON from {self.path}. Initializing new metadata.")
+            return None
+
+    def save(self, metadata: Dict[str, Any]):
+        with AtomicOutputWriter(self.path) as writer:
+            writer.write_text(json.dumps(metadata, indent=2, ensure_ascii=False))
+
+    def save_file_costs(self, file_costs: Dict[str, List], version: int, replace: bool = False):
+        """
+        Chỉ cập nhật ước lượng kích thước/token (khóa file_costs) và phiên bản cách đếm của metadata đã lưu,
+        giữ nguyên phần còn lại. replace=True bỏ các ước lượng cũ (đếm theo phiên bản khác).
+        """
+        metadata = self.load()
+        if metadata is None:
+            return
+        if replace:
+            metadata['file_costs'] = {}
+        metadata.setdefault('file_costs', {}).update(file_costs)
+        metadata['file_costs_version'] = version
+        self.save(metadata)
+
+    def record_run(self, run: Dict[str, Any]):
+        pass # Bản JSON không lưu lịch sử chạy
+
+    def last_run(self) -> Dict[str, Any] | None:
+        return None
+
+    def close(self):
+        pass
+
+
+class SqliteMetadataStore:
+    """
+    Lưu metadata trong SQLite (chế độ WAL): mỗi file một dòng (loại, hash, stat), các giá trị đơn lẻ
+    trong bảng kv, và lịch sử các lần chạy. Khi lưu, chỉ những dòng khác với lần load/lưu trước mới
+    được ghi, trong một transaction, nên một file thay đổi chỉ tốn một lần UPSERT.
+    """
+    backend = 'sqlite'
+    SCHEMA_VERSION = 2
+    # Các khóa metadata được lưu theo từng file thay vì trong kv
+    FILE_KEYS = ('tracked_files', 'file_hashes', 'file_stats', 'file_costs')
+    # Cột thêm ở schema 2: ước lượng kích thước/token của section (file_costs) kèm hash lúc đo
+    COST_COLUMNS = (('cost_hash', 'TEXT'), ('cost_bytes', 'INTEGER'), ('cost_tokens', 'INTEGER'))
+
+    def __init__(self, path: Path, logger: logging.Logger):
+        self.path = path
+        self.logger = logger
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.executescript('''
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    type TEXT,
+                    hash TEXT,
+                    size INTEGER,
+                    mtime_ns INTEGER,
+                    ino INTEGER,
+                    ctime_ns INTEGER,
+                    cost_hash TEXT,
+                    cost_bytes INTEGER,
+                    cost_tokens INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS kv (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    started_at TEXT NOT NULL,
+                    command TEXT,
+                    commit_hash TEXT,
+                    duration_s REAL,
+                    git_calls INTEGER,
+                    files_tracked INTEGER
+                );
+            ''')
+            existing_columns = {row[1] for row in self.conn.execute('PRAGMA table_info(files)')}
+            for column, column_type in self.COST_COLUMNS:
+                if column not in existing_columns: # DB tạo từ schema 1
+                    self.conn.execute(f'ALTER TABLE files ADD COLUMN {column} {column_type}')
+            stored_version = self.conn.execute("SELECT value FROM kv WHERE key = 'schema_version'").fetchone()
+            if stored_version is None or json.loads(stored_version[0]) != self.SCHEMA_VERSION:
+                self.conn.execute('INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)',
+                                  ('schema_version', json.dumps(self.SCHEMA_VERSION)))
+        self._rows: Dict[str, tuple] = {} # Dòng `files` như trong DB, để chỉ ghi phần khác biệt
+        self._kv: Dict[str, str] = {}
+
+    def is_empty(self) -> bool:
+        return self.conn.execute("SELECT NOT EXISTS (SELECT 1 FROM kv WHERE key = 'created')").fetchone()[0] == 1
+
+    def load(self) -> Dict[str, Any] | None:
+        try:
+            self._kv = dict(self.conn.execute('SELECT key, value FROM kv'))
+            self._rows = {row[0]: row[1:] for row in self.conn.execute(
+                'SELECT path, type, hash, size, mtime_ns, ino, ctime_ns, cost_hash, cost_bytes, cost_tokens FROM files')}
+        except sqlite3.DatabaseError as e:
+            self.logger.error(f"Không đọc được metadata từ {self.path}: {e}. Initializing new metadata.")
+            return None
+        if 'created' not in self._kv:
+            return None
+        metadata: Dict[str, Any] = {key: json.loads(value) for key, value in self._kv.items() if key != 'schema_version'}
+        tracked_files: Dict[str, List[str]] = {}
+        file_hashes: Dict[str, str] = {}
+        file_stats: Dict[str, List[int]] = {}
+        file_costs: Dict[str, List] = {}
+        for path, (file_type, file_hash, size, mtime_ns, ino, ctime_ns, *cost) in sorted(self._rows.items()):
+            if file_type is not None:
+                tracked_files.setdefault(file_type, []).append(path)
+            if file_hash is not None:
+                file_hashes[path] = file_hash
+            if size is not None:
+                file_stats[path] = [size, mtime_ns, ino, ctime_ns]
+            if cost[0] is not None:
+                file_costs[path] = cost
+        metadata.update(tracked_files=tracked_files, file_hashes=file_hashes, file_stats=file_stats, file_costs=file_costs)
+        return metadata
+
+    def save(self, metadata: Dict[str, Any]):
+        rows: Dict[str, tuple] = {}
+        file_hashes = metadata.get('file_hashes', {})
+        file_stats = metadata.get('file_stats', {})
+        file_costs = metadata.get('file_costs', {})
+        file_types = {path: file_type for file_type, paths in metadata.get('tracked_files', {}).items() for path in paths}
+        for path in file_types.keys() | file_hashes.keys() | file_stats.keys():
+            signature = file_stats.get(path) or [None] * 4
+            cost = file_costs.get(path) or [None] * 3
+            rows[path] = (file_types.get(path), file_hashes.get(path), *signature, *cost)
+        kv = {key: json.dumps(value, ensure_ascii=False) for key, value in metadata.items() if key not in self.FILE_KEYS}
+
+        changed_rows = [(path, *row) for path, row in rows.items() if self._rows.get(path) != row]
+        deleted_paths = [(path,) for path in self._rows.keys() - rows.keys()]
+        changed_kv = [(key, value) for key, value in kv.items() if self._kv.get(key) != value]
+        deleted_kv = [(key,) for key in self._kv.keys() - kv.keys() - {'schema_version'}]
+        with self.conn: # Một transaction cho toàn bộ thay đổi
+            self.conn.executemany(
+                'INSERT INTO files (path, type, hash, size, mtime_ns, ino, ctime_ns, cost_hash, cost_bytes, cost_tokens) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(path) DO UPDATE SET type = excluded.type, hash = excluded.hash, size = excluded.size, '
+                'mtime_ns = excluded.mtime_ns, ino = excluded.ino, ctime_ns = excluded.ctime_ns, '
+                'cost_hash = excluded.cost_hash, cost_bytes = excluded.cost_bytes, cost_tokens = excluded.cost_tokens', changed_rows)
+            self.conn.executemany('DELETE FROM files WHERE path = ?', deleted_paths)
+            self.conn.executemany('INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)', changed_kv)
+            self.conn.executemany('DELETE FROM kv WHERE key = ?', deleted_kv)
+        self._rows = rows
+        self._kv = {key: value for key, value in self._kv.items() if key == 'schema_version'}
+        self._kv.update(kv)
+        self.logger.debug(f"Metadata (sqlite): {len(changed_rows)} dòng ghi, {len(deleted_paths)} dòng xóa, "
+                          f"{len(changed_kv)} khóa đổi, {len(deleted_kv)} khóa xóa.")
+
+    def save_file_costs(self, file_costs: Dict[str, List], version: int, replace: bool = False):
+        """
+        Chỉ ghi các cột ước lượng (thêm dòng nếu file chưa có) và phiên bản cách đếm, không đụng đến phần
+        metadata còn lại. replace=True xóa trước các ước lượng cũ (đếm theo phiên bản khác).
+        """
+        version_value = json.dumps(version)
+        with self.conn:
+            if replace:
+                self.conn.execute('UPDATE files SET cost_hash = NULL, cost_bytes = NULL, cost_tokens = NULL')
+                self._rows = {path: (*row[:6], None, None, None) for path, row in self._rows.items()}
+            self.conn.execute('INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)', ('file_costs_version', version_value))
+            self.conn.executemany(
+                'INSERT INTO files (path, cost_hash, cost_bytes, cost_tokens) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(path) DO UPDATE SET cost_hash = excluded.cost_hash, cost_bytes = excluded.cost_bytes, '
+                'cost_tokens = excluded.cost_tokens', [(path, *cost) for path, cost in file_costs.items()])
+        for path, cost in file_costs.items():
+            self._rows[path] = (*(self._rows.get(path) or (None,) * 6)[:6], *cost)
+        self._kv['file_costs_version'] = version_value
+
+    def record_run(self, run: Dict[str, Any]):
+        with self.conn:
+            self.conn.execute(
+                'INSERT INTO runs (started_at, command, commit_hash, duration_s, git_calls, files_tracked) VALUES (?, ?, ?, ?, ?, ?)',
+                (run.get('started_at'), run.get('command'), run.get('commit'), run.get('duration_s'),
+                 run.get('git_calls'), run.get('files_tracked')))
+
+    def last_run(self) -> Dict[str, Any] | None:
+        row = self.conn.execute(
+            'SELECT started_at, command, commit_hash, duration_s, git_calls, files_tracked FROM runs ORDER BY id DESC LIMIT 1').fetchone()
+        if row is None:
+            return None
+        return dict(zip(('started_at', 'command', 'commit', 'duration_s', 'git_calls', 'files_tracked'), row))
+
+    def close(self):
+        self.conn.close()
+# ===== END: METADATA STORES =====
+
+
+# ===== START: BLOB CACHE =====
+# Token thô để ước lượng kích thước ngữ cảnh: một từ (chữ/số/_) hoặc một chuỗi cùng một ký tự dấu câu
+# (đường kẻ '=====' hay '-----' là vài token với tokenizer thật, không phải mỗi ký tự một token)
+_TOKEN_REGEX = re.compile(r'\w+|([^\w\s])\1*')
+# Tăng khi count_tokens đổi cách đếm: ước lượng đã lưu (metadata file_costs, blob cache) được đo lại
+TOKEN_ESTIMATE_VERSION = 2
+
+
+def count_tokens(text: str) -> int:
+    return sum(1 for _ in _TOKEN_REGEX.finditer(text))
+
+
+class BlobInfo:
+    """
+    Những gì tracker cần từ nội dung một blob: kích thước gốc, cờ nhị phân, text đã decode
+    (như được ghi vào output), specifier import (None nếu chưa tính) và số dòng/token.
+    """
+    def __init__(self, size: int, binary: bool, text: str | None, imports: List[str] | None, lines: int, tokens: int):
+        self.size = size
+        self.binary = binary
+        self.text = text
+        self.imports = imports
+        self.lines = lines
+        self.tokens = tokens
+
+    @classmethod
+    def from_bytes(cls, data: bytes, with_imports: bool = False) -> 'BlobInfo':
+        if looks_binary(data[:BINARY_SNIFF_SIZE]):
+            return cls(len(data), True, None, [] if with_imports else None, 0, 0)
+        text = decode_text(data)
+        lines = text.count('\n') + (1 if text and not text.endswith('\n') else 0)
+        return cls(len(data), False, text, extract_import_specifiers(text) if with_imports else None,
+                   lines, count_tokens(text))
+
+
+class BlobCache:
+    """
+    Cache theo địa chỉ nội dung, dùng chung giữa các branch, `git worktree` và các tracker: khóa là
+    nhãn thuật toán hash + hash nội dung, giá trị là BlobInfo. Lưu trong một SQLite (WAL) ở thư mục
+    cấu hình được. Entry mới và thời điểm dùng được gom trong bộ nhớ rồi ghi trong một transaction ngắn
+    (flush), để nhiều tracker chạy song song không giữ khóa ghi lâu. Khi tổng dung lượng vượt ngân sách,
+    các entry lâu không dùng nhất bị xóa trước (LRU) cho đến khi còn khoảng 90% ngân sách.
+    """
+    SCHEMA_VERSION = 2 # 2: số token đếm theo TOKEN_ESTIMATE_VERSION 2
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+    FLUSH_PENDING_BYTES = 32 * 1024 * 1024 # Ghi xuống sớm khi entry chờ ghi chiếm quá nhiều bộ nhớ
+    ENTRY_OVERHEAD_BYTES = 128 # Ước lượng chi phí lưu trữ của khóa và các cột số
+
+    def __init__(self, directory: Path, logger: logging.Logger, max_bytes: int | None = None):
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / 'blobs.db'
+        self.logger = logger
+        self.max_bytes = max_bytes or self.DEFAULT_MAX_BYTES
+        self.conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.execute('BEGIN')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS blobs (key TEXT PRIMARY KEY, size INTEGER, binary INTEGER, '
+                              'text TEXT, imports TEXT, lines INTEGER, tokens INTEGER, stored_bytes INTEGER, '
+                              'last_used INTEGER)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used)')
+            if self.conn.execute('PRAGMA user_version').fetchone()[0] != self.SCHEMA_VERSION:
+                self.conn.execute('DELETE FROM blobs')
+                self.conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+        self._pending: Dict[str, BlobInfo] = {} # Entry mới (hoặc vừa thêm imports) chưa ghi xuống
+        self._pending_bytes = 0
+        self._used: Set[str] = set() # Khóa được đọc trúng, chờ cập nhật last_used
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+
+    @staticmethod
+    def _stored_bytes(info: BlobInfo) -> int:
+        text_bytes = len(info.text.encode('utf-8')) if info.text else 0
+        imports_bytes = sum(len(i) + 4 for i in info.imports) if info.imports else 0
+        return text_bytes + imports_bytes + BlobCache.ENTRY_OVERHEAD_BYTES
+
+    def get(self, key: str) -> BlobInfo | None:
+        info = self._pending.get(key)
+        if info is None:
+            row = self.conn.execute('SELECT size, binary, text, imports, lines, tokens FROM blobs WHERE key = ?',
+                                    (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            size, binary, text, imports, lines, tokens = row
+            info = BlobInfo(size, bool(binary), text, json.loads(imports) if imports is not None else None, lines, tokens)
+            self._used.add(key)
+        self.hits += 1
+        return info
+
+    def put(self, key: str, info: BlobInfo):
+        """Thêm (hoặc cập nhật, ví dụ khi vừa tính thêm imports) một entry; được ghi ở lần flush tiếp theo."""
+        self._pending_bytes += self._stored_bytes(info)
+        self._pending[key] = info
+        if self._pending_bytes >= self.FLUSH_PENDING_BYTES:
+            self.flush()
+
+    def flush(self):
+        """Ghi entry mới và thời điểm dùng trong một transaction, rồi dọn LRU nếu vượt ngân sách."""
+        if not self._pending and not self._used:
+            return
+        now = time.time_ns()
+        rows = [(key, info.size, int(info.binary), info.text,
+                 json.dumps(info.imports, ensure_ascii=False) if info.imports is not None else None,
+                 info.lines, info.tokens, self._stored_bytes(info), now)
+                for key, info in self._pending.items()]
+        try:
+            with self.conn:
+                self.conn.execute('BEGIN IMMEDIATE')
+                self.conn.executemany('INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                self.conn.executemany('UPDATE blobs SET last_used = ? WHERE key = ?',
+                                      [(now, key) for key in self._used.difference(self._pending)])
+                self._evict()
+        except sqlite3.Error as e:
+            self.logger.warning(f"Không ghi được blob cache {self.path}: {e}")
+        self.stored += len(rows)
+        self._pending.clear()
+        self._pending_bytes = 0
+        self._used.clear()
+
+    def _evict(self):
+        total = self.conn.execute('SELECT COALESCE(SUM(stored_bytes), 0) FROM blobs').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * 9 // 10
+        victims: List[tuple[str]] = []
+        for key, stored_bytes in self.conn.execute('SELECT key, stored_bytes FROM blobs ORDER BY last_used'):
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= stored_bytes
+        self.conn.executemany('DELETE FROM blobs WHERE key = ?', victims)
+        self.evicted += len(victims)
+
+    def summary(self) -> str:
+        return (f"Blob cache: {self.hits} hit, {self.misses} miss, {self.stored} entry được ghi, "
+                f"{self.evicted} entry bị dọn (LRU), ngân sách {self.max_bytes / 1024:.0f} KiB ({self.path}).")
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+# ===== END: BLOB CACHE =====
+
+
+class TsconfigInfo:
+    """
+    tsconfig đã được parse và gộp theo chuỗi `extends`. Các alias trong `paths` được biên dịch
+    sẵn thành (prefix, suffix) và sắp theo độ cụ thể giống TypeScript: khớp chính xác trước,
+    sau đó đến pattern có prefix dài hơn.
+    """
+    def __init__(self, path: Path, data: Dict[str, Any], compiler_options: Dict[str, Any], option_dirs: Dict[str, str]):
+        self.path = path
+        self.data = data # Nội dung file (đã gộp compilerOptions từ các config được extends)
+        self.option_dirs = option_dirs # option -> thư mục của config khai báo nó
+        self.base_url: str | None = None
+        if 'baseUrl' in compiler_options:
+            self.base_url = os.path.normpath(os.path.join(option_dirs['baseUrl'], compiler_options['baseUrl']))
+        # Không có baseUrl: các đường dẫn trong `paths` tương đối với config khai báo `paths`
+        paths_base = self.base_url or option_dirs.get('paths', str(path.parent))
+
+        self.alias_matchers: List[tuple[str, str, bool, List[str]]] = []
+        for alias, real_paths in (compiler_options.get('paths') or {}).items():
+            prefix, star, suffix = alias.partition('*')
+            targets = [os.path.join(paths_base, real_path) for real_path in real_paths if isinstance(real_path, str)]
+            self.alias_matchers.append((prefix, suffix, bool(star), targets))
+        self.alias_matchers.sort(key=lambda m: (m[2], -len(m[0])))
+
+    def alias_candidates(self, import_str: str):
+        """Sinh các đường dẫn ứng viên (chưa thêm extension) cho import_str theo các alias khớp."""
+        for prefix, suffix, has_wildcard, targets in self.alias_matchers:
+            if has_wildcard:
+                if (len(import_str) < len(prefix) + len(suffix) or not import_str.startswith(prefix)
+                        or not import_str.endswith(suffix)):
+                    continue
+                captured_part = import_str[len(prefix):len(import_str) - len(suffix)]
+            elif import_str != prefix:
+                continue
+            else:
+                captured_part = ''
+            for target in targets:
+                yield os.path.normpath(target.replace('*', captured_part, 1))
+
+
+class TsconfigService:
+    """
+    Tìm tsconfig.json gần nhất cho mỗi thư mục, có cache cả câu trả lời phủ định (thư mục không
+    có tsconfig nào phía trên trong dự án). Mỗi config chỉ được đọc, gộp chuỗi `extends`
+    và biên dịch alias một lần trong lần chạy.
+    """
+    def __init__(self, project_path: Path, logger: logging.Logger, source: WorktreeSource | GitTreeSource | None = None):
+        self.project_path = str(project_path)
+        self.logger = logger
+        self.source = source or WorktreeSource() # Nơi đọc config (working tree hoặc cây của một revision)
+        self._nearest: Dict[str, TsconfigInfo | None] = {} # thư mục -> config gần nhất (hoặc None)
+        self._configs: Dict[str, TsconfigInfo | None] = {} # đường dẫn config -> config đã gộp
+
+    def clear(self):
+        self._nearest.clear()
+        self._configs.clear()
+
+    @staticmethod
+    def parse_jsonc(text: str) -> Any:
+        """Parse JSON có comment (// và /* */) và dấu phẩy thừa như tsconfig cho phép."""
+        string_or_comment = re.compile(r'"(?:[^"\\]|\\.)*"|//[^\n]*|/\*[\s\S]*?\*/')
+        text = string_or_comment.sub(lambda m: m.group() if m.group().startswith('"') else '', text)
+        string_or_trailing_comma = re.compile(r'"(?:[^"\\]|\\.)*"|,(?=\s*[}\]])')
+        text = string_or_trailing_comma.sub(lambda m: m.group() if m.group().startswith('"') else '', text)
+        return json.loads(text)
+
+    def for_directory(self, directory: str) -> TsconfigInfo | None:
+        """Config tsconfig.json gần nhất khi đi ngược từ thư mục lên gốc dự án."""
+        visited: List[str] = []
+        current = directory
+        result: TsconfigInfo | None = None
+        while True:
+            if current in self._nearest:
+                result = self._nearest[current]
+                break
+            if current != self.project_path and not current.startswith(self.project_path + os.sep):
+                break # Ra ngoài dự án
+            visited.append(current)
+            candidate = os.path.join(current, 'tsconfig.json')
+            if self.source.is_file(candidate):
+                result = self._load(candidate)
+                break
+            parent = os.path.dirname(current)
+            if parent == current: # Đã đến gốc hệ thống
+                break
+            current = parent
+        for visited_dir in visited:
+            self._nearest[visited_dir] = result
+        return result
+
+    def _load(self, config_path: str, chain: tuple = ()) -> TsconfigInfo | None:
+        if config_path in self._configs:
+            return self._configs[config_path]
+        try:
+            data = self.parse_jsonc(self.source.read_bytes(config_path).decode('utf-8'))
+            if not isinstance(data, dict):
+                raise ValueError("nội dung không phải JSON object")
+        except Exception as e:
+            self.logger.warning(f"Lỗi khi đọc hoặc parse {config_path}: {e}")
+            self._configs[config_path] = None # Cache lỗi để không thử lại
+            return None
+
+        config_dir = os.path.dirname(config_path)
+        compiler_options: Dict[str, Any] = {}
+        option_dirs: Dict[str, str] = {} # Thư mục của config khai báo từng option (cho baseUrl/paths)
+        extends = data.get('extends') or []
+        for base_ref in [extends] if isinstance(extends, str) else extends:
+            base_path = self._resolve_extends(config_dir, base_ref)
+            if base_path is None:
+                self.logger.warning(f"Không tìm thấy config '{base_ref}' được extends trong {config_path}")
+                continue
+            if base_path in chain or base_path == config_path:
+                self.logger.warning(f"Phát hiện vòng lặp extends tại {config_path} -> {base_path}")
+                continue
+            base_info = self._load(base_path, chain + (config_path,))
+            if base_info:
+                compiler_options.update(base_info.data.get('compilerOptions', {}))
+                option_dirs.update(base_info.option_dirs)
+
+        own_options = data.get('compilerOptions') or {}
+        compiler_options.update(own_options)
+        option_dirs.update({name: config_dir for name in own_options})
+
+        merged_data = dict(data)
+        merged_data['compilerOptions'] = compiler_options
+        info = TsconfigInfo(Path(config_path), merged_data, compiler_options, option_dirs)
+        self._configs[config_path] = info
+        return info
+
+    def _resolve_extends(self, config_dir: str, base_ref: str) -> str | None:
+        """Tìm file config được tham chiếu bởi `extends` (đường dẫn tương đối/tuyệt đối hoặc package)."""
+        if base_ref.startswith('.') or os.path.isabs(base_ref):
+            candidate = os.path.normpath(os.path.join(config_dir, base_ref))
+            for path in (candidate, candidate + '.json'):
+                if self.source.is_file(path):
+                    return path
+            return None
+        # Config từ package, ví dụ "@tsconfig/node18/tsconfig.json": tìm trong node_modules đi ngược lên
+        current = config_dir
+        while True:
+            package_path = os.path.join(current, 'node_modules', base_ref)
+            for path in (package_path, package_path + '.json', os.path.join(package_path, 'tsconfig.json')):
+                if self.source.is_file(path):
+                    return path
+            parent = os.path.dirname(current)
+            if parent == current:
+                return None
+            current = parent
+
+
+class ModuleResolver:
+    """
+    Resolve chuỗi import thành file thực tế, có memo theo (thư mục importer, specifier).
+    Việc kiểm tra file/thư mục tồn tại được trả lời từ cache listing thư mục (một lần os.scandir
+    cho mỗi thư mục trong lần chạy) thay vì gọi exists()/is_file()/is_dir() cho từng ứng viên.
+    Listing lấy từ source của tsconfig_service: đĩa, hoặc cây của revision khi chạy với `--at`.
+    """
+    EXTENSIONS = ('.ts', '.tsx', '.js', '.jsx', '.json')
+
+    def __init__(self, project_path: Path, tsconfig_service: TsconfigService):
+        self.project_path = str(project_path)
+        self.tsconfig_service = tsconfig_service
+        self.source = tsconfig_service.source
+        self._memo: Dict[tuple[str, str], Path | None] = {}
+        self._listings: Dict[str, Dict[str, bool] | None] = {} # thư mục -> {tên: là thư mục}
+        self.hits = 0
+        self.misses = 0
+        self.scandir_calls = 0
+        self.lookups = 0 # Số lần kiểm tra tồn tại được trả lời từ cache listing
+
+    def clear(self, directories: List[str] | None = None):
+        """Xóa memo và cache listing (toàn bộ, hoặc của một số thư mục khi biết chúng đã thay đổi)."""
+        self._memo.clear()
+        if directories is None:
+            self._listings.clear()
+        else:
+            for directory in directories:
+                self._listings.pop(directory, None)
+
+    def _listing(self, directory: str) -> Dict[str, bool] | None:
+        if directory not in self._listings:
+            self.scandir_calls += 1
+            self._listings[directory] = self.source.listing(directory)
+        return self._listings[directory]
+
+    def _kind(self, path: str) -> str | None:
+        """'file', 'dir' hoặc None, tra từ cache listing của thư mục cha."""
+        self.lookups += 1
+        parent, name = os.path.split(path)
+        if not name:
+            return 'dir'
+        listing = self._listing(parent)
+        if listing is None or name not in listing:
+            return None
+        return 'dir' if listing[name] else 'file'
+
+    def find_file(self, potential_path: str) -> Path | None:
+        """
+        Tìm file thực tế bằng cách thử các extension phổ biến (.ts, .tsx, .js, /index.ts, etc.)
+        """
+        kind = self._kind(potential_path)
+        # 1. Thử với đường dẫn gốc (nếu nó đã có extension)
+        if kind == 'file':
+            return Path(potential_path)
+
+        # 2. Thử thêm các extension (thay suffix hiện có, giống Path.with_suffix)
+        stem = os.path.splitext(potential_path)[0] if os.path.basename(potential_path).lstrip('.') else potential_path
+        for ext in self.EXTENSIONS:
+            if self._kind(stem + ext) == 'file':
+                return Path(stem + ext)
+
+        # 3. Thử trường hợp là thư mục (import file index)
+        if kind == 'dir':
+            for ext in self.EXTENSIONS:
+                index_file = os.path.join(potential_path, f"index{ext}")
+                if self._kind(index_file) == 'file':
+                    return Path(index_file)
+        return None
+
+    def resolve(self, importer_path: Path, import_str: str) -> Path | None:
+        importer_dir = os.path.dirname(str(importer_path))
+        key = (importer_dir, import_str)
+        if key in self._memo:
+            self.hits += 1
+            return self._memo[key]
+        self.misses += 1
+        resolved = self._resolve_uncached(importer_dir, import_str)
+        self._memo[key] = resolved
+        return resolved
+
+    def _resolve_uncached(self, importer_dir: str, import_str: str) -> Path | None:
+        """
+        Giải quyết một chuỗi import thành đường dẫn file thực tế, có hỗ trợ tsconfig paths.
+        """
+        for potential_path in self.candidates(importer_dir, import_str):
+            resolved = self.find_file(potential_path)
+            if resolved:
+                return resolved
+        return None
+
+    def candidates(self, importer_dir: str, import_str: str):
+        """Sinh các đường dẫn ứng viên (chưa thêm extension) cho import_str, theo thứ tự ưu tiên khi resolve."""
+        # 1. Xử lý import tương đối (ưu tiên cao nhất và nhanh nhất)
+        if import_str.startswith('.'):
+            yield os.path.normpath(os.path.join(importer_dir, import_str))
+
+        # 2. Xử lý path aliases từ tsconfig.json (config gần nhất, đã gộp `extends`, alias biên dịch sẵn)
+        tsconfig_info = self.tsconfig_service.for_directory(importer_dir)
+        if tsconfig_info:
+            yield from tsconfig_info.alias_candidates(import_str)
+
+        # 3. Xử lý các import tuyệt đối từ gốc project (fallback)
+        yield os.path.normpath(os.path.join(self.project_path, import_str))
+
+    def unresolved_keys(self, importer_path: Path, import_str: str) -> List[str]:
+        """
+        Các khóa (đường dẫn tương đối dạng posix, có và không có extension) mà một file mới phải
+        khớp để specifier chưa resolve được của importer_path có thể resolve. Ứng viên nằm ngoài
+        project bị bỏ qua: không file tracked nào có thể làm chúng resolve được.
+        """
+        root = self.project_path + os.sep
+        keys: Dict[str, None] = {}
+        for potential_path in self.candidates(os.path.dirname(str(importer_path)), import_str):
+            if not potential_path.startswith(root):
+                continue
+            stem = os.path.splitext(potential_path)[0] if os.path.basename(potential_path).lstrip('.') else potential_path
+            for path in (potential_path, stem):
+                keys[path[len(root):].replace(os.sep, '/')] = None
+        return list(keys)
+
+    @classmethod
+    def keys_for_file(cls, rel_path: str) -> List[str]:
+        """Các khóa (xem unresolved_keys) mà file rel_path có thể thỏa mãn khi nó được thêm vào project."""
+        keys = [rel_path]
+        directory, _, name = rel_path.rpartition('/')
+        stem, ext = os.path.splitext(name)
+        if ext in cls.EXTENSIONS:
+            keys.append(rel_path[:-len(ext)])
+            if stem == 'index' and directory:
+                keys.append(directory) # Import thư mục -> file index
+        return keys
+
+    def summary(self) -> str:
+        return (f"Resolver: {self.hits + self.misses} lần resolve ({self.hits} hit, {self.misses} miss), "
+                f"{self.lookups} lần kiểm tra tồn tại trả lời từ cache, {self.scandir_calls} lần liệt kê thư mục.")
+
+
+class IgnoreMatcher:
+    """
+    Bộ lọc ignore được biên dịch một lần theo ngữ nghĩa kiểu .gitignore:
+    - 'name' (không có '/') khớp file hoặc thư mục tên đó ở mọi cấp; thư mục khớp thì toàn bộ bên trong bị bỏ qua.
+    - 'dir/' chỉ khớp thư mục; '/path' hoặc 'a/b' (có '/' ở giữa) được neo vào gốc dự án.
+    - Hỗ trợ '*', '?', '[...]' và '**' ('**/x', 'a/**', 'a/**/b').
+    Thư mục viết literal được tra qua set tên / trie tiền tố; các pattern còn lại gộp vào một regex duy nhất.
+    Pattern phủ định ('!') không được hỗ trợ.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = tuple(sorted(patterns))
+        self._dir_names: Set[str] = set() # Tên thư mục literal, khớp ở mọi cấp
+        self._dir_trie: Dict[str, Any] = {} # Đường dẫn thư mục literal neo vào gốc
+        regex_parts = []
+        for raw_pattern in self.patterns:
+            pattern = raw_pattern.strip().replace('\\', '/')
+            if not pattern or pattern.startswith('#') or pattern.startswith('!'):
+                continue
+            dir_only = pattern.endswith('/')
+            pattern = pattern.rstrip('/')
+            anchored = '/' in pattern # gitignore: có '/' ở đầu hoặc giữa thì neo vào gốc
+            pattern = pattern.lstrip('/')
+            if not pattern:
+                continue
+            is_literal = not any(c in pattern for c in '*?[')
+            if dir_only and is_literal:
+                if anchored:
+                    node = self._dir_trie
+                    for part in pattern.split('/'):
+                        node = node.setdefault(part, {})
+                    node[''] = True # Đánh dấu điểm kết thúc
+                else:
+                    self._dir_names.add(pattern)
+                continue
+            body = self._glob_to_regex(pattern)
+            prefix = '^' if anchored else '(?:^|/)'
+            # Đường dẫn thư mục được kiểm tra với '/' ở cuối, nên 'x/' chỉ khớp khi x là thư mục
+            regex_parts.append(f"{prefix}{body}" + ('/' if dir_only else '(?:/|$)'))
+        self._regex = re.compile('|'.join(f'(?:{part})' for part in regex_parts)) if regex_parts else None
+
+    @staticmethod
+    def _glob_to_regex(pattern: str) -> str:
+        parts = []
+        i, n = 0, len(pattern)
+        while i < n:
+            if pattern.startswith('**/', i) and (i == 0 or pattern[i - 1] == '/'):
+                parts.append('(?:.*/)?') # '**/' khớp không hoặc nhiều cấp thư mục
+                i += 3
+            elif pattern.startswith('**', i) and i + 2 == n and (i == 0 or pattern[i - 1] == '/'):
+                parts.append('.+') # 'a/**' khớp mọi thứ bên trong a, không khớp chính a
+                i += 2
+            elif pattern[i] == '*':
+                parts.append('[^/]*')
+                i += 1
+            elif pattern[i] == '?':
+                parts.append('[^/]')
+                i += 1
+            elif pattern[i] == '[':
+                end = pattern.find(']', i + 2)
+                if end == -1:
+                    parts.append(re.escape('['))
+                    i += 1
+                    continue
+                char_class = pattern[i + 1:end]
+                if char_class[0] in '!^':
+                    char_class = '^' + char_class[1:]
+                parts.append('[' + char_class.replace('\\', '\\\\') + ']')
+                i = end + 1
+            else:
+                parts.append(re.escape(pattern[i]))
+                i += 1
+        return ''.join(parts)
+
+    def matches(self, rel_path: str, is_dir: bool = False) -> bool:
+        """Kiểm tra một đường dẫn tương đối (dạng posix) có bị ignore không."""
+        rel_path = rel_path.replace('\\', '/').strip('/')
+        components = rel_path.split('/')
+        dir_count = len(components) if is_dir else len(components) - 1
+        if self._dir_names and not self._dir_names.isdisjoint(components[:dir_count]):
+            return True
+        node = self._dir_trie
+        for part in components[:dir_count]:
+            node = node.get(part)
+            if node is None:
+                break
+            if '' in node:
+                return True
+        if self._regex is not None:
+            return self._regex.search(rel_path + '/' if is_dir else rel_path) is not None
+        return False
+
+    def scan(self, root: Path, start: Path | None = None):
+        """
+        Duyệt cây thư mục bên dưới `start` bằng os.scandir, sinh ra (đường dẫn posix tương đối so với
+        `root`, là thư mục). Thư mục bị ignore bị cắt bỏ trước khi đi vào; symlink tới thư mục không được đi theo.
+        """
+        root_str = str(root)
+        start_str = str(start if start is not None else root)
+        start_rel = os.path.relpath(start_str, root_str).replace(os.sep, '/')
+        if start_rel == '.':
+            start_rel = ''
+        elif start_rel.startswith('..'):
+            raise ValueError(f"'{start_str}' không nằm trong '{root_str}'")
+        elif self.matches(start_rel, is_dir=True):
+            return
+
+        pending = [(start_str, start_rel)]
+        while pending:
+            dir_path, dir_rel = pending.pop()
+            try:
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:
+                        rel = f"{dir_rel}/{entry.name}" if dir_rel else entry.name
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not self.matches(rel, is_dir=True):
+                                    pending.append((entry.path, rel))
+                                    yield rel, True
+                            elif entry.is_file() and not self.matches(rel):
+                                yield rel, False
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+
+    def walk(self, root: Path, start: Path | None = None) -> List[str]:
+        """Liệt kê file (đường dẫn posix tương đối so với `root`) bên dưới `start`, bỏ qua thư mục bị ignore."""
+        return [rel for rel, is_dir in self.scan(root, start) if not is_dir]
+
+
+# ===== START: WATCH MODE =====
+def stat_signature(st: os.stat_result | None) -> List[int] | None:
+    """Chữ ký stat [size, mtime_ns, inode, ctime_ns] của một file thường (dùng cho stat cache), hoặc None."""
+    if st is None or not stat.S_ISREG(st.st_mode):
+        return None
+    return [st.st_size, st.st_mtime_ns, st.st_ino, st.st_ctime_ns]
+
+
+class InotifyWatcher:
+    """
+    Theo dõi thay đổi qua inotify của Linux (gọi libc bằng ctypes, không cần thư viện ngoài).
+    Mỗi thư mục không bị ignore trong dự án có một watch; thư mục mới tạo được thêm watch ngay khi
+    nhận sự kiện. Thư mục git được theo dõi riêng để nhận biết commit/checkout/add.
+    Ném OSError nếu inotify không dùng được (không phải Linux, vượt giới hạn max_user_watches...).
+    """
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+                  | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+    _EVENT_HEADER = struct.Struct('iIII') # wd, mask, cookie, len
+
+    def __init__(self, project_path: Path, git_dir: Path | None, ignore_matcher: IgnoreMatcher):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, "inotify chỉ có trên Linux")
+        self.project_path = project_path
+        self.ignore_matcher = ignore_matcher
+        import ctypes.util # Chỉ nạp khi cần: chỉ watch mode dùng tới
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 thất bại")
+        self._watches: Dict[int, tuple[str, bool]] = {} # wd -> (thư mục tương đối, là thư mục git)
+        try:
+            self._add_tree('')
+            if git_dir is not None:
+                self._add_watch(git_dir, str(git_dir), True)
+                refs_heads = git_dir / 'refs' / 'heads'
+                if refs_heads.is_dir():
+                    self._add_watch(refs_heads, str(refs_heads), True)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, path: Path, rel_dir: str, is_git: bool):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self.WATCH_MASK)
+        if wd < 0:
+            import ctypes
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR): # Thư mục đã biến mất trước khi kịp watch
+                return
+            raise OSError(err, f"inotify_add_watch thất bại: {path}")
+        self._watches[wd] = (rel_dir, is_git)
+
+    def _add_tree(self, rel_dir: str) -> List[str]:
+        """Thêm watch cho một thư mục và các thư mục con; trả về các file đang có bên trong."""
+        start = self.project_path / rel_dir if rel_dir else self.project_path
+        self._add_watch(start, rel_dir, False)
+        files = []
+        for rel, is_dir in self.ignore_matcher.scan(self.project_path, start):
+            if is_dir:
+                self._add_watch(self.project_path / rel, rel, False)
+            else:
+                files.append(rel)
+        return files
+
+    @property
+    def watch_count(self) -> int:
+        return len(self._watches)
+
+    def wait(self, timeout: float | None) -> tuple[Set[str], bool] | None:
+        """
+        Chờ sự kiện tối đa `timeout` giây (None: chờ vô hạn). Trả về (các đường dẫn tương đối bị chạm,
+        git thay đổi hay không), hoặc None nếu hàng đợi kernel bị tràn (caller cần kiểm tra toàn bộ).
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        touched: Set[str] = set()
+        git_changed = False
+        if not readable:
+            return touched, git_changed
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return touched, git_changed
+        offset = 0
+        while offset + self._EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, name_len = self._EVENT_HEADER.unpack_from(data, offset)
+            offset += self._EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b'\0'))
+            offset += name_len
+            if mask & self.IN_Q_OVERFLOW:
+                return None
+            if mask & self.IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            watch = self._watches.get(wd)
+            if watch is None:
+                continue
+            rel_dir, is_git = watch
+            if is_git:
+                if not name.endswith('.lock'): # File lock tạm của git không mang thông tin
+                    git_changed = True
+                continue
+            if not name:
+                continue # Sự kiện trên chính thư mục (DELETE_SELF...), đã được báo qua thư mục cha
+            rel = f"{rel_dir}/{name}" if rel_dir else name
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO) and not self.ignore_matcher.matches(rel, is_dir=True):
+                    # File có thể đã được tạo trước khi watch kịp gắn vào thư mục mới
+                    touched.update(self._add_tree(rel))
+                elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                    touched.add(rel + '/') # Đánh dấu cả thư mục: caller coi mọi file bên trong là bị chạm
+                continue
+            if not self.ignore_matcher.matches(rel):
+                touched.add(rel)
+        return touched, git_changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher:
+    """
+    Phương án dự phòng khi không có inotify: định kỳ stat lại các file tracked và so với stat cache
+    (chữ ký [size, mtime_ns, inode, ctime_ns] giống metadata['file_stats']). Thay đổi của git được
+    nhận biết qua stat của HEAD, index, packed-refs và thư mục refs/heads.
+    """
+
+    def __init__(self, project_path: Path, git_dir: Path | None, list_files, stat_cache: Dict[str, List[int]],
+                 interval: float = 1.0):
+        self.project_path = project_path
+        self.git_dir = git_dir
+        self.list_files = list_files # Hàm trả về danh sách file tracked hiện tại
+        self.interval = interval
+        self._baseline: Dict[str, List[int] | None] = dict(stat_cache)
+        for file_path_str in list_files():
+            if file_path_str not in self._baseline:
+                self._baseline[file_path_str] = self._signature(file_path_str)
+        self._git_signature = self._read_git_signature()
+        self._next_poll = time.monotonic() + interval
+
+    def _signature(self, file_path_str: str) -> List[int] | None:
+        try:
+            return stat_signature(os.stat(self.project_path / file_path_str))
+        except OSError:
+            return None
+
+    def _read_git_signature(self) -> tuple:
+        if self.git_dir is None:
+            return ()
+        signature = []
+        for name in ('HEAD', 'index', 'packed-refs', 'refs/heads'):
+            try:
+                st = os.stat(self.git_dir / name)
+                signature.append((st.st_mtime_ns, st.st_size, st.st_ino))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def poll(self) -> tuple[Set[str], bool]:
+        touched: Set[str] = set()
+        for file_path_str in self.list_files():
+            signature = self._signature(file_path_str)
+            if self._baseline.get(file_path_str) != signature:
+                self._baseline[file_path_str] = signature
+                touched.add(file_path_str)
+        git_signature = self._read_git_signature()
+        git_changed = git_signature != self._git_signature
+        self._git_signature = git_signature
+        return touched, git_changed
+
+    def wait(self, timeout: float | None) -> tuple[Set[str], bool] | None:
+        """Cùng giao diện với InotifyWatcher.wait: poll theo chu kỳ `interval` cho tới khi có thay đổi hoặc hết giờ."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            if now >= self._next_poll:
+                self._next_poll = now + self.interval
+                touched, git_changed = self.poll()
+                if touched or git_changed:
+                    return touched, git_changed
+            wake_at = self._next_poll if deadline is None else min(self._next_poll, deadline)
+            if deadline is not None and now >= deadline:
+                return set(), False
+            time.sleep(max(0.0, wake_at - now))
+
+    def close(self):
+        pass
+# ===== END: WATCH MODE =====
+
+
+# ===== START: RUN PROFILER =====
+class RunProfiler:
+    """
+    Timer theo phase và bộ đếm cho một lần chạy (`--profile`). Phase lồng nhau được định danh bằng
+    đường dẫn, ví dụ 'process_changes/hash/git'; self time của một phase không gồm thời gian của phase
+    con nên tổng self time của mọi phase cộng phần "unattributed" bằng thời gian chạy.
+    Bộ đếm luôn được cộng (rẻ); timer chỉ chạy khi enabled. cProfile/tracemalloc là tùy chọn thêm.
+    """
+    MAX_KEPT_REPORTS = 50 # Số báo cáo giữ lại trong thư mục mặc định (worker của hook chạy mỗi commit)
+    MEMORY_TOP_ENTRIES = 15
+
+    def __init__(self, enabled: bool = False, cpu: bool = False, memory: bool = False):
+        self.enabled = enabled or cpu or memory
+        self.started_at = datetime.now().isoformat()
+        self.started = time.perf_counter()
+        self.counters: Dict[str, int] = {}
+        self.phases: Dict[str, List[float]] = {} # path -> [số lần, tổng thời gian, self time]
+        self._stack: List[list] = [] # [path, thời điểm bắt đầu, thời gian của các phase con]
+        self._cpu_profile = None
+        if cpu:
+            import cProfile # Chỉ nạp khi cần: hook chạy mỗi commit nên không trả chi phí import này
+            self._cpu_profile = cProfile.Profile()
+            self._cpu_profile.enable()
+        self._trace_memory = memory
+        if memory:
+            import tracemalloc
+            tracemalloc.start()
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def enter(self, name: str):
+        path = f"{self._stack[-1][0]}/{name}" if self._stack else name
+        self._stack.append([path, time.perf_counter(), 0.0])
+
+    def exit(self):
+        path, started, child_seconds = self._stack.pop()
+        elapsed = time.perf_counter() - started
+        record = self.phases.setdefault(path, [0, 0.0, 0.0])
+        record[0] += 1
+        record[1] += elapsed
+        record[2] += elapsed - child_seconds
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        self.enter(name)
+        try:
+            yield
+        finally:
+            self.exit()
+
+    def self_time_by_name(self, wall_seconds: float) -> Dict[str, float]:
+        """Self time gộp theo tên phase (bất kể được gọi từ đâu), giảm dần, kèm phần không thuộc phase nào."""
+        totals: Dict[str, float] = {}
+        for path, (_, _, own) in self.phases.items():
+            name = path.rsplit('/', 1)[-1]
+            totals[name] = totals.get(name, 0.0) + own
+        totals['unattributed'] = wall_seconds - sum(rec[1] for path, rec in self.phases.items() if '/' not in path)
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+    def finish(self, report_file: Path, extra: Dict[str, Any]) -> Dict[str, Any]:
+        """Dừng cProfile/tracemalloc và ghi báo cáo JSON (cùng file .prof nếu có cProfile)."""
+        wall_seconds = time.perf_counter() - self.started
+        report: Dict[str, Any] = {
+            'started_at': self.started_at,
+            **extra,
+            'wall_s': round(wall_seconds, 6),
+            'phases': {path: {'calls': int(calls), 'total_s': round(total, 6), 'self_s': round(own, 6)}
+                       for path, (calls, total, own) in self.phases.items()},
+            'self_time_s': {name: round(seconds, 6) for name, seconds in self.self_time_by_name(wall_seconds).items()},
+            'counters': dict(sorted(self.counters.items())),
+        }
+        report_file.parent.mkdir(parents=True, exist_ok=True)
+        if self._cpu_profile is not None:
+            self._cpu_profile.disable()
+            cpu_file = report_file.with_suffix('.prof')
+            self._cpu_profile.dump_stats(cpu_file)
+            report['cprofile_file'] = str(cpu_file) # Xem bằng: python -m pstats <file> hoặc snakeviz
+        if self._trace_memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics('lineno')[:self.MEMORY_TOP_ENTRIES]
+            tracemalloc.stop()
+            report['memory'] = {
+                'current_bytes': current,
+                'peak_bytes': peak,
+                'top': [{'where': f"{Path(s.traceback[0].filename).name}:{s.traceback[0].lineno}",
+                         'size_bytes': s.size, 'count': s.count} for s in top],
+            }
+        with AtomicOutputWriter(report_file) as writer:
+            writer.write_text(json.dumps(report, ensure_ascii=False, indent=2) + '\n')
+        return report
+
+    @classmethod
+    def prune_reports(cls, directory: Path):
+        """Chỉ giữ MAX_KEPT_REPORTS báo cáo mới nhất (tên file chứa thời điểm chạy nên sắp xếp theo tên)."""
+        reports = sorted(directory.glob('run-*.json'))
+        for old_report in reports[:-cls.MAX_KEPT_REPORTS]:
+            old_report.unlink(missing_ok=True)
+            old_report.with_suffix('.prof').unlink(missing_ok=True)
+
+
+def profiled(phase_name: str):
+    """Decorator cho method của GitFileTracker: tính thời gian method vào phase `phase_name` khi profiler bật."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            profiler = self.profiler
+            if not profiler.enabled:
+                return method(self, *args, **kwargs)
+            profiler.enter(phase_name)
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                profiler.exit()
+        return wrapper
+    return decorator
+# ===== END: RUN PROFILER =====
+
+
+class OutputDirFileHandler(logging.FileHandler):
+    """FileHandler chỉ mở file log (và tạo thư mục chứa nó) khi có bản ghi đầu tiên, không phải lúc cấu hình logging."""
+
+    def __init__(self, filename: Path):
+        super().__init__(filename, delay=True)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
 class GitFileTracker:
-    def __init__(self, project_path: str, output_dir: str = "tracked_files"):
+    # Các file có mtime nằm trong khoảng này trước thời điểm ghi stat cache được coi là "racy"
+    # (có thể bị sửa trong cùng tick đồng hồ của filesystem) và luôn được hash lại ở lần chạy sau.
+    RACY_WINDOW_NS = 2_000_000_000
+    UPDATE_QUEUE_NAME = 'update_queue.jsonl'
+    UPDATE_RUNS_NAME = 'update_runs.jsonl'
+    # Bản tóm tắt trạng thái ghi ở cuối mỗi lần chạy, để `--status` trả lời mà không cần dựng tracker
+    STATUS_SUMMARY_NAME = 'status.json'
+    STATUS_SUMMARY_VERSION = 1
+
+    def __init__(self, project_path: str, output_dir: str = "tracked_files", paranoid: bool = False,
+                 change_detection: str = 'content', hasher: ContentHasher | None = None,
+                 graph_workers: int | None = None, content_size_limits: Dict[str, int] | None = None,
+                 metadata_backend: str = 'auto', revision: str | None = None,
+                 blob_cache_dir: str | None = None, blob_cache_size: int | None = None,
+                 profiler: RunProfiler | None = None):
+        # Tạo đầu tiên để đo cả phần khởi tạo (rev-parse, ls-tree, mở metadata)
+        self.profiler = profiler or RunProfiler()
         self.project_path = Path(project_path).resolve()
-        self.output_dir = self.project_path / output_dir
-        self.output_dir.mkdir(exist_ok=True)
+        self.git_call_count = 0 # Số tiến trình git đã chạy trong lần chạy này
+        # revision: dựng output từ cây của một commit/branch (`--at`) thay vì working tree
+        self.revision = revision
+        self.revision_commit: str | None = None
+        if revision is not None:
+            try:
+                result = self._run_git(['rev-parse', '--verify', '--end-of-options', f'{revision}^{{commit}}'])
+            except (subprocess.CalledProcessError, FileNotFoundError) as e:
+                raise ValueError(f"Không tìm thấy revision '{revision}'") from e
+            self.revision_commit = result.stdout.strip()
+        self.output_root = self.project_path / output_dir # Thư mục output gốc (bị loại khỏi danh sách file)
+        self.output_dir = self.output_root
+        if self.revision_commit is not None:
+            # Output của mỗi revision nằm riêng để không đè lên output/metadata của working tree
+            self.output_dir = self.output_root / f"at-{self.revision_commit[:12]}"
+        # Thư mục output không được tạo ở đây: log, metadata và các file output tự tạo nó ở lần ghi đầu tiên
+        self.paranoid = paranoid # True: bỏ qua stat cache, luôn hash lại toàn bộ file
+        # 'content': hash nội dung file bằng Python; 'git-oid': lấy blob OID từ git index
+        # (hoặc từ cây của revision: khi chạy với `--at` không có file nào để hash)
+        self.change_detection = 'git-oid' if revision is not None else change_detection
+        self.hasher = hasher or ContentHasher()
+        # Giới hạn kích thước nội dung theo loại file (ghi đè CONTENT_SIZE_LIMITS mặc định)
+        self.content_size_limits = {**self.CONTENT_SIZE_LIMITS, **(content_size_limits or {})}
 
         self.file_types = {
             'typescript': ['.ts', '.tsx'],
@@ -282,31 +2388,162 @@ class GitFileTracker:
             '.env.local', '*.env.local', '.env.*.local',
             'package-lock.json', 'yarn.lock', 'pnpm-lock.yaml',
         }
-
-        self.tsconfig_cache: Dict[Path, Dict] = {} 
-        
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(self.output_dir / 'tracker.log'),
-                logging.StreamHandler()
-            ]
-        )
-        self.logger = logging.getLogger(__name__)
+        # Thư mục output của tracker (nếu nằm trong dự án) luôn bị ignore, để metadata, log và các file
+        # tổng hợp cũ không bị gộp ngược vào output
+        output_rel = os.path.relpath(self.output_root, self.project_path).replace(os.sep, '/')
+        self._output_ignore_pattern = f"/{output_rel}/" if output_rel != '.' and not output_rel.startswith('..') else None
+        self._ignore_key: frozenset | None = None # ignore_patterns lúc biên dịch matcher
+        self._ignore_matcher: IgnoreMatcher = self.ignore_matcher
+
+        self.graph_extensions = ('.ts', '.tsx', '.js', '.jsx', '.mjs', '.cjs') # File được quét import
+        self.import_graph_file = self.output_dir / 'import_graph.json'
+        # Hàng đợi job của post-commit hook và worker nền
+        self.update_queue_file = self.output_dir / self.UPDATE_QUEUE_NAME
+        self.update_lock_file = self.output_dir / 'update_queue.lock'
+        self.update_runs_file = self.output_dir / self.UPDATE_RUNS_NAME
+        self._import_graph: ImportGraphIndex | None = None
+        self._import_graph_synced = False # True sau khi graph đã được đồng bộ trong lần chạy này
+        # Số tiến trình quét import khi build graph lạnh (<= 1: chạy tuần tự)
+        self.graph_workers = graph_workers if graph_workers is not None else (os.cpu_count() or 1)
+        self._snapshot: RepoSnapshot | None = None
+        self._prefix: str | None = None # Thư mục dự án tính từ gốc repo (xem _git_prefix)
+
+        # Logging, metadata và cache tsconfig/resolver được khởi tạo ở lần dùng đầu tiên (xem các property
+        # bên dưới), để lệnh không cần tới chúng không phải trả giá gắn FileHandler hay parse metadata.
+        self._logger: logging.Logger | None = None
+        self._tsconfig_service: TsconfigService | None = None
+        self._resolver: ModuleResolver | None = None
+        self._metadata_backend = metadata_backend
+        self._metadata_store: JsonMetadataStore | SqliteMetadataStore | None = None
+        self._metadata: Dict[str, Any] | None = None
+        self._last_run: Dict[str, Any] | None = None # Bản ghi record_run của lần chạy này
+        self._status_metadata: Dict[str, Any] | None = None
+        self.content_source = self._open_tree_source() if revision is not None else WorktreeSource()
+        # Cache nội dung theo hash, dùng chung giữa các branch/worktree (tùy chọn)
+        self.blob_cache: BlobCache | None = None
+        if blob_cache_dir:
+            try:
+                self.blob_cache = BlobCache(Path(blob_cache_dir).expanduser().resolve(), self.logger, blob_cache_size)
+            except (OSError, sqlite3.Error) as e:
+                self.logger.warning(f"Không mở được blob cache tại {blob_cache_dir}, chạy không có cache: {e}")
 
         self.metadata_file = self.output_dir / 'metadata.json'
-        self.load_metadata()
-
+        self.metadata_db_file = self.output_dir / 'metadata.db'
+
+    @property
+    def logger(self) -> logging.Logger:
+        """Logger của tracker; lần truy cập đầu tiên mới gắn handler ghi tracker.log và stderr."""
+        if self._logger is None:
+            logging.basicConfig(
+                level=logging.INFO,
+                format='%(asctime)s - %(levelname)s - %(message)s',
+                handlers=[
+                    OutputDirFileHandler(self.output_dir / 'tracker.log'),
+                    logging.StreamHandler()
+                ]
+            )
+            self._logger = logging.getLogger(__name__)
+        return self._logger
+
+    @property
+    def tsconfig_service(self) -> TsconfigService:
+        if self._tsconfig_service is None:
+            self._tsconfig_service = TsconfigService(self.project_path, self.logger, self.content_source)
+        return self._tsconfig_service
+
+    @property
+    def resolver(self) -> ModuleResolver:
+        if self._resolver is None:
+            self._resolver = ModuleResolver(self.project_path, self.tsconfig_service)
+        return self._resolver
+
+    def _clear_resolve_caches(self):
+        """Bỏ cache tsconfig và kết quả resolve, nếu đã được tạo trong lần chạy này."""
+        if self._resolver is not None:
+            self._resolver.clear()
+        if self._tsconfig_service is not None:
+            self._tsconfig_service.clear()
+
+    @property
+    def metadata_store(self) -> JsonMetadataStore | SqliteMetadataStore:
+        if self._metadata_store is None:
+            self._metadata_store = self._open_metadata_store(self._metadata_backend)
+        return self._metadata_store
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        """Metadata của tracker, chỉ được đọc từ store ở lần truy cập đầu tiên."""
+        if self._metadata is None:
+            self.load_metadata()
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, value: Dict[str, Any]):
+        self._metadata = value
+
+    def _open_metadata_store(self, backend: str) -> JsonMetadataStore | SqliteMetadataStore:
+        """
+        Chọn nơi lưu metadata. 'auto' dùng SQLite nếu metadata.db đã tồn tại, nếu không thì JSON.
+        Lần đầu chuyển sang SQLite, metadata.json hiện có được chuyển một lần vào DB rồi đổi tên thành
+        metadata.json.migrated để không bị đọc lại.
+        """
+        if backend == 'auto':
+            backend = 'sqlite' if self.metadata_db_file.exists() else 'json'
+        if backend == 'json':
+            return JsonMetadataStore(self.metadata_file, self.logger)
+
+        store = SqliteMetadataStore(self.metadata_db_file, self.logger)
+        if store.is_empty() and self.metadata_file.exists():
+            legacy_metadata = JsonMetadataStore(self.metadata_file, self.logger).load()
+            if legacy_metadata is not None:
+                store.save(legacy_metadata)
+                migrated_file = self.metadata_file.with_name(self.metadata_file.name + '.migrated')
+                os.replace(self.metadata_file, migrated_file)
+                self.logger.info(f"Đã chuyển metadata từ {self.metadata_file.name} sang {self.metadata_db_file.name} "
+                                 f"({len(legacy_metadata.get('file_hashes', {}))} file). File cũ: {migrated_file.name}")
+        return store
+
+    @profiled('open_tree')
+    def _open_tree_source(self) -> GitTreeSource:
+        """
+        Liệt kê cây của revision bằng một lệnh `git ls-tree -r -z -l` (chạy trong project_path nên chỉ
+        gồm thư mục dự án, đường dẫn tương đối giống `git ls-files`). Submodule và symlink bị bỏ qua
+        vì không có nội dung file để đọc.
+        """
+        try:
+            result = self._run_git(['ls-tree', '-r', '-z', '-l', self.revision_commit])
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            raise ValueError(f"Không đọc được cây của revision '{self.revision}': {e}") from e
+        entries: Dict[str, tuple[str, int]] = {}
+        for record in result.stdout.split('\0'):
+            if not record:
+                continue
+            info, _, path = record.partition('\t')
+            mode, object_type, oid, size = info.split()
+            if object_type == 'blob' and mode != '120000':
+                entries[path] = (oid, int(size))
+        self.logger.info(f"Dựng output tại {self.revision} ({self.revision_commit[:12]}): {len(entries)} file trong cây.")
+
+        def count_spawn():
+            self.git_call_count += 1
+        return GitTreeSource(self.project_path, self.revision, self.revision_commit, entries,
+                             GitBlobReader(self.project_path, on_spawn=count_spawn))
+
+    @profiled('close')
+    def close(self):
+        """Đóng các tài nguyên giữ suốt lần chạy (tiến trình cat-file, kết nối metadata, blob cache)."""
+        self.content_source.close()
+        if self._metadata_store is not None:
+            self._metadata_store.close()
+        if self.blob_cache is not None:
+            self.blob_cache.close()
+            if self.blob_cache.hits or self.blob_cache.misses:
+                self.logger.info(self.blob_cache.summary())
+
+    @profiled('load_metadata')
     def load_metadata(self):
-        if self.metadata_file.exists():
-            try:
-                with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                    self.metadata = json.load(f)
-            except json.JSONDecodeError:
-                self.logger.error(f"Error decoding JSON from {self.metadata_file}. Initializing new metadata.")
-                self._initialize_metadata()
-        else:
+        self._metadata = self.metadata_store.load()
+        if self._metadata is None:
             self._initialize_metadata()
 
     def _initialize_metadata(self):
@@ -314,24 +2551,87 @@ class GitFileTracker:
             'last_commit': None,
             'tracked_files': {},
             'file_hashes': {},
+            'file_stats': {},
             'created': datetime.now().isoformat()
         }
 
+    @profiled('save_metadata')
     def save_metadata(self):
         self.metadata['updated'] = datetime.now().isoformat()
-        with open(self.metadata_file, 'w', encoding='utf-8') as f:
-            json.dump(self.metadata, f, indent=2, ensure_ascii=False)
+        file_costs = self.metadata.get('file_costs')
+        if file_costs: # Bỏ ước lượng của file không còn tracked
+            file_hashes = self.metadata.get('file_hashes', {})
+            self.metadata['file_costs'] = {path: cost for path, cost in file_costs.items() if path in file_hashes}
+        self.metadata_store.save(self.metadata)
+
+    def record_run(self, command: str, duration_s: float):
+        """Ghi lịch sử một lần chạy (chỉ backend SQLite lưu lại) và giữ lại cho bản tóm tắt trạng thái."""
+        self._status_metadata = self._metadata_status()
+        self._last_run = {
+            'started_at': datetime.now().isoformat(),
+            'command': command,
+            'commit': self._status_metadata['last_commit'],
+            'duration_s': round(duration_s, 3),
+            'git_calls': self.git_call_count,
+            'files_tracked': self._status_metadata['files_tracked'],
+        }
+        self.metadata_store.record_run(self._last_run)
+
+    def write_profile_report(self, command: str, report_file: Path | None = None) -> Path:
+        """
+        Ghi báo cáo `--profile` của lần chạy: thời gian theo phase và bộ đếm của các thành phần
+        (git, hash, resolver, blob cache...). Mặc định ghi vào <output-dir>/profiles/run-<thời điểm>-<pid>.json.
+        """
+        default_location = report_file is None
+        if default_location:
+            report_file = self.output_dir / 'profiles' / f"run-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{os.getpid()}.json"
+        counters = self.profiler.counters
+        counters['git_calls'] = self.git_call_count
+        counters['files_hashed'] = self.hasher.files_hashed
+        counters['bytes_hashed'] = self.hasher.bytes_hashed
+        if self._resolver is not None:
+            counters['resolver_hits'] = self._resolver.hits
+            counters['resolver_misses'] = self._resolver.misses
+        if isinstance(self.content_source, GitTreeSource):
+            counters['blobs_read_via_cat_file'] = self.content_source.blob_reader.blobs_read
+        if self.blob_cache is not None:
+            counters['blob_cache_hits'] = self.blob_cache.hits
+            counters['blob_cache_misses'] = self.blob_cache.misses
+            counters['blob_cache_stored'] = self.blob_cache.stored
+        report = self.profiler.finish(report_file, {
+            'command': command,
+            'project_path': str(self.project_path),
+            'revision': self.revision,
+            'commit': (self._status_metadata or self._metadata_status())['last_commit'] if self.revision is None else self.revision_commit,
+            'pid': os.getpid(),
+        })
+        if default_location:
+            RunProfiler.prune_reports(report_file.parent)
+        top_phases = [(name, seconds) for name, seconds in report['self_time_s'].items() if seconds >= 0.0005][:5]
+        self.logger.info(f"Profile: {report_file} (tốn nhiều nhất: "
+                         f"{', '.join(f'{name} {seconds:.3f}s' for name, seconds in top_phases)}).")
+        return report_file
+
+    @profiled('git')
+    def _run_git(self, args: List[str]) -> subprocess.CompletedProcess:
+        """Chạy một lệnh git trong project_path và đếm số tiến trình git đã tạo."""
+        self.git_call_count += 1
+        return subprocess.run(
+            ['git'] + args,
+            cwd=self.project_path,
+            capture_output=True,
+            text=True,
+            check=True,
+            encoding='utf-8',
+            # Không để lệnh đọc (status, diff) ghi lại index: tránh lock tranh chấp và tránh đánh thức watcher
+            env={**os.environ, 'GIT_OPTIONAL_LOCKS': '0'}
+        )
 
     def get_current_commit(self) -> str | None: # Python 3.10+ union type
+        if self.revision_commit is not None:
+            return self.revision_commit
         try:
-            result = subprocess.run(
-                ['git', 'rev-parse', 'HEAD'],
-                cwd=self.project_path,
-                capture_output=True,
-                text=True,
-                check=True,
-                encoding='utf-8'
-            )
+            result = self._run_git(['rev-parse', 'HEAD'])
             return result.stdout.strip()
         except subprocess.CalledProcessError as e:
             self.logger.error(f"Không thể lấy commit hash hiện tại: {e}")
@@ -340,65 +2640,145 @@ class GitFileTracker:
             self.logger.error("Lệnh 'git' không tìm thấy. Hãy đảm bảo Git đã được cài đặt và có trong PATH.")
             return None
 
-
-    def get_tracked_files(self) -> List[str]:
+    def get_snapshot(self, refresh: bool = False) -> RepoSnapshot:
+        """
+        Trả về snapshot file tracked của lần chạy hiện tại, chỉ gọi `git ls-files -s -z` một lần.
+        Dùng refresh=True khi biết index đã thay đổi.
+        """
+        if self._snapshot is None or refresh:
+            self._snapshot = self._build_snapshot()
+        return self._snapshot
+
+    @profiled('snapshot')
+    def _build_snapshot(self) -> RepoSnapshot:
+        if self.revision is not None:
+            entries = self.content_source.entries
+            ignored = self.ignore_matcher.matches
+            files = [path for path in entries if not ignored(path)]
+            object_ids = {path: entry[0] for path, entry in entries.items()}
+            return RepoSnapshot(self.project_path, files, object_ids, self.get_file_type, source=self.content_source)
         try:
-            result = subprocess.run(
-                ['git', 'ls-files'],
-                cwd=self.project_path,
-                capture_output=True,
-                text=True,
-                check=True,
-                encoding='utf-8'
-            )
-            files = result.stdout.strip().split('\n')
-            return [f for f in files if f and not self.should_ignore_file(f)]
+            result = self._run_git(['ls-files', '-s', '-z'])
         except subprocess.CalledProcessError as e:
             self.logger.error(f"Không thể lấy danh sách file tracked: {e}")
-            return []
+            return RepoSnapshot(self.project_path, [], {}, self.get_file_type, complete=False, on_stat=self._count_stat)
         except FileNotFoundError:
             self.logger.error("Lệnh 'git' không tìm thấy khi lấy danh sách file.")
-            return []
+            return RepoSnapshot(self.project_path, [], {}, self.get_file_type, complete=False, on_stat=self._count_stat)
+
+        files: List[str] = []
+        seen: Set[str] = set()
+        object_ids: Dict[str, str] = {}
+        ignored = self.ignore_matcher.matches
+        for entry in result.stdout.split('\0'):
+            if not entry:
+                continue
+            info, _, path = entry.partition('\t')
+            mode, oid, stage = info.split(' ')
+            # Bỏ qua submodule (gitlink) và các entry đang conflict (stage khác 0) khi lấy OID
+            if mode != '160000' and stage == '0':
+                object_ids[path] = oid
+            if path not in seen: # File đang conflict xuất hiện một lần cho mỗi stage
+                seen.add(path)
+                if not ignored(path):
+                    files.append(path)
 
-    def get_changed_files(self, since_commit: str | None = None) -> List[str]:
+        return RepoSnapshot(self.project_path, files, object_ids, self.get_file_type, on_stat=self._count_stat)
+
+    def _count_stat(self):
+        self.profiler.count('stat_calls')
+
+    def get_tracked_files(self) -> List[str]:
+        return list(self.get_snapshot().files)
+
+    def _git_prefix(self) -> str:
+        """Thư mục dự án tính từ gốc repo (dạng 'sub/dir/', rỗng nếu là gốc), cache sau lần gọi đầu."""
+        if self._prefix is None:
+            self._prefix = self._run_git(['rev-parse', '--show-prefix']).stdout.strip()
+        return self._prefix
+
+    @profiled('collect_changes')
+    def collect_changes(self, since_commit: str | None = None, include_untracked: bool = False) -> List[FileChange] | None:
+        """
+        Thu thập thay đổi bằng một lệnh git, kèm loại thay đổi, đường dẫn cũ (khi đổi tên) và blob OID.
+        Có since_commit: so commit đó với working tree (`git diff --raw -M -z`), gồm cả các commit mới
+        lẫn thay đổi đã/chưa staged. Không có since_commit: `git status --porcelain=v2 -z` so với HEAD.
+        include_untracked thêm các file chưa tracked (không bị .gitignore loại).
+        Đường dẫn tương đối với project_path; file khớp ignore patterns bị bỏ. Trả về None nếu git lỗi.
+        """
         try:
             if since_commit:
-                cmd = ['git', 'diff', '--name-only', f'{since_commit}..HEAD']
+                result = self._run_git(['diff', '--raw', '-M', '-z', '--no-abbrev', '--relative', since_commit, '--'])
+                changes = parse_diff_raw(result.stdout)
+                if include_untracked:
+                    result = self._run_git(['ls-files', '--others', '--exclude-standard', '-z'])
+                    changes.extend(FileChange('untracked', f) for f in result.stdout.split('\0') if f)
             else:
-                # Lấy các file đã thay đổi và được staged (chưa commit)
-                cmd = ['git', 'diff', '--name-only', '--cached']
-
-            result = subprocess.run(
-                cmd,
-                cwd=self.project_path,
-                capture_output=True,
-                text=True,
-                check=True, # sẽ raise error nếu git diff trả về non-zero (ví dụ, commit hash không tồn tại)
-                encoding='utf-8'
-            )
-            files = result.stdout.strip().split('\n')
-            return [f for f in files if f and not self.should_ignore_file(f)]
+                result = self._run_git(['status', '--porcelain=v2', '-z', '--find-renames',
+                                        f"--untracked-files={'all' if include_untracked else 'no'}", '--', '.'])
+                changes = parse_status_v2(result.stdout, self._git_prefix())
         except subprocess.CalledProcessError as e:
-            # Đây có thể là trường hợp bình thường nếu không có thay đổi, hoặc commit hash sai
-            self.logger.warning(f"Không thể lấy danh sách file đã thay đổi (since {since_commit}): {e}. Điều này có thể bình thường nếu không có thay đổi hoặc commit hash không hợp lệ.")
-            return []
+            # Có thể xảy ra nếu commit cũ không còn tồn tại (rebase, gc)
+            self.logger.warning(f"Không thể lấy danh sách thay đổi (since {since_commit}): {e.stderr.strip() if e.stderr else e}")
+            return None
         except FileNotFoundError:
             self.logger.error("Lệnh 'git' không tìm thấy khi lấy file thay đổi.")
-            return []
+            return None
+
+        collected: List[FileChange] = []
+        ignored = self.ignore_matcher.matches
+        for change in changes:
+            if ignored(change.path):
+                # Đổi tên vào vùng bị ignore: với tracker, file cũ coi như đã bị xóa
+                if change.status == 'renamed' and not ignored(change.old_path):
+                    collected.append(FileChange('deleted', change.old_path, old_oid=change.old_oid))
+                continue
+            if change.old_path and ignored(change.old_path):
+                change.status = 'added' if change.status == 'renamed' else change.status
+                change.old_path = None
+            collected.append(change)
+        return collected
+
+    def get_changed_files(self, since_commit: str | None = None) -> List[str]:
+        """Đường dẫn các file còn tồn tại đã thay đổi (xem collect_changes); rỗng nếu git lỗi."""
+        changes = self.collect_changes(since_commit)
+        return [change.path for change in changes or [] if change.status != 'deleted']
+
+    def get_index_object_ids(self) -> Dict[str, str] | None:
+        """
+        Blob OID của mọi file trong git index, lấy từ snapshot (`git ls-files -s -z`).
+        Không bao gồm submodule (gitlink) và các entry đang conflict.
+        """
+        snapshot = self.get_snapshot()
+        return snapshot.object_ids if snapshot.complete else None
+
+    def get_worktree_modified_files(self) -> Set[str] | None:
+        """Các file trong working tree khác với index (`git diff-files`), đường dẫn tương đối với project_path."""
+        try:
+            result = self._run_git(['diff-files', '--name-only', '-z', '--relative'])
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            self.logger.error(f"Không thể lấy danh sách file đã sửa trong working tree: {e}")
+            return None
+        return {f for f in result.stdout.split('\0') if f}
 
+    @property
+    def ignore_matcher(self) -> IgnoreMatcher:
+        """
+        Matcher biên dịch từ ignore_patterns, luôn kèm thư mục output của tracker. Được biên dịch lại nếu
+        ignore_patterns bị thay đổi; các vòng lặp theo từng đường dẫn lấy matcher qua property này một lần
+        ở đầu mỗi lượt rồi gọi thẳng `matches`.
+        """
+        key = frozenset(self.ignore_patterns)
+        if key != self._ignore_key:
+            patterns = set(key)
+            if self._output_ignore_pattern is not None:
+                patterns.add(self._output_ignore_pattern)
+            self._ignore_matcher = IgnoreMatcher(patterns)
+            self._ignore_key = key
+        return self._ignore_matcher
 
     def should_ignore_file(self, file_path: str) -> bool:
-        path_obj = Path(file_path)
-        normalized_path_str = str(path_obj).replace('\\', '/') # Chuẩn hóa cho Windows
-
-        for pattern in self.ignore_patterns:
-            if pattern.endswith('/'): # Thư mục
-                if normalized_path_str.startswith(pattern):
-                    return True
-            else: # File pattern
-                if fnmatch.fnmatch(path_obj.name, pattern):
-                    return True
-        return False
+        return self.ignore_matcher.matches(file_path)
 
     def get_file_type(self, file_path: str) -> str:
         p_file_path = Path(file_path)
@@ -420,8 +2800,90 @@ class GitFileTracker:
 
     def calculate_file_hash(self, file_path: Path) -> str | None:
         try:
-            with open(file_path, 'rb') as f:
-                return hashlib.md5(f.read()).hexdigest()
+            return self.hasher.hash_file(file_path)
+        except FileNotFoundError:
+            self.logger.warning(f"File not found for hashing: {file_path}")
+            return None
+        except Exception as e:
+            self.logger.error(f"Error hashing file {file_path}: {e}")
+            return None
+
+    def _hash_many(self, files: List[str], git_blob: bool = False) -> Dict[str, str]:
+        """Hash song song nhiều file (đường dẫn tương đối), bỏ qua và log các file lỗi."""
+        full_paths = [self.project_path / f for f in files]
+        results = self.hasher.hash_files(full_paths, git_blob=git_blob)
+        hashes: Dict[str, str] = {}
+        for file_path_str, full_path in zip(files, full_paths):
+            result = results[full_path]
+            if isinstance(result, FileNotFoundError):
+                self.logger.warning(f"File not found for hashing: {full_path}")
+            elif isinstance(result, BaseException):
+                self.logger.error(f"Error hashing file {full_path}: {result}")
+            else:
+                hashes[file_path_str] = result
+        return hashes
+
+    def _stat_signature(self, file_path_str: str) -> List[int] | None:
+        """Trả về chữ ký stat [size, mtime_ns, inode, ctime_ns] của một file thường, hoặc None."""
+        return stat_signature(self.get_snapshot().stat(file_path_str))
+
+    @profiled('hash')
+    def _collect_file_hashes(self, files: List[str]) -> tuple[Dict[str, str], Dict[str, List[int]]]:
+        """
+        Tính hash cho danh sách file, dùng stat cache trong metadata để bỏ qua các file không đổi.
+        File có chữ ký stat trùng với lần chạy trước được tin tưởng mà không cần đọc lại,
+        trừ khi tracker chạy ở chế độ paranoid hoặc entry cũ bị coi là "racy".
+        Ở chế độ git-oid, hash được lấy từ git index và không cần stat cache.
+        Trả về tuple (file_hashes, file_stats).
+        """
+        algorithm_label = self._hash_algorithm_label()
+        previous_label = self.metadata.get('hash_algorithm', 'md5')
+        if previous_label != algorithm_label:
+            self.logger.info(f"Thuật toán hash đổi từ '{previous_label}' sang '{algorithm_label}'. Toàn bộ file sẽ được hash lại.")
+        self.metadata['hash_algorithm'] = algorithm_label
+
+        if self.change_detection == 'git-oid':
+            oid_hashes = self._collect_git_object_ids(files)
+            if oid_hashes is not None:
+                return oid_hashes, {}
+            self.logger.warning("Không dùng được git index, quay về hash nội dung file.")
+            self.metadata['hash_algorithm'] = algorithm_label = self.hasher.label
+
+        old_hashes: Dict[str, str] = self.metadata.get('file_hashes', {}) if previous_label == algorithm_label else {}
+        old_stats: Dict[str, List[int]] = {} if self.paranoid else self.metadata.get('file_stats', {})
+        racy_threshold_ns = self.metadata.get('stats_recorded_ns', 0) - self.RACY_WINDOW_NS
+
+        new_hashes: Dict[str, str] = {}
+        new_stats: Dict[str, List[int]] = {}
+        files_to_hash: List[str] = []
+        recorded_ns = time.time_ns()
+
+        for file_path_str in files:
+            signature = self._stat_signature(file_path_str)
+            if signature is None:
+                continue
+            new_stats[file_path_str] = signature
+            cached_signature = old_stats.get(file_path_str)
+            cached_hash = old_hashes.get(file_path_str)
+            if cached_hash and cached_signature == signature and signature[1] < racy_threshold_ns:
+                new_hashes[file_path_str] = cached_hash
+            else:
+                files_to_hash.append(file_path_str)
+
+        reused_count = len(new_hashes)
+        new_hashes.update(self._hash_many(files_to_hash))
+        # Chỉ giữ stat của những file có hash hợp lệ
+        new_stats = {f: sig for f, sig in new_stats.items() if f in new_hashes}
+
+        self.metadata['stats_recorded_ns'] = recorded_ns
+        self.logger.info(f"Hash file ({algorithm_label}): {len(new_hashes) - reused_count} file được hash lại, {reused_count} file dùng stat cache"
+                         f"{' (chế độ paranoid)' if self.paranoid else ''}.")
+        return new_hashes, new_stats
+
+    def calculate_git_blob_oid(self, file_path: Path) -> str | None:
+        """Tính blob OID giống `git hash-object` để so sánh được với OID trong index."""
+        try:
+            return self.hasher.hash_file(file_path, git_blob=True)
         except FileNotFoundError:
             self.logger.warning(f"File not found for hashing: {file_path}")
             return None
@@ -429,50 +2891,299 @@ class GitFileTracker:
             self.logger.error(f"Error hashing file {file_path}: {e}")
             return None
 
-    def read_file_content(self, file_path: Path) -> str:
+    def _hash_algorithm_label(self) -> str:
+        """Nhãn thuật toán hash được ghi vào metadata; đổi nhãn sẽ buộc hash lại toàn bộ."""
+        return 'git-oid' if self.change_detection == 'git-oid' else self.hasher.label
+
+    def _collect_git_object_ids(self, files: List[str]) -> Dict[str, str] | None:
+        """
+        Lấy hash cho danh sách file từ blob OID trong git index. Chỉ những file mà git báo
+        là đã sửa trong working tree mới bị đọc và hash lại (theo định dạng blob của git).
+        Trả về None nếu không đọc được index để caller quay về chế độ hash nội dung.
+        """
+        index_oids = self.get_index_object_ids()
+        # Với `--at`, OID lấy từ cây của revision và không có working tree nào để so
+        modified_files = set() if self.revision is not None else self.get_worktree_modified_files()
+        if index_oids is None or modified_files is None:
+            return None
+
+        new_hashes: Dict[str, str] = {}
+        files_to_hash: List[str] = []
+        for file_path_str in files:
+            if file_path_str in modified_files or file_path_str not in index_oids:
+                files_to_hash.append(file_path_str)
+            else:
+                new_hashes[file_path_str] = index_oids[file_path_str]
+        new_hashes.update(self._hash_many(files_to_hash, git_blob=True))
+
+        self.logger.info(f"Hash file (git-oid): {len(files) - len(files_to_hash)} file lấy OID từ index, {len(files_to_hash)} file được hash lại.")
+        return new_hashes
+
+    @profiled('read_file')
+    def read_file_content(self, file_path: Path) -> str:
+        try:
+            # Đọc một lần (từ đĩa, hoặc blob khi chạy với `--at`), thử UTF-8 rồi Latin-1 trên cùng buffer
+            data = self.content_source.read_bytes(str(file_path))
+            self._count_read(len(data))
+            return decode_text(data)
+        except FileNotFoundError:
+            self.logger.warning(f"File not found for reading content: {file_path}")
+            return f"# FILE_NOT_FOUND: {file_path.name}\n"
+        except Exception as e:
+            self.logger.error(f"Lỗi đọc file: {file_path} - {e}")
+            return f"# ERROR_READING_FILE: {file_path.name}\n"
+
+    # ===== START: INCREMENTAL CONSOLIDATED OUTPUT =====
+    # Mỗi <type>_files.txt có một file index đi kèm (<type>_files.idx.json) ghi lại vị trí byte,
+    # độ dài và hash nội dung của từng section. Khi chỉ vài file thay đổi, các section còn lại
+    # được copy nguyên byte từ output cũ thay vì đọc lại file nguồn.
+    SECTION_INDEX_VERSION = 1
+    # Giới hạn kích thước (byte) để đưa nội dung vào output; file lớn hơn chỉ được ghi một dòng stub.
+    # Khóa 'default' áp dụng cho các loại không được liệt kê.
+    CONTENT_SIZE_LIMITS = {'default': 2 * 1024 * 1024, 'assets': 256 * 1024}
+
+    def _section_index_path(self, output_file: Path) -> Path:
+        return output_file.with_name(output_file.stem + '.idx.json')
+
+    def _render_consolidated_header(self, file_type: str, total_files: int) -> bytes:
+        header = [
+            f"# Consolidated {file_type.upper()} Files",
+            f"# Generated: {datetime.now().isoformat()}",
+            f"# Total files: {total_files}",
+            "=" * 80, ""
+        ]
+        return '\n'.join(header).encode('utf-8')
+
+    def _content_size_limit(self, file_type: str) -> int:
+        return self.content_size_limits.get(file_type, self.content_size_limits['default'])
+
+    def _omitted_file_stub(self, kind: str, full_path: Path, size: int, known_hash: str | None, note: str = "") -> str:
+        """Dòng thay thế cho nội dung file nhị phân/quá lớn: tên, kích thước và hash để vẫn nhận ra thay đổi."""
+        file_hash = known_hash or self.hasher.hash_file(full_path, git_blob=self.change_detection == 'git-oid')
+        return f"# {kind}: {full_path.name} ({self._format_size(size)}{note}, {self._hash_algorithm_label()}: {file_hash})\n"
+
+    @profiled('read_file')
+    def _write_file_body(self, writer: AtomicOutputWriter, full_path: Path, file_type: str, known_hash: str | None = None):
+        """
+        Ghi nội dung file vào output theo luồng. File nhị phân (sniff khối đầu) hoặc vượt giới hạn
+        kích thước của loại file được thay bằng một dòng stub; lỗi đọc được ghi chú như read_file_content.
+        """
+        body_start = writer.position
+        try:
+            cached_blob = self.blob_cache.get(self._blob_key(known_hash)) if self.blob_cache and known_hash else None
+            if cached_blob is not None:
+                self._write_blob_info(writer, full_path, file_type, known_hash, cached_blob)
+                return
+            if self.revision is not None:
+                self._write_blob_body(writer, full_path, file_type, known_hash)
+                return
+            with open(full_path, 'rb') as f:
+                src_fd = f.fileno()
+                size = os.fstat(src_fd).st_size
+                size_limit = self._content_size_limit(file_type)
+                if size > size_limit:
+                    writer.write_text(self._omitted_file_stub(
+                        'LARGE_FILE_OMITTED', full_path, size, known_hash, f" > {self._format_size(size_limit)} limit"))
+                    return
+                if self.blob_cache is not None and known_hash:
+                    # Đọc một lần để vừa ghi output vừa điền cache (bỏ qua đường copy zero-copy)
+                    data = os.pread(src_fd, size, 0)
+                    self._count_read(len(data))
+                    self._write_blob_info(writer, full_path, file_type, known_hash,
+                                          self._cache_blob(full_path, data, known_hash))
+                    return
+                head = os.pread(src_fd, BINARY_SNIFF_SIZE, 0)
+                if looks_binary(head):
+                    self._count_read(len(head))
+                    writer.write_text(self._omitted_file_stub('BINARY_FILE_OMITTED', full_path, size, known_hash))
+                    return
+                self._count_read(writer.write_file_text(src_fd, head))
+        except FileNotFoundError:
+            writer.truncate(body_start)
+            self.logger.warning(f"File not found for reading content: {full_path}")
+            writer.write_text(f"# FILE_NOT_FOUND: {full_path.name}\n")
+        except OSError as e:
+            writer.truncate(body_start)
+            self.logger.error(f"Lỗi đọc file: {full_path} - {e}")
+            writer.write_text(f"# ERROR_READING_FILE: {full_path.name}\n")
+
+    def _write_blob_body(self, writer: AtomicOutputWriter, full_path: Path, file_type: str, known_hash: str | None):
+        """Như _write_file_body nhưng nội dung lấy từ cây của revision; blob vượt giới hạn không bị đọc."""
+        path = str(full_path)
+        size = self.content_source.size(path)
+        if size is None:
+            raise FileNotFoundError(errno.ENOENT, f"Không có trong {self.revision}", path)
+        known_hash = known_hash or self.get_snapshot().object_ids.get(self._relative_posix(full_path))
+        size_limit = self._content_size_limit(file_type)
+        if size > size_limit:
+            writer.write_text(self._omitted_file_stub(
+                'LARGE_FILE_OMITTED', full_path, size, known_hash, f" > {self._format_size(size_limit)} limit"))
+            return
+        data = self.content_source.read_bytes(path)
+        self._count_read(len(data))
+        if self.blob_cache is not None and known_hash:
+            self._write_blob_info(writer, full_path, file_type, known_hash, self._cache_blob(full_path, data, known_hash))
+            return
+        if looks_binary(data[:BINARY_SNIFF_SIZE]):
+            writer.write_text(self._omitted_file_stub('BINARY_FILE_OMITTED', full_path, size, known_hash))
+            return
+        writer.write_text(decode_text(data))
+
+    def _count_read(self, byte_count: int):
+        """Đếm một lần đọc nội dung file nguồn (đĩa hoặc blob của revision) trong tiến trình này."""
+        self.profiler.count('files_read')
+        self.profiler.count('bytes_read', byte_count)
+
+    # ----- Blob cache -----
+    def _blob_key(self, content_hash: str) -> str:
+        return f"{self._hash_algorithm_label()}:{content_hash}"
+
+    def _cache_blob(self, full_path: Path, data: bytes, known_hash: str) -> BlobInfo:
+        """
+        Dựng BlobInfo từ byte vừa đọc và lưu vào blob cache. Chỉ lưu khi hash của chính các byte này
+        khớp known_hash (file có thể đã bị sửa sau bước hash) để cache dùng chung không bị sai lệch.
+        """
+        info = BlobInfo.from_bytes(data, with_imports=full_path.name.lower().endswith(self.graph_extensions))
+        if self.hasher.hash_bytes(data, git_blob=self.change_detection == 'git-oid') == known_hash:
+            self.blob_cache.put(self._blob_key(known_hash), info)
+        return info
+
+    def _write_blob_info(self, writer: AtomicOutputWriter, full_path: Path, file_type: str, known_hash: str, info: BlobInfo):
+        size_limit = self._content_size_limit(file_type)
+        if info.size > size_limit:
+            writer.write_text(self._omitted_file_stub(
+                'LARGE_FILE_OMITTED', full_path, info.size, known_hash, f" > {self._format_size(size_limit)} limit"))
+        elif info.binary:
+            writer.write_text(self._omitted_file_stub('BINARY_FILE_OMITTED', full_path, info.size, known_hash))
+        else:
+            writer.write_text(info.text)
+
+    def _cached_import_specifiers(self, file_path_str: str, known_hash: str) -> List[str] | None:
+        """Specifier của một file lấy từ blob cache (tính từ text đã cache nếu entry chưa có); None nếu trượt."""
+        key = self._blob_key(known_hash)
+        info = self.blob_cache.get(key)
+        if info is None:
+            return None
+        if info.imports is None:
+            info.imports = [] if info.binary else extract_import_specifiers(info.text)
+            self.blob_cache.put(key, info)
+        return info.imports
+
+    def _write_file_section(self, writer: AtomicOutputWriter, file_path_str: str, full_path: Path,
+                            known_hash: str | None = None):
+        section_head, section_tail = self._section_frame(file_path_str)
+        writer.write_text(section_head)
+        self._write_file_body(writer, full_path, self.get_file_type(file_path_str), known_hash)
+        writer.write_text(section_tail)
+
+    def _section_frame(self, file_path_str: str) -> tuple[str, str]:
+        # Bố cục byte giống hệt bản ghép '\n'.join() cũ: mỗi section bắt đầu bằng '\n' và kết thúc sau dòng '='
+        normalized_file_path_str = file_path_str.replace('\\', '/')
+        return f"\n# FILE: {normalized_file_path_str}\n{'-' * 60}\n", f"\n\n{'=' * 80}\n"
+
+    def _load_section_index(self, output_file: Path) -> Dict[str, Dict[str, Any]]:
+        """
+        Đọc index section của một file tổng hợp. Trả về dict rỗng (buộc tạo lại toàn bộ) nếu
+        index không tồn tại, khác version/thuật toán hash, hoặc output đã bị sửa/cắt ngoài tracker.
+        """
+        index_file = self._section_index_path(output_file)
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        except UnicodeDecodeError:
-            try:
-                with open(file_path, 'r', encoding='latin-1') as f: # Thử encoding khác
-                    return f.read()
-            except Exception as e_latin1:
-                self.logger.warning(f"Không thể đọc file (UTF-8 and Latin-1 failed): {file_path} - {e_latin1}")
-                return f"# FAILED_TO_READ_FILE_CONTENT (encoding issue): {file_path.name}\n"
-        except FileNotFoundError:
-            self.logger.warning(f"File not found for reading content: {file_path}")
-            return f"# FILE_NOT_FOUND: {file_path.name}\n"
-        except Exception as e:
-            self.logger.error(f"Lỗi đọc file: {file_path} - {e}")
-            return f"# ERROR_READING_FILE: {file_path.name}\n"
+            with open(index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            output_stat = output_file.stat()
+        except (OSError, ValueError):
+            return {}
+        if (not isinstance(data, dict)
+                or data.get('version') != self.SECTION_INDEX_VERSION
+                or data.get('hash_algorithm') != self._hash_algorithm_label()
+                or data.get('content_size_limits') != self.content_size_limits
+                or data.get('output_size') != output_stat.st_size
+                or data.get('output_mtime_ns') != output_stat.st_mtime_ns):
+            self.logger.info(f"Index section không hợp lệ hoặc đã cũ, tạo lại toàn bộ: {output_file.name}")
+            return {}
+        sections = data.get('sections')
+        if not isinstance(sections, dict):
+            return {}
+        for entry in sections.values():
+            offset, length = entry.get('offset'), entry.get('length')
+            if (not isinstance(offset, int) or not isinstance(length, int)
+                    or offset < 0 or length < 0 or offset + length > output_stat.st_size):
+                return {}
+        return sections
+
+    def _save_section_index(self, output_file: Path, sections: Dict[str, Dict[str, Any]]):
+        index_file = self._section_index_path(output_file)
+        output_stat = output_file.stat()
+        data = {
+            'version': self.SECTION_INDEX_VERSION,
+            'hash_algorithm': self._hash_algorithm_label(),
+            'content_size_limits': self.content_size_limits,
+            'output_size': output_stat.st_size,
+            'output_mtime_ns': output_stat.st_mtime_ns,
+            'sections': sections,
+        }
+        with AtomicOutputWriter(index_file) as writer:
+            writer.write_text(json.dumps(data, ensure_ascii=False, separators=(',', ':')))
 
-    # <<<<<<<<<<<<<<<< FIX HERE: Hàm đã được un-indent để trở thành một method của class >>>>>>>>>>>>>>>>
-    def create_consolidated_file(self, file_type: str, files: List[str]):
+    @profiled('write_consolidated')
+    def create_consolidated_file(self, file_type: str, files: List[str], file_hashes: Dict[str, str] | None = None):
+        """
+        Tạo (hoặc cập nhật tăng dần) file tổng hợp cho một loại file.
+        Khi có `file_hashes` và index section cũ còn hợp lệ, section của file có hash không đổi
+        được copy thẳng từ output cũ; chỉ file mới/thay đổi mới bị đọc lại.
+        """
         output_file = self.output_dir / f"{file_type}_files.txt" # Đổi thành .txt cho dễ đọc
-        content = [
-            f"# Consolidated {file_type.upper()} Files",
-            f"# Generated: {datetime.now().isoformat()}",
-            f"# Total files: {len(files)}",
-            "=" * 80, ""
-        ]
+        old_sections = self._load_section_index(output_file) if file_hashes is not None else {}
+        file_hashes = file_hashes or {}
 
-        for file_path_str in sorted(files): # Sắp xếp để output nhất quán
-            full_path = self.project_path / file_path_str
-            if full_path.exists() and full_path.is_file():
-                normalized_file_path_str = file_path_str.replace('\\', '/')
-                content.extend([
-                    f"# FILE: {normalized_file_path_str}", # Sử dụng biến đã chuẩn hóa
-                    "-" * 60,
-                    self.read_file_content(full_path),
-                    "", "=" * 80, ""
-                ])
-            else:
-                self.logger.warning(f"Skipping non-existent file in consolidated report: {full_path}")
+        new_sections: Dict[str, Dict[str, Any]] = {}
+        reused_count = rendered_count = 0
 
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(content))
-        self.logger.info(f"Tạo file tổng hợp: {output_file} ({len(files)} files)")
+        # Output mới được ghi theo luồng vào file tạm; section cũ được copy thẳng từ output cũ đang mở
+        old_output = open(output_file, 'rb') if old_sections else None
+        try:
+            with AtomicOutputWriter(output_file) as writer:
+                writer.write_bytes(self._render_consolidated_header(file_type, len(files)))
+                for file_path_str in sorted(files): # Sắp xếp để output nhất quán
+                    full_path = self.project_path / file_path_str
+                    current_hash = file_hashes.get(file_path_str)
+                    old_entry = old_sections.get(file_path_str)
+                    section_start = writer.position
+                    if current_hash is not None and old_entry is not None and old_entry.get('hash') == current_hash:
+                        writer.copy_range(old_output.fileno(), old_entry['offset'], old_entry['length'])
+                        reused_count += 1
+                    elif self.get_snapshot().is_file(file_path_str):
+                        self._write_file_section(writer, file_path_str, full_path, current_hash)
+                        rendered_count += 1
+                    else:
+                        self.logger.warning(f"Skipping non-existent file in consolidated report: {full_path}")
+                        continue
+                    new_sections[file_path_str] = {'offset': section_start, 'length': writer.position - section_start,
+                                                   'hash': current_hash}
+        finally:
+            if old_output is not None:
+                old_output.close()
+        self._save_section_index(output_file, new_sections)
+
+        removed_count = len(old_sections.keys() - new_sections.keys())
+        self.profiler.count('sections_reused', reused_count)
+        self.profiler.count('sections_rendered', rendered_count)
+        if old_sections:
+            self.logger.info(f"Cập nhật file tổng hợp: {output_file} ({len(files)} files; giữ nguyên {reused_count}, "
+                             f"tạo lại {rendered_count}, bỏ {removed_count} section)")
+        else:
+            self.logger.info(f"Tạo file tổng hợp: {output_file} ({len(files)} files)")
+
+    def _remove_consolidated_file(self, file_type: str):
+        consolidated_file_path = self.output_dir / f"{file_type}_files.txt"
+        self._section_index_path(consolidated_file_path).unlink(missing_ok=True)
+        if consolidated_file_path.exists():
+            try:
+                consolidated_file_path.unlink()
+                self.logger.info(f"Đã xóa file tổng hợp (không còn file loại này): {consolidated_file_path}")
+            except OSError as e:
+                self.logger.error(f"Không thể xóa file tổng hợp {consolidated_file_path}: {e}")
+    # ===== END: INCREMENTAL CONSOLIDATED OUTPUT =====
 
     def update_consolidated_files(self, changed_files_paths: List[str]):
         types_affected: Set[str] = set()
@@ -484,38 +3195,36 @@ class GitFileTracker:
             if all_current_files_of_type:
                 self.create_consolidated_file(file_type, all_current_files_of_type)
             else: # Nếu không còn file nào của loại này
-                consolidated_file_path = self.output_dir / f"{file_type}_files.txt"
-                if consolidated_file_path.exists():
-                    try:
-                        consolidated_file_path.unlink()
-                        self.logger.info(f"Đã xóa file tổng hợp (không còn file loại này): {consolidated_file_path}")
-                    except OSError as e:
-                        self.logger.error(f"Không thể xóa file tổng hợp {consolidated_file_path}: {e}")
+                self._remove_consolidated_file(file_type)
 
 
     def get_files_by_type(self, target_type: str) -> List[str]:
-        all_files = self.get_tracked_files() # Lấy danh sách file mới nhất từ git
-        return [f for f in all_files if self.get_file_type(f) == target_type]
+        # Dùng snapshot của lần chạy hiện tại thay vì gọi lại git cho từng loại file
+        return list(self.get_snapshot().files_by_type.get(target_type, []))
 
+    @profiled('write_structure')
     def create_project_structure(self):
         structure_file = self.output_dir / "project_structure.txt"
         content = [
             "# Project Structure",
             f"# Generated: {datetime.now().isoformat()}",
             f"# Project Path: {self.project_path}",
-            "=" * 80, ""
         ]
+        if self.revision is not None:
+            content.append(f"# Revision: {self.revision} ({self.revision_commit})")
+        content.extend(["=" * 80, ""])
         content.extend(self.generate_tree_structure())
         content.extend(["", "=" * 80, "# STATISTICS", "=" * 80])
         content.extend(self.get_project_statistics())
 
+        self.output_dir.mkdir(parents=True, exist_ok=True)
         with open(structure_file, 'w', encoding='utf-8') as f:
             f.write('\n'.join(content))
         self.logger.info(f"Tạo file cấu trúc dự án: {structure_file}")
 
     def generate_tree_structure(self) -> List[str]:
         tree_lines = []
-        # Lấy danh sách file mới nhất từ git để xây dựng cây thư mục
+        # Lấy danh sách file từ snapshot của lần chạy để xây dựng cây thư mục
         tracked_files_for_tree = self.get_tracked_files()
         file_tree = {}
 
@@ -563,118 +3272,28 @@ class GitFileTracker:
     def _load_tsconfig(self, start_path: Path) -> tuple[Dict, Path] | None:
         """
         Tìm và parse file tsconfig.json gần nhất, đi ngược từ thư mục bắt đầu.
-        Trả về một tuple (dữ liệu, đường dẫn file) hoặc None.
-        Kết quả sẽ được cache lại để tăng tốc độ.
+        Trả về một tuple (dữ liệu đã gộp `extends`, đường dẫn file) hoặc None.
+        Kết quả (kể cả "không có config") được TsconfigService cache theo thư mục.
         """
         current_dir = start_path if start_path.is_dir() else start_path.parent
-        
-        # Đi ngược từ thư mục hiện tại lên thư mục gốc của dự án
-        while self.project_path in current_dir.parents or current_dir == self.project_path:
-            tsconfig_path = current_dir / "tsconfig.json"
-            
-            if tsconfig_path in self.tsconfig_cache:
-                cached_data = self.tsconfig_cache[tsconfig_path]
-                # Trả về từ cache nếu nó không phải là marker lỗi
-                return (cached_data, tsconfig_path) if cached_data else None
-
-            if tsconfig_path.is_file():
-                try:
-                    with open(tsconfig_path, 'r', encoding='utf-8') as f:
-                        # Bỏ qua các comment trong file JSON trước khi parse
-                        content = re.sub(r'//.*', '', f.read(), flags=re.MULTILINE)
-                        data = json.loads(content)
-                        self.tsconfig_cache[tsconfig_path] = data
-                        return data, tsconfig_path
-                except Exception as e:
-                    self.logger.warning(f"Lỗi khi đọc hoặc parse {tsconfig_path}: {e}")
-                    self.tsconfig_cache[tsconfig_path] = {} # Cache lỗi để không thử lại
-                    return None
-            
-            if current_dir == current_dir.parent: # Đã đến gốc hệ thống
-                break
-            current_dir = current_dir.parent
-        
-        return None
+        info = self.tsconfig_service.for_directory(str(current_dir))
+        return (info.data, info.path) if info else None
 
     def _resolve_import_path(self, importer_path: Path, import_str: str) -> Path | None:
         """
         Giải quyết một chuỗi import thành đường dẫn file thực tế, có hỗ trợ tsconfig paths.
+        Kết quả được memo trong ModuleResolver theo (thư mục importer, specifier).
         """
-        # 1. Xử lý import tương đối (ưu tiên cao nhất và nhanh nhất)
-        if import_str.startswith('.'):
-            base_dir = importer_path.parent
-            potential_path = (base_dir / import_str).resolve()
-            resolved = self._find_file_with_extension(potential_path)
-            if resolved:
-                return resolved
-
-        # 2. Xử lý path aliases từ tsconfig.json
-        tsconfig_result = self._load_tsconfig(importer_path)
-        if tsconfig_result:
-            tsconfig_data, tsconfig_path = tsconfig_result
-            tsconfig_dir = tsconfig_path.parent # <-- ĐÂY LÀ SỬA LỖI QUAN TRỌNG
-
-            if 'compilerOptions' in tsconfig_data:
-                options = tsconfig_data['compilerOptions']
-                base_url_str = options.get('baseUrl', '.')
-                base_url = (tsconfig_dir / base_url_str).resolve()
-                
-                paths = options.get('paths', {})
-                for alias, real_paths in paths.items():
-                    pattern_str = re.escape(alias).replace(r'\*', r'(.*)')
-                    if not pattern_str.endswith('$'):
-                         pattern_str += '$'
-                    
-                    match = re.match(pattern_str, import_str)
-                    if match:
-                        captured_part = match.group(1) if match.groups() else ""
-                        for real_path_template in real_paths:
-                            real_path_str = real_path_template.replace('*', captured_part, 1)
-                            potential_path = (base_url / real_path_str).resolve()
-                            resolved = self._find_file_with_extension(potential_path)
-                            if resolved:
-                                return resolved
-
-        # 3. Xử lý các import tuyệt đối từ gốc project (fallback)
-        potential_path_from_root = (self.project_path / import_str).resolve()
-        resolved_from_root = self._find_file_with_extension(potential_path_from_root)
-        if resolved_from_root:
-            return resolved_from_root
-            
-        return None
-
+        return self.resolver.resolve(importer_path, import_str)
 
     def _find_file_with_extension(self, potential_path: Path) -> Path | None:
         """
         Tìm file thực tế bằng cách thử các extension phổ biến (.ts, .tsx, .js, /index.ts, etc.)
-        (HÀM NÀY GIỮ NGUYÊN)
         """
-        extensions_to_try = ['.ts', '.tsx', '.js', '.jsx', '.json']
-        # 1. Thử với đường dẫn gốc (nếu nó đã có extension)
-        if potential_path.exists() and potential_path.is_file():
-            return potential_path
-
-        # 2. Thử thêm các extension
-        for ext in extensions_to_try:
-            path_with_ext = potential_path.with_suffix(ext)
-            if path_with_ext.exists() and path_with_ext.is_file():
-                return path_with_ext
-
-        # 3. Thử trường hợp là thư mục (import file index)
-        if potential_path.is_dir():
-            for ext in extensions_to_try:
-                # Đặc biệt ưu tiên index.ts/tsx/js
-                index_file = potential_path / f"index{ext}"
-                if index_file.exists() and index_file.is_file():
-                    return index_file
-                # Một số package export chính nó, ví dụ: 'packages/interactive-quiz-kit/src/react-ui' -> react-ui.ts
-                self_file = potential_path.parent / f"{potential_path.name}{ext}"
-                if self_file.exists() and self_file.is_file():
-                    return self_file
-        
-        return None
+        return self.resolver.find_file(os.path.normpath(potential_path))
 
-    def _get_file_type_indicator(self, file_type: str) -> str:
+    @staticmethod
+    def _get_file_type_indicator(file_type: str) -> str:
         indicators = {
             'typescript': '🔹', 'javascript': '🟨', 'styles': '🎨',
             'config': '⚙️', 'markdown': '📝', 'html': '🌐',
@@ -685,23 +3304,20 @@ class GitFileTracker:
 
 
     def get_project_statistics(self) -> List[str]:
-        tracked_files = self.get_tracked_files() # Lấy danh sách file mới nhất
+        snapshot = self.get_snapshot()
+        tracked_files = snapshot.files
         stats = [f"Total tracked files (respecting .gitignore & script ignores): {len(tracked_files)}"]
 
-        files_by_type_counts: Dict[str, int] = {}
+        files_by_type_counts: Dict[str, int] = {t: len(fs) for t, fs in snapshot.files_by_type.items()}
         total_size = 0
 
         for file_path_str in tracked_files:
-            file_type = self.get_file_type(file_path_str)
-            files_by_type_counts[file_type] = files_by_type_counts.get(file_type, 0) + 1
-            full_path = self.project_path / file_path_str
-            try:
-                if full_path.is_file():
-                    total_size += full_path.stat().st_size
-            except FileNotFoundError:
-                 self.logger.warning(f"File not found during stat calculation: {full_path}")
-            except Exception as e:
-                 self.logger.error(f"Error getting size for {full_path}: {e}")
+            # stat được cache trong snapshot nên không bị gọi lại sau bước hash
+            file_size = snapshot.size(file_path_str)
+            if file_size is None:
+                self.logger.warning(f"File not found during stat calculation: {self.project_path / file_path_str}")
+            else:
+                total_size += file_size
 
 
         stats.append(f"Total size: {self._format_size(total_size)}")
@@ -747,6 +3363,7 @@ class GitFileTracker:
                     dir_stats[top_level_dir] = dir_stats.get(top_level_dir, 0) + 1
         return dir_stats
 
+    @profiled('initial_scan')
     def initial_scan(self):
         self.logger.info("Bắt đầu scan ban đầu...")
         all_tracked_files = self.get_tracked_files()
@@ -756,8 +3373,11 @@ class GitFileTracker:
             file_type = self.get_file_type(file_path_str)
             files_by_type_map.setdefault(file_type, []).append(file_path_str)
 
+        # Hash trước để index section của file tổng hợp có sẵn hash cho lần cập nhật tăng dần sau
+        new_file_hashes, new_file_stats = self._collect_file_hashes(all_tracked_files)
+
         for file_type, files_list in files_by_type_map.items():
-            if files_list: self.create_consolidated_file(file_type, files_list)
+            if files_list: self.create_consolidated_file(file_type, files_list, new_file_hashes)
 
         self.create_project_structure()
 
@@ -765,20 +3385,31 @@ class GitFileTracker:
         self.metadata['last_commit'] = current_commit_hash
         self.metadata['tracked_files'] = files_by_type_map
 
-        new_file_hashes = {}
-        for file_path_str in all_tracked_files:
-            full_path = self.project_path / file_path_str
-            if full_path.is_file():
-                hash_val = self.calculate_file_hash(full_path)
-                if hash_val: new_file_hashes[file_path_str] = hash_val
         self.metadata['file_hashes'] = new_file_hashes
+        self.metadata['file_stats'] = new_file_stats
+        self.update_import_graph(new_file_hashes)
 
         self.save_metadata()
         self.logger.info(f"Hoàn thành scan ban đầu. Tổng cộng: {len(all_tracked_files)} files tracked.")
 
     def check_and_update(self):
         self.logger.info("Kiểm tra thay đổi...")
-        current_commit_hash = self.get_current_commit()
+        self._process_changes()
+
+    @profiled('process_changes')
+    def _process_changes(self, touched: Set[str] | None = None, git_changed: bool = True):
+        """
+        Cập nhật output (file tổng hợp, cấu trúc, import graph, metadata) theo thay đổi kể từ lần chạy trước.
+        touched=None: kiểm tra toàn bộ file tracked (file có stat không đổi vẫn không bị đọc lại).
+        Ở chế độ watch, `touched` là các đường dẫn watcher báo về: chỉ chúng bị stat/hash lại, còn
+        snapshot git và commit hiện tại chỉ được đọc lại khi git_changed.
+        """
+        if touched is None or git_changed:
+            current_commit_hash = self.get_current_commit()
+        else:
+            current_commit_hash = self.metadata.get('last_commit')
+        if touched is not None:
+            self._invalidate_touched(touched, refresh_snapshot=git_changed)
         if not current_commit_hash:
             self.logger.error("Không thể lấy commit hiện tại. Bỏ qua cập nhật.")
             return
@@ -797,31 +3428,40 @@ class GitFileTracker:
             self.logger.info(f"Không có commit mới kể từ {last_known_commit}. Kiểm tra thay đổi file thủ công.")
             # Vẫn tiếp tục để check hash file
 
-        changed_via_git_diff = []
-        if run_full_scan_logic and last_known_commit: # Chỉ diff nếu có commit trước đó để so sánh
-             changed_via_git_diff = self.get_changed_files(last_known_commit)
-
-
         all_current_git_files = self.get_tracked_files()
 
-        files_to_reprocess_content: Set[str] = set(changed_via_git_diff)
-        current_file_hashes: Dict[str, str] = {}
-        structure_changed = False
-
-        # So sánh hash cho tất cả các file hiện tại
-        for file_path_str in all_current_git_files:
-            full_path = self.project_path / file_path_str
-            if full_path.is_file():
-                current_hash = self.calculate_file_hash(full_path)
-                if current_hash:
-                    current_file_hashes[file_path_str] = current_hash
-                    # Nếu hash khác hoặc file mới (chưa có trong metadata cũ)
-                    if self.metadata.get('file_hashes', {}).get(file_path_str) != current_hash:
-                        files_to_reprocess_content.add(file_path_str)
+        # Có file biến mất đồng thời có file mới xuất hiện: có thể là đổi tên, cần git ghép cặp
+        previous_hashes = self.metadata.get('file_hashes', {})
+        current_files_set = set(all_current_git_files)
+        maybe_renamed = (any(f not in current_files_set for f in previous_hashes)
+                         and any(f not in previous_hashes for f in all_current_git_files))
+        changes: List[FileChange] = []
+        if last_known_commit and (run_full_scan_logic or maybe_renamed): # Chỉ diff nếu có commit trước đó để so sánh
+            changes = self.collect_changes(last_known_commit) or []
+            if changes:
+                counts: Dict[str, int] = {}
+                for change in changes:
+                    counts[change.status] = counts.get(change.status, 0) + 1
+                self.logger.info("Git báo thay đổi so với commit trước: "
+                                 + ', '.join(f"{count} {status}" for status, count in sorted(counts.items())))
+        renamed_files = self._carry_over_renames(changes)
+
+        files_to_reprocess_content: Set[str] = set(renamed_files) # Header '# FILE:' đổi theo đường dẫn mới
+        if run_full_scan_logic:
+            files_to_reprocess_content.update(change.path for change in changes if change.status != 'deleted')
+        structure_changed = bool(renamed_files)
+
+        # So sánh hash cho tất cả các file hiện tại (file có stat không đổi sẽ không bị đọc lại)
+        current_file_hashes, current_file_stats = self._collect_file_hashes(all_current_git_files)
+        for file_path_str, current_hash in current_file_hashes.items():
+            # Nếu hash khác hoặc file mới (chưa có trong metadata cũ)
+            if self.metadata.get('file_hashes', {}).get(file_path_str) != current_hash:
+                files_to_reprocess_content.add(file_path_str)
 
 
         # Xác định file đã bị xóa (có trong hash cũ, không có trong git files hiện tại)
-        deleted_files_paths = set(self.metadata.get('file_hashes', {}).keys()) - set(all_current_git_files)
+        # So với các file hash được (còn trên đĩa), để file tracked nhưng đã bị xóa khỏi working tree cũng được tính
+        deleted_files_paths = set(self.metadata.get('file_hashes', {}).keys()) - set(current_file_hashes)
         if deleted_files_paths:
             self.logger.info(f"Phát hiện {len(deleted_files_paths)} file đã bị xóa: {', '.join(deleted_files_paths)}")
             structure_changed = True
@@ -831,7 +3471,7 @@ class GitFileTracker:
 
 
         # Xác định file mới (có trong git files hiện tại, không có trong hash cũ)
-        new_files_paths = set(all_current_git_files) - set(self.metadata.get('file_hashes', {}).keys())
+        new_files_paths = set(current_file_hashes) - set(self.metadata.get('file_hashes', {}).keys())
         if new_files_paths:
             self.logger.info(f"Phát hiện {len(new_files_paths)} file mới: {', '.join(new_files_paths)}")
             structure_changed = True
@@ -854,7 +3494,7 @@ class GitFileTracker:
             types_affected: Set[str] = set()
             for f_path in files_to_reprocess_content: # Bao gồm file mới, file thay đổi
                 types_affected.add(self.get_file_type(f_path))
-            for f_path_deleted in deleted_files_paths: # Và loại file của các file đã xóa
+            for f_path_deleted in deleted_files_paths | set(renamed_files.values()): # Và loại file của các file đã xóa/đổi tên
                 types_affected.add(self.get_file_type(f_path_deleted))
 
 
@@ -862,22 +3502,148 @@ class GitFileTracker:
             for file_type in types_affected:
                 files_of_this_type_now = current_files_by_type_map.get(file_type, [])
                 if files_of_this_type_now:
-                    self.create_consolidated_file(file_type, files_of_this_type_now)
+                    # Truyền hash hiện tại để chỉ đọc lại section của file đã thay đổi
+                    self.create_consolidated_file(file_type, files_of_this_type_now, current_file_hashes)
                 else: # Không còn file nào của loại này
-                    consolidated_file_path = self.output_dir / f"{file_type}_files.txt"
-                    if consolidated_file_path.exists():
-                        consolidated_file_path.unlink(missing_ok=True) # Xóa file nếu không còn file loại đó
-                        self.logger.info(f"Đã xóa file tổng hợp (không còn file loại này): {consolidated_file_path}")
+                    self._remove_consolidated_file(file_type)
 
-            self.metadata['file_hashes'] = current_file_hashes # Cập nhật hash mới
             if structure_changed or files_to_reprocess_content: # Cập nhật cấu trúc nếu cần
                 self.create_project_structure()
 
+        # tsconfig/jsconfig đổi có thể làm thay đổi kết quả resolve của mọi file
+        config_changed = any(os.path.basename(f).startswith(('tsconfig', 'jsconfig')) and f.endswith('.json')
+                             for f in files_to_reprocess_content | deleted_files_paths | set(renamed_files.values()))
+        if config_changed:
+            self._clear_resolve_caches()
+        # Chỉ quét lại các file script thay đổi/mới/xóa; file đổi tên giữ node cũ
+        self.update_import_graph(current_file_hashes, reresolve_all=config_changed, renames=renamed_files)
+        self.metadata['file_hashes'] = current_file_hashes # Cập nhật hash mới
+        self.metadata['file_stats'] = current_file_stats # Stat cache luôn được làm mới để lần chạy sau nhanh hơn
         self.metadata['last_commit'] = current_commit_hash
         self.save_metadata()
         self.logger.info(f"Hoàn thành cập nhật. Commit hiện tại: {current_commit_hash}")
 
 
+    def _carry_over_renames(self, changes: List[FileChange]) -> Dict[str, str]:
+        """
+        Chuyển hash và stat cache trong metadata từ đường dẫn cũ sang đường dẫn mới cho các file
+        git báo là đổi tên, để chúng không bị tính là một file xóa cộng một file mới.
+        Stat cache chỉ được giữ khi file vẫn là cùng inode với cùng size/mtime như lần chạy trước
+        (rename không đổi nội dung); nếu không, file sẽ bị hash lại nhưng vẫn được coi là đổi tên.
+        Trả về dict đường dẫn mới -> đường dẫn cũ.
+        """
+        file_hashes: Dict[str, str] = self.metadata.setdefault('file_hashes', {})
+        file_stats: Dict[str, List[int]] = self.metadata.setdefault('file_stats', {})
+        racy_threshold_ns = self.metadata.get('stats_recorded_ns', 0) - self.RACY_WINDOW_NS
+        renamed_files: Dict[str, str] = {}
+        for change in changes:
+            if change.status != 'renamed' or change.old_path not in file_hashes or change.path in file_hashes:
+                continue
+            renamed_files[change.path] = change.old_path
+            file_hashes[change.path] = file_hashes.pop(change.old_path)
+            cached_signature = file_stats.pop(change.old_path, None)
+            signature = self._stat_signature(change.path)
+            # ctime luôn đổi khi rename nên chỉ so size, mtime_ns và inode
+            if (cached_signature and signature and cached_signature[:3] == signature[:3]
+                    and signature[1] < racy_threshold_ns):
+                file_stats[change.path] = signature
+        if renamed_files:
+            self.logger.info(f"Phát hiện {len(renamed_files)} file đổi tên: "
+                             + ', '.join(f"{old} → {new}" for new, old in sorted(renamed_files.items())))
+        return renamed_files
+
+    # ===== START: WATCH MODE =====
+    def _git_dir(self) -> Path | None:
+        try:
+            result = self._run_git(['rev-parse', '--absolute-git-dir'])
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            self.logger.warning(f"Không xác định được thư mục git, sẽ không theo dõi commit: {e}")
+            return None
+        return Path(result.stdout.strip())
+
+    def _invalidate_touched(self, touched: Set[str], refresh_snapshot: bool):
+        """
+        Bỏ các cache bị ảnh hưởng bởi những đường dẫn vừa thay đổi: stat trong snapshot, listing thư mục
+        của resolver. Khi git thay đổi (add/rm/commit/checkout), snapshot được dựng lại từ `git ls-files`
+        nhưng vẫn giữ cache stat của các file không bị chạm.
+        """
+        previous_snapshot = self.get_snapshot()
+        snapshot = previous_snapshot
+        if refresh_snapshot:
+            snapshot = self.get_snapshot(refresh=True)
+            snapshot.inherit_stats(previous_snapshot)
+        # Đường dẫn kết thúc bằng '/' là thư mục bị xóa/di chuyển: mọi file tracked bên trong đều bị chạm
+        removed_dirs = tuple(t for t in touched if t.endswith('/'))
+        if removed_dirs:
+            touched = {t for t in touched if not t.endswith('/')}
+            touched.update(f for f in previous_snapshot.files if f.startswith(removed_dirs))
+            self.resolver.clear()
+        else:
+            self.resolver.clear({os.path.normpath(os.path.join(self.resolver.project_path, os.path.dirname(t)))
+                                 for t in touched})
+        snapshot.invalidate_stats(list(touched))
+
+    def watch(self, debounce: float = 0.3, backend: str = 'auto', poll_interval: float = 1.0):
+        """
+        Chạy thường trực: giữ trạng thái tracker trong bộ nhớ, nhận sự kiện thay đổi file (inotify, hoặc
+        poll theo stat cache khi không có inotify), gom các thay đổi liên tiếp trong cửa sổ `debounce`
+        giây rồi chỉ cập nhật tăng dần cho các đường dẫn bị chạm. Dừng bằng Ctrl+C.
+        """
+        self.check_and_update() # Đưa output về trạng thái mới nhất trước khi theo dõi
+        git_dir = self._git_dir()
+        watcher: InotifyWatcher | PollingWatcher | None = None
+        if backend in ('auto', 'inotify'):
+            try:
+                watcher = InotifyWatcher(self.project_path, git_dir, self.ignore_matcher)
+                self.logger.info(f"Theo dõi bằng inotify ({watcher.watch_count} thư mục).")
+            except OSError as e:
+                if backend == 'inotify':
+                    raise
+                self.logger.warning(f"Không dùng được inotify ({e}), chuyển sang poll mỗi {poll_interval}s.")
+        if watcher is None:
+            watcher = PollingWatcher(self.project_path, git_dir, lambda: self.get_snapshot().files,
+                                     self.metadata.get('file_stats', {}), interval=poll_interval)
+            self.logger.info(f"Theo dõi bằng poll stat mỗi {poll_interval}s.")
+
+        self.logger.info("Đang theo dõi thay đổi... (Ctrl+C để dừng)")
+        try:
+            while True:
+                event = watcher.wait(None)
+                touched: Set[str] | None = set()
+                git_changed = False
+                # Gom sự kiện cho tới khi yên lặng đủ `debounce` giây (tối đa 10 lần cửa sổ để không trễ mãi)
+                burst_deadline = time.monotonic() + debounce * 10
+                while True:
+                    if event is None:
+                        touched = None # Hàng đợi sự kiện bị tràn: kiểm tra toàn bộ
+                    elif touched is not None:
+                        touched.update(event[0])
+                        git_changed = git_changed or event[1]
+                    remaining = min(debounce, burst_deadline - time.monotonic())
+                    if remaining <= 0:
+                        break
+                    event = watcher.wait(remaining)
+                    if event is not None and not event[0] and not event[1]:
+                        break
+                if touched is not None and not touched and not git_changed:
+                    continue
+                cycle_started = time.perf_counter()
+                git_calls_before = self.git_call_count
+                self.logger.info(f"Phát hiện thay đổi: {'toàn bộ' if touched is None else f'{len(touched)} đường dẫn'}"
+                                 f"{', git thay đổi' if git_changed else ''}.")
+                if touched is None:
+                    self.get_snapshot(refresh=True) # Không biết file nào đổi: bỏ toàn bộ cache stat
+                self._process_changes(touched, git_changed)
+                self.write_status_summary()
+                self.logger.info(f"Cập nhật xong trong {time.perf_counter() - cycle_started:.3f}s "
+                                 f"({self.git_call_count - git_calls_before} tiến trình git).")
+        except KeyboardInterrupt:
+            self.logger.info("Dừng theo dõi.")
+        finally:
+            watcher.close()
+    # ===== END: WATCH MODE =====
+
+    @profiled('merge')
     def merge_specific_files(self, file_list_to_merge: List[str], output_filename: str = "files-merged.txt"):
         if not file_list_to_merge:
             self.logger.warning("Danh sách file để merge rỗng. Không có hành động nào được thực hiện.")
@@ -886,38 +3652,9 @@ class GitFileTracker:
         self.logger.info(f"Bắt đầu gộp {len(file_list_to_merge)} file vào '{output_filename}'...")
 
         output_file = self.output_dir / output_filename
-        content = [
-            f"# Merged Files",
-            f"# Generated: {datetime.now().isoformat()}",
-            f"# Total files merged: {len(file_list_to_merge)}",
-            "=" * 80, ""
-        ]
-
-        valid_files_found = 0
-        for file_path_str in file_list_to_merge:
-            # Tất cả đường dẫn trong file_list_to_merge đều là tương đối so với self.project_path
-            full_path = self.project_path / file_path_str
-
-            if full_path.exists() and full_path.is_file():
-                valid_files_found += 1
-                self.logger.debug(f"  -> Đang đọc file: {file_path_str}")
-                normalized_file_path_str = file_path_str.replace('\\', '/')
-                content.extend([
-                    f"# FILE: {normalized_file_path_str}", # Sử dụng biến đã chuẩn hóa
-                    "-" * 60,
-                    self.read_file_content(full_path),
-                    "", "=" * 80, ""
-                ])
-            else:
-                warning_msg = f"Bỏ qua file không tồn tại hoặc không phải là file: {file_path_str} (Kiểm tra tại: {full_path})"
-                self.logger.warning(warning_msg)
-                normalized_file_path_str = file_path_str.replace('\\', '/')
-                content.extend([
-                    f"# FILE: {normalized_file_path_str}", # Sử dụng biến đã chuẩn hóa
-                    f"# Reason: Not found or not a regular file at checked path '{full_path}'",
-                    "=" * 80, ""
-                ])
-
+        # Kiểm tra trước để không tạo/ghi đè output khi không có file hợp lệ nào
+        valid_paths = {p for p in file_list_to_merge if self.content_source.is_file(str(self.project_path / p))}
+        valid_files_found = len(valid_paths)
         if valid_files_found == 0:
             self.logger.warning(f"Không tìm thấy file hợp lệ nào trong danh sách cung cấp để gộp vào '{output_filename}'. File gộp sẽ không được tạo/cập nhật.")
             # Quyết định xem có nên xóa file output cũ nếu không có file nào hợp lệ
@@ -926,31 +3663,66 @@ class GitFileTracker:
             #     self.logger.info(f"Đã xóa file output cũ '{output_filename}' do không có file hợp lệ mới.")
             return
 
-
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(content))
+            with AtomicOutputWriter(output_file) as writer:
+                writer.write_text(self._merged_header(len(file_list_to_merge)))
+                for file_path_str in file_list_to_merge:
+                    self._write_merge_entry(writer, file_path_str, file_path_str in valid_paths)
             self.logger.info(f"✅ Hoàn thành! Đã gộp thành công {valid_files_found} file vào: {output_file}")
         except Exception as e:
             self.logger.error(f"❌ Lỗi khi ghi file gộp '{output_file}': {e}")
 
+    def _merged_header(self, total_files: int, extra_lines: List[str] | None = None) -> str:
+        header = [
+            f"# Merged Files",
+            f"# Generated: {datetime.now().isoformat()}",
+            f"# Total files merged: {total_files}",
+            *(extra_lines or []),
+            "=" * 80, ""
+        ]
+        return '\n'.join(header)
+
+    def _write_merge_entry(self, writer: AtomicOutputWriter, file_path_str: str, is_valid: bool):
+        """Một mục của file gộp: section nội dung, hoặc ghi chú lý do nếu file không tồn tại/không phải file."""
+        # Tất cả đường dẫn đều là tương đối so với self.project_path
+        full_path = self.project_path / file_path_str
+        if is_valid:
+            self.logger.debug(f"  -> Đang đọc file: {file_path_str}")
+            self._write_file_section(writer, file_path_str, full_path)
+            return
+        warning_msg = f"Bỏ qua file không tồn tại hoặc không phải là file: {file_path_str} (Kiểm tra tại: {full_path})"
+        self.logger.warning(warning_msg)
+        normalized_file_path_str = file_path_str.replace('\\', '/')
+        writer.write_text('\n'.join([
+            "",
+            f"# FILE: {normalized_file_path_str}", # Sử dụng biến đã chuẩn hóa
+            f"# Reason: Not found or not a regular file at checked path '{full_path}'",
+            "=" * 80, ""
+        ]))
+
+    @profiled('merge_dir')
     def merge_directory_files(self, dir_path_str: str, output_filename_base: str = "dir-merged"):
         target_dir = self.project_path / dir_path_str
         self.logger.info(f"Bắt đầu tìm kiếm file trong thư mục: '{target_dir}' để gộp...")
 
-        if not target_dir.is_dir():
+        if self.content_source.listing(str(target_dir)) is None:
             self.logger.error(f"Lỗi: Đường dẫn '{dir_path_str}' không tồn tại hoặc không phải là thư mục.")
             return
 
-        files_to_merge_from_dir = []
-        for path_obj in target_dir.rglob('*'):
-            if path_obj.is_file():
-                relative_path = path_obj.relative_to(self.project_path)
-                relative_path_str = str(relative_path).replace('\\', '/')
-                if not self.should_ignore_file(relative_path_str):
-                    files_to_merge_from_dir.append(relative_path_str)
-                else:
-                    self.logger.debug(f"Bỏ qua file bị ignore trong thư mục: {relative_path_str}")
+        if self.revision is not None:
+            # Không có gì để duyệt trên đĩa: lấy các file của revision nằm dưới thư mục này
+            rel_dir = self._relative_posix(Path(os.path.normpath(target_dir)))
+            if rel_dir is None:
+                self.logger.error(f"Lỗi: Thư mục '{dir_path_str}' nằm ngoài dự án.")
+                return
+            files_to_merge_from_dir = [f for f in self.get_tracked_files() if rel_dir == '.' or f.startswith(rel_dir + '/')]
+        else:
+            # Walker cắt bỏ thư mục bị ignore (node_modules/, output dir...) trước khi đi vào
+            try:
+                files_to_merge_from_dir = self.ignore_matcher.walk(self.project_path, target_dir.resolve())
+            except ValueError as e:
+                self.logger.error(f"Lỗi: Thư mục '{dir_path_str}' nằm ngoài dự án: {e}")
+                return
 
         if not files_to_merge_from_dir:
             self.logger.warning(f"Không tìm thấy file nào hợp lệ để gộp trong thư mục '{dir_path_str}'.")
@@ -981,6 +3753,7 @@ class GitFileTracker:
             self.logger.error(f"Lỗi không xác định khi đọc file errorDict '{error_dict_path}': {e}")
             return None
 
+    @profiled('merge_error')
     def merge_files_by_error_id(self, error_dict_data: Dict[str, Any], error_id: str):
         """
         Gộp các file liên quan đến một ID lỗi cụ thể từ errorDict.
@@ -1054,25 +3827,68 @@ class GitFileTracker:
     # ===== END: CHỨC NĂNG MERGE THEO ERROR DICT =====
 
 
+    def _hook_dir(self) -> Path | None:
+        """Thư mục hooks thực tế (tôn trọng core.hooksPath và git worktree)."""
+        try:
+            result = self._run_git(['rev-parse', '--git-path', 'hooks'])
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            self.logger.error(f"Không xác định được thư mục hooks của git tại {self.project_path}: {e}")
+            return None
+        return self.project_path / result.stdout.strip()
+
     def create_git_hook(self):
-        git_dir = self.project_path / '.git'
-        if not git_dir.is_dir():
+        hook_dir = self._hook_dir()
+        if hook_dir is None:
             self.logger.error(f"Thư mục .git không tồn tại tại {self.project_path}. Không thể tạo hook.")
             return
 
-        hook_dir = git_dir / 'hooks'
-        hook_dir.mkdir(exist_ok=True)
+        hook_dir.mkdir(parents=True, exist_ok=True)
         hook_file = hook_dir / 'post-commit'
         script_path = Path(__file__).resolve() # Lấy đường dẫn tuyệt đối của script này
 
-        # Đảm bảo các đường dẫn được truyền vào hook là tuyệt đối hoặc script biết cách tìm
-        # Sử dụng sys.executable để gọi đúng interpreter Python
+        # Worker nền chạy với cùng cấu hình phát hiện thay đổi như lúc tạo hook
+        worker_args = [
+            '--project-path', str(self.project_path),
+            '--output-dir', os.path.relpath(self.output_dir, self.project_path),
+            '--change-detection', self.change_detection,
+            '--hash-algo', self.hasher.algorithm,
+        ]
+        if self.hasher.digest_size:
+            worker_args += ['--digest-size', str(self.hasher.digest_size)]
+        if self.paranoid:
+            worker_args.append('--paranoid')
+        # Chỉ chuyển các giá trị khác mặc định: giới hạn kích thước khác đi sẽ làm worker dựng lại toàn bộ file tổng hợp
+        for file_type, limit in sorted(self.content_size_limits.items()):
+            if self.CONTENT_SIZE_LIMITS.get(file_type) != limit:
+                worker_args += ['--size-limit', f"{file_type}={limit}"]
+        if self.hasher.workers != ContentHasher().workers:
+            worker_args += ['--hash-workers', str(self.hasher.workers)]
+        if self.graph_workers != (os.cpu_count() or 1):
+            worker_args += ['--graph-workers', str(self.graph_workers)]
+        if self.blob_cache is not None:
+            worker_args += ['--blob-cache', str(self.blob_cache.path.parent), '--blob-cache-size', str(self.blob_cache.max_bytes)]
+        if self.profiler.enabled:
+            worker_args.append('--profile') # Mỗi lần worker chạy ghi một báo cáo vào <output-dir>/profiles/
+        # Chạy dạng `-m` (thư mục script trong PYTHONPATH) để dùng bytecode đã cache trong __pycache__:
+        # chạy thẳng file .py thì mỗi lần Python đều biên dịch lại toàn bộ script.
+        worker_command = ' '.join(f'"{arg}"' for arg in [sys.executable, '-m', script_path.stem, *worker_args, '--drain-queue'])
+
+        # Hook chỉ ghi một job vào hàng đợi rồi trả về ngay; worker nền (được khóa bằng lock file)
+        # gom các job đang chờ thành một lần cập nhật theo HEAD mới nhất.
         hook_content = f"""#!/bin/sh
 # Auto-generated git hook for file tracking by GitFileTracker
-echo "GitFileTracker: Running post-commit hook..."
-cd "{self.project_path}"
-"{sys.executable}" "{script_path}" --project-path "{self.project_path}" --output-dir "{self.output_dir.name}" --check-update
-echo "GitFileTracker: Post-commit hook finished."
+# Không chạy cập nhật đồng bộ: ghi job vào hàng đợi và khởi động worker nền.
+QUEUE="{self.update_queue_file}"
+COMMIT=$(git rev-parse HEAD 2>/dev/null)
+mkdir -p "{self.output_dir}"
+export PYTHONPATH="{script_path.parent}${{PYTHONPATH:+:$PYTHONPATH}}"
+printf '{{"commit": "%s", "queued_at": %s, "source": "post-commit"}}\\n' "$COMMIT" "$(date +%s)" >> "$QUEUE"
+if command -v setsid >/dev/null 2>&1; then
+    setsid {worker_command} </dev/null >/dev/null 2>&1 &
+else
+    nohup {worker_command} </dev/null >/dev/null 2>&1 &
+fi
+exit 0
 """
         try:
             with open(hook_file, 'w', encoding='utf-8') as f:
@@ -1083,60 +3899,295 @@ echo "GitFileTracker: Post-commit hook finished."
         except Exception as e:
             self.logger.error(f"Không thể tạo git hook: {e}")
 
-    def _find_file_with_extension(self, potential_path: Path) -> Path | None:
+    # ===== START: BACKGROUND UPDATE QUEUE =====
+    def _claim_queued_jobs(self) -> tuple[List[Dict[str, Any]], List[Path]]:
         """
-        Tìm file thực tế bằng cách thử các extension phổ biến (.ts, .tsx, .js, /index.ts, etc.)
+        Lấy toàn bộ job đang chờ (phải giữ lock). File hàng đợi được đổi tên trước khi đọc nên hook
+        có thể tiếp tục ghi job mới vào file mới; file đã claim còn sót từ worker bị crash cũng được xử lý lại.
         """
-        extensions_to_try = ['.ts', '.tsx', '.js', '.jsx', '.json']
-        # 1. Thử với đường dẫn gốc (nếu nó đã có extension)
-        if potential_path.exists() and potential_path.is_file():
-            return potential_path
-
-        # 2. Thử thêm các extension
-        for ext in extensions_to_try:
-            path_with_ext = potential_path.with_suffix(ext)
-            if path_with_ext.exists() and path_with_ext.is_file():
-                return path_with_ext
-
-        # 3. Thử trường hợp là thư mục (import file index)
-        if potential_path.is_dir():
-            for ext in extensions_to_try:
-                index_file = potential_path / f"index{ext}"
-                if index_file.exists() and index_file.is_file():
-                    return index_file
-        
-        # self.logger.debug(f"Không thể giải quyết đường dẫn import: {potential_path}")
-        return None
+        queue_file = self.update_queue_file
+        claimed_file = queue_file.with_name(f"{queue_file.name}.{os.getpid()}.claimed")
+        try:
+            os.replace(queue_file, claimed_file)
+        except FileNotFoundError:
+            pass
+        claimed_files = sorted(queue_file.parent.glob(f"{queue_file.name}.*.claimed"))
+        jobs: List[Dict[str, Any]] = []
+        for path in claimed_files:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        try:
+                            jobs.append(json.loads(line))
+                        except ValueError:
+                            self.logger.warning(f"Bỏ qua job hỏng trong hàng đợi: {line.strip()!r}")
+            except OSError as e:
+                self.logger.warning(f"Không đọc được file hàng đợi {path}: {e}")
+        return jobs, claimed_files
+
+    def _record_queue_run(self, record: Dict[str, Any]):
+        """Ghi thời gian chạy của worker (mỗi lần cập nhật một dòng JSON) để theo dõi chi phí của hook."""
+        try:
+            with open(self.update_runs_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        except OSError as e:
+            self.logger.warning(f"Không ghi được lịch sử chạy worker: {e}")
+
+    def _reset_run_state(self):
+        """Bỏ cache của lần chạy trước để worker nền thấy HEAD/index/working tree mới nhất."""
+        self._snapshot = None
+        self._import_graph_synced = False
+        self._clear_resolve_caches()
+
+    def drain_queue(self):
+        """
+        Worker nền của post-commit hook. Chỉ một worker chạy tại một thời điểm (flock trên lock file);
+        worker khác thấy lock bị giữ thì thoát ngay vì job của nó sẽ được worker đang chạy xử lý.
+        Mọi job đang chờ được gộp thành một lần check_and_update theo HEAD hiện tại.
+        """
+        if fcntl is None:
+            self.logger.warning("Không có fcntl: xử lý hàng đợi không có khóa.")
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.update_lock_file, 'a+') as lock_handle:
+            while True:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(lock_handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        self.logger.info("Đã có worker khác đang xử lý hàng đợi. Thoát.")
+                        return
+                try:
+                    self._drain_claimed_jobs()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_handle.fileno(), fcntl.LOCK_UN)
+                # Job được ghi sau lần kiểm tra cuối nhưng trước khi nhả lock sẽ không có worker nào nhận
+                # (worker mới đã thoát vì thấy lock bị giữ), nên kiểm tra lại sau khi nhả lock.
+                if not self.update_queue_file.exists() or self.update_queue_file.stat().st_size == 0:
+                    return
+
+    def _drain_claimed_jobs(self):
+        first_round = True
+        while True:
+            jobs, claimed_files = self._claim_queued_jobs()
+            if not jobs:
+                for path in claimed_files:
+                    path.unlink(missing_ok=True)
+                return
+            if not first_round:
+                self._reset_run_state()
+            first_round = False
+
+            queued_times = [job.get('queued_at') for job in jobs if isinstance(job.get('queued_at'), (int, float))]
+            started_at = time.time()
+            started = time.perf_counter()
+            git_calls_before = self.git_call_count
+            self.logger.info(f"Worker nền: gộp {len(jobs)} job (commit cuối trong hàng đợi: {jobs[-1].get('commit')}) thành một lần cập nhật.")
+            error = None
+            try:
+                self.check_and_update()
+            except Exception as e: # Ghi nhận lỗi và bỏ job để không lặp lại vô hạn
+                error = str(e)
+                self.logger.error(f"Worker nền cập nhật thất bại: {e}")
+            for path in claimed_files:
+                path.unlink(missing_ok=True)
+            self._record_queue_run({
+                'started_at': datetime.fromtimestamp(started_at).isoformat(),
+                'duration_s': round(time.perf_counter() - started, 3),
+                'jobs': len(jobs),
+                'queued_commits': [job.get('commit') for job in jobs],
+                'processed_commit': self.metadata.get('last_commit'),
+                'max_wait_s': round(started_at - min(queued_times), 3) if queued_times else None,
+                'git_calls': self.git_call_count - git_calls_before,
+                'error': error,
+            })
+    # ===== END: BACKGROUND UPDATE QUEUE =====
+
+    def _extract_import_specifiers(self, file_path: Path) -> List[str]:
+        """
+        Đọc một file và trả về các chuỗi import (specifier) thô theo thứ tự xuất hiện, không trùng lặp.
+        """
+        return extract_import_specifiers(self.read_file_content(file_path))
 
     def _extract_imports_from_file(self, file_path: Path) -> Set[Path]:
         """
         Đọc một file và trích xuất tất cả các file nó import.
         """
         resolved_imports: Set[Path] = set()
-        if not file_path.exists() or not file_path.is_file():
+        if not self.content_source.is_file(str(file_path)):
             return resolved_imports
 
-        content = self.read_file_content(file_path)
-        
-        # Regex để tìm 'from "./path"' hoặc require("./path")
-        # Bao gồm cả dấu ' và "
-        import_regex = re.compile(r"(?:import|export)[\s\S]*?from\s*['\"](.*?)['\"]|require\s*\(\s*['\"](.*?)['\"]\s*\)")
-        
-        matches = import_regex.finditer(content)
-        for match in matches:
-            # Match.group(1) cho from '...', match.group(2) cho require('...')
-            import_str = match.group(1) or match.group(2)
-            if import_str:
-                resolved_path = self._resolve_import_path(file_path, import_str)
-                if resolved_path and resolved_path.is_file():
-                    resolved_imports.add(resolved_path)
+        for import_str in self._extract_import_specifiers(file_path):
+            resolved_path = self._resolve_import_path(file_path, import_str)
+            if resolved_path:
+                resolved_imports.add(resolved_path)
 
         return resolved_imports
 
+    # ===== START: IMPORT GRAPH INDEX =====
+    def _relative_posix(self, full_path: Path) -> str | None:
+        """Đường dẫn tương đối (dùng '/') so với project_path, hoặc None nếu nằm ngoài dự án."""
+        try:
+            return full_path.relative_to(self.project_path).as_posix()
+        except ValueError:
+            return None
+
+    @profiled('resolve')
+    def _resolve_specifiers(self, file_path_str: str, specifiers: List[str]) -> tuple[List[str], List[str]]:
+        """
+        Resolve các specifier của một file thành đường dẫn tương đối của các file trong dự án.
+        Trả về (imports, các khóa đường dẫn mà specifier chưa resolve được đang chờ).
+        """
+        importer_path = self.project_path / file_path_str
+        imports: Dict[str, None] = {}
+        unresolved: Dict[str, None] = {}
+        for import_str in specifiers:
+            resolved_path = self._resolve_import_path(importer_path, import_str)
+            if resolved_path:
+                resolved_rel = self._relative_posix(resolved_path)
+                if resolved_rel:
+                    imports[resolved_rel] = None
+            else:
+                unresolved.update(dict.fromkeys(self.resolver.unresolved_keys(importer_path, import_str)))
+        return list(imports), list(unresolved)
+
+    def _graph_files(self, file_hashes: Dict[str, str]) -> Dict[str, str]:
+        """Lọc ra các file script (được quét import) cùng hash nội dung của chúng."""
+        return {f: h for f, h in file_hashes.items() if f.lower().endswith(self.graph_extensions)}
+
+    # Dưới ngưỡng này, chi phí khởi động process pool lớn hơn lợi ích nên quét tuần tự
+    PARALLEL_SCAN_MIN_FILES = 64
+
+    @profiled('scan_imports')
+    def _scan_import_specifiers(self, files: List[str], file_hashes: Dict[str, str] | None = None) -> Dict[str, List[str]]:
+        """
+        Trích xuất specifier cho nhiều file. Khi có blob cache và hash của file, specifier được lấy
+        từ cache trước; file trượt cache được quét rồi lưu lại (khi quét tuần tự). Khi đủ nhiều file,
+        chia lô và chạy trên ProcessPoolExecutor; nếu không tạo được process pool thì quay về quét tuần tự.
+        """
+        results: Dict[str, List[str]] = {}
+        if self.blob_cache is not None and file_hashes:
+            pending: List[str] = []
+            for file_path_str in files:
+                specifiers = self._cached_import_specifiers(file_path_str, file_hashes[file_path_str])
+                if specifiers is None:
+                    pending.append(file_path_str)
+                else:
+                    results[file_path_str] = specifiers
+            files = pending
+        workers = min(self.graph_workers, len(files) // 16 or 1)
+        # Với `--at`, nội dung đến từ tiến trình cat-file của lần chạy này nên không chia cho process pool được
+        if workers > 1 and self.revision is None and len(files) >= self.PARALLEL_SCAN_MIN_FILES:
+            # Nhiều lô nhỏ hơn số worker một chút để cân bằng tải giữa các tiến trình
+            batch_size = max(16, math.ceil(len(files) / (workers * 4)))
+            batches = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+            try:
+                # Chỉ nạp khi cần: concurrent.futures.process kéo theo cả multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    for records in executor.map(scan_import_batch, [str(self.project_path)] * len(batches), batches):
+                        results.update(records)
+                self.profiler.count('files_scanned_in_pool', len(files)) # Được đọc trong tiến trình con
+                self.logger.info(f"Quét import song song: {len(files)} file, {len(batches)} lô, {workers} tiến trình.")
+                return results
+            except (OSError, NotImplementedError, RuntimeError) as e:
+                # BrokenProcessPool là lớp con của RuntimeError
+                self.logger.warning(f"Không chạy được process pool ({e}). Quét import tuần tự.")
+        for file_path_str in files:
+            full_path = self.project_path / file_path_str
+            if self.blob_cache is not None and file_hashes:
+                try:
+                    data = self.content_source.read_bytes(str(full_path))
+                except OSError:
+                    results[file_path_str] = self._extract_import_specifiers(full_path) # Ghi log như trước
+                    continue
+                self._count_read(len(data))
+                results[file_path_str] = self._cache_blob(full_path, data, file_hashes[file_path_str]).imports
+            else:
+                results[file_path_str] = self._extract_import_specifiers(full_path)
+        return results
+
+    def load_import_graph(self) -> ImportGraphIndex:
+        if self._import_graph is None:
+            self._import_graph = ImportGraphIndex.load(self.import_graph_file, self._hash_algorithm_label())
+        return self._import_graph
+
+    @profiled('import_graph')
+    def update_import_graph(self, file_hashes: Dict[str, str], reresolve_all: bool = False,
+                            renames: Dict[str, str] | None = None) -> ImportGraphIndex:
+        """
+        Đồng bộ import graph với hash hiện tại của các file tracked. Chỉ những file có hash khác
+        với index (thay đổi/mới) mới bị đọc lại; file đã xóa bị gỡ khỏi index. Khi có file được
+        thêm/xóa, các file liên quan được resolve lại từ specifier đã lưu mà không cần đọc lại.
+        reresolve_all=True (ví dụ khi tsconfig đổi) resolve lại mọi file từ specifier đã lưu.
+        renames (mới -> cũ): node được chuyển sang đường dẫn mới thay vì gỡ rồi quét lại.
+        """
+        graph = self.load_import_graph()
+        current_files = self._graph_files(file_hashes)
+
+        to_reresolve: Set[str] = set()
+        renamed_files: List[str] = []
+        for new_path, old_path in (renames or {}).items():
+            if old_path in graph.nodes and new_path not in graph.nodes and new_path in current_files:
+                to_reresolve.update(graph.rename_file(old_path, new_path))
+                to_reresolve.add(new_path)
+                renamed_files.append(new_path)
+
+        deleted_files = [f for f in graph.nodes if f not in current_files]
+        changed_files = sorted(f for f, h in current_files.items() if graph.nodes.get(f, {}).get('hash') != h)
+        added_files = [f for f in changed_files if f not in graph.nodes]
+
+        for file_path_str in deleted_files:
+            graph.remove_file(file_path_str)
+
+        scanned_specifiers = self._scan_import_specifiers(changed_files, current_files)
+        for file_path_str in changed_files:
+            specifiers = scanned_specifiers[file_path_str]
+            graph.set_file(file_path_str, current_files[file_path_str], specifiers,
+                           *self._resolve_specifiers(file_path_str, specifiers))
+
+        # Thêm/xóa/đổi tên file có thể làm thay đổi kết quả resolve của các file khác: file mới chỉ ảnh hưởng
+        # các file có specifier chưa resolve chờ đúng đường dẫn của nó, file bị xóa chỉ ảnh hưởng các file import nó
+        if reresolve_all:
+            to_reresolve.update(graph.nodes)
+        else:
+            for file_path_str in added_files + renamed_files:
+                to_reresolve.update(graph.files_waiting_for(ModuleResolver.keys_for_file(file_path_str)))
+            for file_path_str in deleted_files:
+                to_reresolve.update(graph.usages_of(file_path_str))
+        for file_path_str in to_reresolve.difference(changed_files):
+            if file_path_str in graph.nodes:
+                graph.set_imports(file_path_str,
+                                  *self._resolve_specifiers(file_path_str, graph.nodes[file_path_str]['specifiers']))
+
+        if graph.dirty:
+            graph.save()
+        self.profiler.count('graph_files_scanned', len(changed_files))
+        self.profiler.count('graph_files_reresolved', len(to_reresolve.difference(changed_files)))
+        self.logger.info(f"Import graph: {len(changed_files)} file được quét lại, {len(deleted_files)} file bị gỡ, "
+                         f"{len(renamed_files)} file đổi tên, "
+                         f"tổng {len(graph.nodes)} file trong index.")
+        if self.resolver.hits or self.resolver.misses:
+            self.logger.info(self.resolver.summary())
+        return graph
+
+    def ensure_import_graph(self) -> ImportGraphIndex:
+        """Trả về import graph đã đồng bộ với working tree hiện tại (dùng stat cache để tránh hash lại)."""
+        if self._import_graph is not None and self._import_graph_synced:
+            return self._import_graph
+        script_files = [f for f in self.get_tracked_files() if f.lower().endswith(self.graph_extensions)]
+        file_hashes, _ = self._collect_file_hashes(script_files)
+        graph = self.update_import_graph(file_hashes)
+        self._import_graph_synced = True
+        return graph
+
     def _find_dependencies_recursively(self, start_file: Path, all_project_files_abs: Set[Path]) -> Set[Path]:
         """
-        Tìm tất cả các file mà start_file phụ thuộc vào, một cách đệ quy.
+        Tìm tất cả các file mà start_file phụ thuộc vào, một cách đệ quy (đọc từ import graph).
         """
+        graph = self.ensure_import_graph()
         to_visit = [start_file]
         visited: Set[Path] = set()
 
@@ -1144,49 +4195,172 @@ echo "GitFileTracker: Post-commit hook finished."
             current_file = to_visit.pop()
             if current_file in visited:
                 continue
-            
+
             # Chỉ xử lý các file nằm trong dự án
             if current_file not in all_project_files_abs:
                 continue
 
             visited.add(current_file)
-            
-            imports = self._extract_imports_from_file(current_file)
-            for imp in imports:
+
+            current_rel = self._relative_posix(current_file)
+            for imported_rel in graph.dependencies_of(current_rel) if current_rel else []:
+                imp = self.project_path / imported_rel
                 if imp not in visited:
                     to_visit.append(imp)
-        
+
         return visited
 
     def _find_usages(self, target_file: Path, all_project_files_abs: Set[Path]) -> Set[Path]:
         """
-        Tìm tất cả các file trong dự án mà đang import `target_file`.
+        Tìm tất cả các file trong dự án mà đang import `target_file` (đọc reverse edges từ import graph).
         """
-        usages: Set[Path] = set()
         self.logger.info(f"Bắt đầu tìm kiếm usages cho file: {target_file.relative_to(self.project_path)}")
-        for file_to_scan in all_project_files_abs:
-            if file_to_scan == target_file:
-                continue
-            
-            imports = self._extract_imports_from_file(file_to_scan)
-            if target_file in imports:
-                usages.add(file_to_scan)
-        
+        graph = self.ensure_import_graph()
+        target_rel = self._relative_posix(target_file)
+        usages: Set[Path] = set()
+        for importer_rel in graph.usages_of(target_rel) if target_rel else set():
+            importer_path = self.project_path / importer_rel
+            if importer_path != target_file and importer_path in all_project_files_abs:
+                usages.add(importer_path)
         return usages
+    # ===== END: IMPORT GRAPH INDEX =====
 
-    def merge_dependencies_for_file(self, target_file_str: str):
+    def merge_dependencies_for_file(self, target_file_str: str, budget: tuple[int, str] | None = None):
         """
         Chức năng chính: tìm dependencies, usages và gộp tất cả lại.
         """
-        target_file_path = (self.project_path / target_file_str).resolve()
+        self.merge_dependencies_for_files([target_file_str], budget)
 
-        if not target_file_path.is_file():
+    # ----- Bundle theo ngân sách (--budget) -----
+    def _rank_related_files(self, target_file_str: str, related_files: List[str]) -> List[tuple[str, str, int]]:
+        """
+        Xếp hạng các file liên quan: file đích, rồi dependencies theo khoảng cách import tăng dần,
+        rồi usages (file import trực tiếp file đích). Trả về (path, quan hệ, khoảng cách).
+        """
+        graph = self.ensure_import_graph()
+        target_rel = self._relative_posix(Path(os.path.normpath(self.project_path / target_file_str)))
+        related = set(related_files)
+        distances: Dict[str, int] = {}
+        if target_rel in related:
+            distances[target_rel] = 0
+            frontier = [target_rel]
+            while frontier:
+                next_frontier = []
+                for path in frontier:
+                    for imported in graph.dependencies_of(path):
+                        if imported in related and imported not in distances:
+                            distances[imported] = distances[path] + 1
+                            next_frontier.append(imported)
+                frontier = next_frontier
+        ranked = [(path, 'target' if distance == 0 else 'dependency', distance)
+                  for path, distance in sorted(distances.items(), key=lambda item: (item[1], item[0]))]
+        ranked += [(path, 'usage', 1) for path in related_files if path not in distances]
+        return ranked
+
+    def _estimate_section_costs(self, files: List[str]) -> Dict[str, tuple[int, int]]:
+        """
+        Ước lượng (byte, token) của section mỗi file trong file gộp. Số liệu của phần nội dung lấy từ
+        blob cache, hoặc từ metadata['file_costs'] nếu hash còn khớp; file chưa có ước lượng được đọc
+        một lần và ước lượng mới được lưu vào metadata. File vượt giới hạn kích thước chỉ tính dòng stub.
+        Token được đếm bằng count_tokens (xấp xỉ, không phải tokenizer của một model cụ thể).
+        """
+        graph = self.ensure_import_graph()
+        hashes = {f: graph.nodes[f]['hash'] for f in files if f in graph.nodes}
+        other_files = [f for f in files if f not in hashes]
+        if other_files:
+            hashes.update(self._collect_file_hashes(other_files)[0])
+        costs_current = self.metadata.get('file_costs_version') == TOKEN_ESTIMATE_VERSION
+        cached_costs = self.metadata.get('file_costs', {}) if costs_current else {}
+        snapshot = self.get_snapshot()
+        new_costs: Dict[str, List] = {}
+        estimates: Dict[str, tuple[int, int]] = {}
+        for file_path_str in files:
+            full_path = self.project_path / file_path_str
+            content_hash = hashes.get(file_path_str)
+            size = snapshot.size(file_path_str)
+            size_limit = self._content_size_limit(self.get_file_type(file_path_str))
+            stub = None
+            if size is None:
+                stub = f"# Reason: Not found or not a regular file at checked path '{full_path}'\n"
+            elif size > size_limit:
+                stub = self._omitted_file_stub('LARGE_FILE_OMITTED', full_path, size, content_hash,
+                                               f" > {self._format_size(size_limit)} limit")
+            else:
+                cost = None # [hash, byte, token]; token None nghĩa là file nhị phân
+                cached_blob = self.blob_cache.get(self._blob_key(content_hash)) if self.blob_cache and content_hash else None
+                if cached_blob is not None:
+                    cost = [content_hash, cached_blob.size, None if cached_blob.binary else cached_blob.tokens]
+                elif content_hash and (cached_costs.get(file_path_str) or [None])[0] == content_hash:
+                    cost = cached_costs[file_path_str]
+                else:
+                    try:
+                        data = self.content_source.read_bytes(str(full_path))
+                    except OSError:
+                        data = b''
+                    self._count_read(len(data))
+                    if self.blob_cache is not None and content_hash:
+                        info = self._cache_blob(full_path, data, content_hash)
+                        cost = [content_hash, info.size, None if info.binary else info.tokens]
+                    else:
+                        binary = looks_binary(data[:BINARY_SNIFF_SIZE])
+                        cost = [content_hash, len(data), None if binary else count_tokens(decode_text(data))]
+                    if content_hash:
+                        new_costs[file_path_str] = cost
+                if cost[2] is None:
+                    stub = self._omitted_file_stub('BINARY_FILE_OMITTED', full_path, cost[1], content_hash)
+                else:
+                    body_bytes, body_tokens = cost[1], cost[2]
+            if stub is not None:
+                body_bytes, body_tokens = len(stub.encode('utf-8')), count_tokens(stub)
+            frame = ''.join(self._section_frame(file_path_str))
+            estimates[file_path_str] = (body_bytes + len(frame.encode('utf-8')), body_tokens + count_tokens(frame))
+        if new_costs:
+            if not costs_current: # Ước lượng đếm theo cách cũ: bỏ hết thay vì trộn lẫn
+                self.metadata['file_costs'] = {}
+            self.metadata.setdefault('file_costs', {}).update(new_costs)
+            self.metadata['file_costs_version'] = TOKEN_ESTIMATE_VERSION
+            try:
+                self.metadata_store.save_file_costs(new_costs, TOKEN_ESTIMATE_VERSION, replace=not costs_current)
+            except (OSError, sqlite3.Error) as e:
+                self.logger.warning(f"Không lưu được ước lượng kích thước vào metadata: {e}")
+        self.logger.info(f"Ước lượng kích thước: {len(files)} file, {len(new_costs)} file phải đọc để đo.")
+        return estimates
+
+    def _apply_budget(self, target_file_str: str, related_files: List[str], budget: tuple[int, str],
+                      estimates: Dict[str, tuple[int, int]]) -> tuple[List[str], List[str], List[str]]:
+        """
+        Chọn file theo thứ hạng cho đến khi chạm ngân sách; file đích luôn được giữ. Trả về
+        (file được giữ theo thứ hạng, dòng ghi chú cho header, dòng liệt kê file bị cắt).
+        """
+        limit, unit = budget
+        unit_index = 0 if unit == 'bytes' else 1
+        kept: List[str] = []
+        cut: List[tuple[str, str, int]] = []
+        used = 0
+        for path, relation, distance in self._rank_related_files(target_file_str, related_files):
+            cost = estimates[path][unit_index]
+            if cut or (used + cost > limit and relation != 'target'):
+                cut.append((path, relation, distance))
+                continue
+            kept.append(path)
+            used += cost
+        header_lines = [f"# Budget: {limit} {unit} (ước lượng đã dùng: {used} {unit}; giữ {len(kept)}/{len(related_files)} file, "
+                        f"xếp theo khoảng cách import, dependencies trước usages)"]
+        if used > limit:
+            header_lines.append(f"# Chú ý: riêng file đích đã vượt ngân sách.")
+        cut_lines = [f"#   - {path} ({relation}, khoảng cách {distance}, ~{estimates[path][unit_index]} {unit})"
+                     for path, relation, distance in cut]
+        self.logger.info(f"Budget {limit} {unit} cho '{target_file_str}': giữ {len(kept)}/{len(related_files)} file "
+                         f"(~{used} {unit}), cắt {len(cut)} file.")
+        return kept, header_lines, cut_lines
+
+    def _related_files(self, target_file_str: str, all_tracked_files_abs: Set[Path]) -> List[str] | None:
+        """Dependencies (kể cả file gốc) và usages của một file đích, dạng đường dẫn tương đối đã sắp xếp; None nếu file không tồn tại."""
+        target_file_path = Path(os.path.normpath(self.project_path / target_file_str))
+
+        if not self.content_source.is_file(str(target_file_path)):
             self.logger.error(f"File đích không tồn tại: {target_file_path}")
-            return
-
-        self.logger.info("Bắt đầu thu thập danh sách file trong dự án...")
-        all_tracked_files_relative = self.get_tracked_files()
-        all_tracked_files_abs = { (self.project_path / f).resolve() for f in all_tracked_files_relative }
+            return None
 
         self.logger.info(f"1. Tìm các file phụ thuộc (dependencies) của '{target_file_str}'...")
         dependencies = self._find_dependencies_recursively(target_file_path, all_tracked_files_abs)
@@ -1200,32 +4374,274 @@ echo "GitFileTracker: Post-commit hook finished."
         all_related_files_abs = dependencies.union(usages)
         
         # Chuyển đổi lại thành đường dẫn tương đối để gộp file
-        all_related_files_relative = sorted([
+        return sorted([
             str(p.relative_to(self.project_path)).replace('\\', '/') for p in all_related_files_abs
         ])
-        
-        if not all_related_files_relative:
-            self.logger.warning("Không tìm thấy file liên quan nào.")
+
+    @profiled('affected')
+    def affected_files(self, revision_range: str, max_depth: int | None = None, bundle: bool = False) -> Dict[str, Any] | None:
+        """
+        Tập file bị ảnh hưởng (bắc cầu) bởi một khoảng commit: lấy file thay đổi từ `git diff` của
+        revision_range ('base..head', 'base...head', hoặc 'base' để so với working tree), rồi đi ngược
+        các cạnh import trong import graph. Kết quả nhóm theo độ sâu được ghi ra affected-<range>.json;
+        bundle=True gộp mọi file bị ảnh hưởng (theo độ sâu) vào affected-<range>.merged.txt.
+        Import graph là của working tree (hoặc của revision khi chạy với `--at`).
+        """
+        changes = self.collect_changes(revision_range)
+        if changes is None:
+            self.logger.error(f"Không lấy được danh sách thay đổi của '{revision_range}'.")
+            return None
+        seeds: Dict[str, None] = {}
+        for change in changes:
+            seeds[change.path] = None
+            if change.old_path: # File import đường dẫn cũ cũng bị ảnh hưởng bởi việc đổi tên
+                seeds[change.old_path] = None
+
+        graph = self.ensure_import_graph()
+        depths, via = graph.affected_by(list(seeds), max_depth)
+        by_depth: Dict[int, List[str]] = {}
+        for path, depth in depths.items():
+            by_depth.setdefault(depth, []).append(path)
+        ordered = [path for depth in sorted(by_depth) for path in sorted(by_depth[depth])]
+
+        report = {
+            'range': revision_range,
+            'commit': self.get_current_commit(),
+            'max_depth': max_depth,
+            'changed': [{'status': c.status, 'path': c.path, **({'old_path': c.old_path} if c.old_path else {})} for c in changes],
+            'affected_by_depth': {str(depth): sorted(paths) for depth, paths in sorted(by_depth.items())},
+            'via': dict(sorted(via.items())),
+            'total': len(ordered),
+        }
+        report_name = 'affected-' + re.sub(r'[^\w.-]', '_', revision_range)
+        report_file = self.output_dir / f"{report_name}.json"
+        with AtomicOutputWriter(report_file) as writer:
+            writer.write_text(json.dumps(report, ensure_ascii=False, indent=2) + '\n')
+        self.logger.info(f"Affected '{revision_range}': {len(changes)} file thay đổi, {len(ordered)} file bị ảnh hưởng "
+                         f"({', '.join(f'độ sâu {d}: {len(p)}' for d, p in sorted(by_depth.items())) or 'không có'}). "
+                         f"Kết quả: {report_file}")
+
+        # File đã xóa / đổi tên đi chỉ dùng làm điểm xuất phát (và còn trong 'changed' của report),
+        # không được in ra hay gộp vì không còn tồn tại
+        existing = [path for path in ordered if self.content_source.is_file(str(self.project_path / path))]
+        if bundle:
+            if existing:
+                self.merge_specific_files(existing, output_filename=f"{report_name}.merged.txt")
+            else:
+                self.logger.warning("Không có file bị ảnh hưởng nào còn tồn tại để gộp.")
+        for path in existing: # Mỗi dòng một đường dẫn (stdout) để dùng trực tiếp trong CI
+            print(path)
+        return report
+
+    def _deps_output_filenames(self, target_file_strs: List[str]) -> Dict[str, str]:
+        """
+        Tên file gộp cho từng file đích: deps-<tên_file>.merged.txt. Nếu nhiều đích trùng tên file
+        (ví dụ nhiều index.ts), các đích đó dùng cả đường dẫn để không ghi đè lên nhau.
+        """
+        names = {target: f"deps-{Path(target).name.replace('.', '_')}.merged.txt" for target in target_file_strs}
+        duplicated = {name for name in names.values() if list(names.values()).count(name) > 1}
+        for target, name in names.items():
+            if name in duplicated:
+                flattened = re.sub(r'[^\w-]', '_', os.path.normpath(target).replace(os.sep, '/'))
+                names[target] = f"deps-{flattened}.merged.txt"
+        return names
+
+    # Số thread ghi các file gộp song song khi merge-deps cho nhiều file đích
+    MERGE_WRITE_WORKERS = 8
+
+    @profiled('merge_deps')
+    def merge_dependencies_for_files(self, target_file_strs: List[str], budget: tuple[int, str] | None = None):
+        """
+        Gộp dependencies + usages cho nhiều file đích trong một lần chạy. Danh sách file và import graph
+        được dựng một lần cho mọi đích. Mỗi file liên quan chỉ được đọc và render một lần vào một file
+        section tạm; các file gộp sau đó được ghi song song bằng cách copy section từ file tạm
+        (copy_file_range, trong kernel). Nội dung mỗi file gộp giống hệt khi chạy riêng từng đích.
+        budget (giới hạn, 'tokens'|'bytes'): mỗi file gộp chỉ giữ các file xếp hạng cao nhất vừa ngân sách
+        (xem _apply_budget), theo thứ hạng thay vì theo tên, và liệt kê các file bị cắt ở cuối.
+        """
+        self.logger.info("Bắt đầu thu thập danh sách file trong dự án...")
+        all_tracked_files_relative = self.get_tracked_files()
+        all_tracked_files_abs = { self.project_path / f for f in all_tracked_files_relative }
+
+        bundles: Dict[str, List[str]] = {}
+        for target_file_str in dict.fromkeys(target_file_strs):
+            related_files = self._related_files(target_file_str, all_tracked_files_abs)
+            if related_files is None:
+                continue
+            if not related_files:
+                self.logger.warning(f"Không tìm thấy file liên quan nào cho '{target_file_str}'.")
+                continue
+            bundles[target_file_str] = related_files
+        if not bundles:
+            return
+        output_filenames = self._deps_output_filenames(list(bundles))
+
+        header_lines: Dict[str, List[str]] = {}
+        cut_lines: Dict[str, List[str]] = {}
+        if budget is not None:
+            estimates = self._estimate_section_costs(sorted(set().union(*bundles.values())))
+            for target_file_str, related_files in bundles.items():
+                bundles[target_file_str], header_lines[target_file_str], cut_lines[target_file_str] = \
+                    self._apply_budget(target_file_str, related_files, budget, estimates)
+        elif len(bundles) == 1:
+            target_file_str, related_files = next(iter(bundles.items()))
+            self.logger.info(f"Tổng cộng có {len(related_files)} file liên quan. Bắt đầu gộp...")
+            self.merge_specific_files(related_files, output_filename=output_filenames[target_file_str])
             return
 
-        self.logger.info(f"Tổng cộng có {len(all_related_files_relative)} file liên quan. Bắt đầu gộp...")
-        
-        output_filename = f"deps-{Path(target_file_str).name.replace('.', '_')}.merged.txt"
-        self.merge_specific_files(all_related_files_relative, output_filename=output_filename)            
+        unique_files = sorted(set().union(*bundles.values()))
+        valid_paths = {f for f in unique_files if self.content_source.is_file(str(self.project_path / f))}
+        for target_file_str in [t for t, files in bundles.items() if valid_paths.isdisjoint(files)]:
+            self.logger.warning(f"Không có file hợp lệ nào để gộp cho '{target_file_str}'. File gộp sẽ không được tạo/cập nhật.")
+            del bundles[target_file_str]
+        self.logger.info(f"Gộp deps cho {len(bundles)} file đích: {len(unique_files)} file khác nhau, "
+                         f"{sum(len(files) for files in bundles.values())} section cần ghi.")
 
-    def status(self):
+        sections_file = self.output_dir / f".deps-sections.{os.getpid()}.tmp"
+        sections: Dict[str, tuple[int, int]] = {}
+        try:
+            with AtomicOutputWriter(sections_file) as writer:
+                for file_path_str in unique_files:
+                    section_start = writer.position
+                    self._write_merge_entry(writer, file_path_str, file_path_str in valid_paths)
+                    sections[file_path_str] = (section_start, writer.position - section_start)
+
+            with open(sections_file, 'rb') as sections_handle:
+                def write_bundle(target_file_str: str) -> Path:
+                    related_files = bundles[target_file_str]
+                    output_file = self.output_dir / output_filenames[target_file_str]
+                    with AtomicOutputWriter(output_file) as bundle_writer:
+                        bundle_writer.write_text(self._merged_header(len(related_files), header_lines.get(target_file_str)))
+                        for file_path_str in related_files:
+                            bundle_writer.copy_range(sections_handle.fileno(), *sections[file_path_str])
+                        if cut_lines.get(target_file_str):
+                            bundle_writer.write_text('\n'.join(["", f"# Bị cắt do vượt ngân sách ({len(cut_lines[target_file_str])} file):",
+                                                                 *cut_lines[target_file_str], ""]))
+                    return output_file
+
+                with ThreadPoolExecutor(max_workers=min(self.MERGE_WRITE_WORKERS, len(bundles))) as executor:
+                    futures = {target: executor.submit(write_bundle, target) for target in bundles}
+                for target_file_str, future in futures.items():
+                    try:
+                        output_file = future.result()
+                        self.logger.info(f"✅ Đã gộp {len(bundles[target_file_str])} file liên quan của '{target_file_str}' vào: {output_file}")
+                    except OSError as e:
+                        self.logger.error(f"❌ Lỗi khi ghi file gộp cho '{target_file_str}': {e}")
+        except OSError as e:
+            self.logger.error(f"❌ Lỗi khi chuẩn bị nội dung để gộp deps: {e}")
+        finally:
+            sections_file.unlink(missing_ok=True)
+
+    # ===== START: STATUS SUMMARY =====
+    @staticmethod
+    def _file_fingerprint(path: Path) -> List[List]:
+        """(tên, mtime_ns, size) của file metadata và WAL đi kèm nếu có, để nhận ra metadata bị ghi sau bản tóm tắt."""
+        fingerprint = []
+        for candidate in (path, path.with_name(path.name + '-wal')):
+            try:
+                st = os.stat(candidate)
+            except OSError:
+                continue
+            fingerprint.append([candidate.name, st.st_mtime_ns, st.st_size])
+        return fingerprint
+
+    @classmethod
+    def load_status_summary(cls, output_dir: Path) -> Dict[str, Any] | None:
+        """
+        Đọc bản tóm tắt trạng thái trong output_dir. Trả về None nếu chưa có, khác phiên bản, hoặc file
+        metadata đã bị ghi sau lúc tóm tắt (ví dụ lần chạy bị ngắt giữa chừng): khi đó phải tính lại.
+        """
+        try:
+            with open(output_dir / cls.STATUS_SUMMARY_NAME, 'r', encoding='utf-8') as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(summary, dict) or summary.get('version') != cls.STATUS_SUMMARY_VERSION:
+            return None
+        if cls._file_fingerprint(output_dir / summary['metadata_file']) != summary.get('metadata_fingerprint'):
+            return None
+        return summary
+
+    def _metadata_status(self) -> Dict[str, Any]:
+        """
+        Phần số liệu lấy từ metadata của bản tóm tắt. Lần chạy không đọc metadata (ví dụ chỉ gộp file)
+        dùng lại số liệu của bản tóm tắt trước nếu nó còn khớp với metadata trên đĩa.
+        """
+        if self._metadata is None:
+            previous = self.load_status_summary(self.output_dir)
+            if previous is not None:
+                return previous['metadata']
+        tracked_files = self.metadata.get('tracked_files', {})
+        return {
+            'last_commit': self.metadata.get('last_commit'),
+            'files_tracked': len(self.metadata.get('file_hashes', {})),
+            'files_by_type': {file_type: len(files) for file_type, files in tracked_files.items()}
+                             if isinstance(tracked_files, dict) else None,
+            'updated': self.metadata.get('updated'),
+        }
+
+    def _generated_files(self) -> List[str]:
+        """Các file tổng hợp trong output_dir (không tính log, metadata, index, hàng đợi)."""
+        if not self.output_dir.is_dir():
+            return []
+        internal_files = {'tracker.log', 'metadata.json', 'metadata.json.migrated', 'metadata.db', 'metadata.db-wal',
+                          'metadata.db-shm', 'import_graph.json', self.update_queue_file.name, self.update_lock_file.name,
+                          self.update_runs_file.name, self.STATUS_SUMMARY_NAME}
+        return [item.name for item in sorted(self.output_dir.iterdir()) # Sắp xếp để output nhất quán
+                if item.is_file() and item.name not in internal_files and not item.name.endswith(('.idx.json', '.claimed'))]
+
+    def _status_summary(self) -> Dict[str, Any]:
+        store = self.metadata_store
+        return {
+            'version': self.STATUS_SUMMARY_VERSION,
+            'written_at': datetime.now().isoformat(),
+            'project_path': str(self.project_path),
+            'output_dir': str(self.output_dir),
+            'metadata_file': store.path.name,
+            'metadata_backend': store.backend,
+            'metadata_fingerprint': self._file_fingerprint(store.path),
+            'metadata': self._status_metadata or self._metadata_status(),
+            'last_run': self._last_run,
+            'generated_files': self._generated_files(),
+        }
+
+    def write_status_summary(self):
+        """
+        Ghi bản tóm tắt trạng thái (status.json) cho `--status`. Gọi sau `close()`, khi metadata đã được lưu
+        và SQLite đã checkpoint WAL, để dấu vân tay của file metadata trong bản tóm tắt là bản cuối cùng.
+        """
+        summary = self._status_summary() # Liệt kê output trước khi file tạm của bản tóm tắt xuất hiện
+        with AtomicOutputWriter(self.output_dir / self.STATUS_SUMMARY_NAME) as writer:
+            writer.write_text(json.dumps(summary, indent=2, ensure_ascii=False))
+
+    @staticmethod
+    def head_commit(project_path: Path) -> str | None:
+        """`git rev-parse HEAD` cho đường `--status` nhanh, không cần dựng tracker."""
+        try:
+            result = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=project_path, capture_output=True, text=True,
+                                    check=True, env={**os.environ, 'GIT_OPTIONAL_LOCKS': '0'})
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            return None
+        return result.stdout.strip()
+
+    @classmethod
+    def print_status(cls, summary: Dict[str, Any], current_git_commit: str | None):
+        """In trạng thái từ một bản tóm tắt; riêng hàng đợi cập nhật nền được đọc trực tiếp vì hook ghi vào bất cứ lúc nào."""
+        project_path = Path(summary['project_path'])
+        output_dir = Path(summary['output_dir'])
         print("\n=== Git File Tracker Status ===")
-        print(f"Project Path: {self.project_path}")
-        print(f"Output Directory: {self.output_dir.relative_to(self.project_path)}")
-        log_file_path = self.output_dir / 'tracker.log'
-        meta_file_path = self.metadata_file
-        if log_file_path.exists(): print(f"Log File: {log_file_path.relative_to(self.project_path)}")
-        if meta_file_path.exists(): print(f"Metadata File: {meta_file_path.relative_to(self.project_path)}")
-
-        last_commit_stored = self.metadata.get('last_commit', 'None')
+        print(f"Project Path: {project_path}")
+        print(f"Output Directory: {output_dir.relative_to(project_path)}")
+        log_file_path = output_dir / 'tracker.log'
+        meta_file_path = output_dir / summary['metadata_file']
+        if log_file_path.exists(): print(f"Log File: {log_file_path.relative_to(project_path)}")
+        if meta_file_path.exists(): print(f"Metadata File: {meta_file_path.relative_to(project_path)} ({summary['metadata_backend']})")
+        print(f"Summary Written: {summary['written_at']}")
+
+        metadata = summary['metadata']
+        last_commit_stored = metadata['last_commit']
         print(f"Last Processed Commit: {last_commit_stored}")
 
-        current_git_commit = self.get_current_commit()
         if current_git_commit:
             print(f"Current Git HEAD Commit: {current_git_commit}")
             if current_git_commit != last_commit_stored:
@@ -1235,30 +4651,54 @@ echo "GitFileTracker: Post-commit hook finished."
         else:
             print("⚠️  Không thể lấy commit hiện tại từ Git.")
 
-        print(f"Total Files in Metadata Hashes: {len(self.metadata.get('file_hashes', {}))}")
+        print(f"Total Files in Metadata Hashes: {metadata['files_tracked']}")
+        last_run = summary.get('last_run')
+        if last_run:
+            print(f"Last Run: {last_run['started_at']} ({last_run['command']}, {last_run['duration_s']}s, {last_run['git_calls']} git calls)")
 
         print("\nFile Statistics (từ metadata['tracked_files']):")
-        meta_tracked_files_map = self.metadata.get('tracked_files', {})
-        if isinstance(meta_tracked_files_map, dict):
-            total_files_in_map = sum(len(files) for files in meta_tracked_files_map.values())
-            print(f"  Total files grouped by type in metadata: {total_files_in_map}")
-            for file_type, files_list in sorted(meta_tracked_files_map.items()):
-                indicator = self._get_file_type_indicator(file_type)
-                print(f"  {indicator} {file_type.capitalize()}: {len(files_list)} files")
+        files_by_type = metadata.get('files_by_type')
+        if isinstance(files_by_type, dict):
+            print(f"  Total files grouped by type in metadata: {sum(files_by_type.values())}")
+            for file_type, file_count in sorted(files_by_type.items()):
+                indicator = cls._get_file_type_indicator(file_type)
+                print(f"  {indicator} {file_type.capitalize()}: {file_count} files")
         else:
             print("  (Dữ liệu thống kê file theo loại trong metadata không có hoặc có định dạng không mong muốn)")
 
 
+        print("\nBackground Update Queue:")
+        update_queue_file = output_dir / cls.UPDATE_QUEUE_NAME
+        pending_jobs = 0
+        for queue_path in [update_queue_file, *output_dir.glob(f"{update_queue_file.name}.*.claimed")]:
+            try:
+                with open(queue_path, 'r', encoding='utf-8') as f:
+                    pending_jobs += sum(1 for line in f if line.strip())
+            except OSError:
+                pass
+        print(f"  Pending jobs: {pending_jobs}")
+        try:
+            with open(output_dir / cls.UPDATE_RUNS_NAME, 'r', encoding='utf-8') as f:
+                last_run = json.loads(f.readlines()[-1])
+            print(f"  Last worker run: {last_run.get('started_at')} ({last_run.get('duration_s')}s, "
+                  f"{last_run.get('jobs')} job gộp{', lỗi: ' + last_run['error'] if last_run.get('error') else ''})")
+        except (OSError, ValueError, IndexError):
+            print("  Last worker run: (chưa có)")
+
         print("\nGenerated Files (excluding log/metadata):")
-        generated_count = 0
-        if self.output_dir.is_dir():
-            for item in sorted(self.output_dir.iterdir()): # Sắp xếp để output nhất quán
-                if item.is_file() and item.name not in ['tracker.log', 'metadata.json']:
-                    print(f"  - {item.name}")
-                    generated_count +=1
-            if generated_count == 0: print("  (Chưa có file tổng hợp nào được tạo)")
+        if output_dir.is_dir():
+            for name in summary['generated_files']:
+                print(f"  - {name}")
+            if not summary['generated_files']: print("  (Chưa có file tổng hợp nào được tạo)")
         else: print("  (Thư mục output chưa được tạo)")
 
+    def status(self):
+        """Trạng thái tính từ metadata (khi chưa có bản tóm tắt dùng được); bản tóm tắt được ghi lại cuối lần chạy."""
+        if self._last_run is None:
+            self._last_run = self.metadata_store.last_run()
+        self.print_status(self._status_summary(), self.get_current_commit())
+    # ===== END: STATUS SUMMARY =====
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -1300,13 +4740,117 @@ def main():
     # ===== END: ARGUMENT MỚI CHO ERROR DICT =====
     action_group.add_argument('--initial-scan', action='store_true', help='Thực hiện scan ban đầu toàn bộ dự án')
     action_group.add_argument('--check-update', action='store_true', help='Kiểm tra và cập nhật thay đổi từ commit mới nhất')
-    action_group.add_argument('--status', action='store_true', help='Hiển thị trạng thái hiện tại của tracker')
+    action_group.add_argument('--status', action='store_true',
+                              help='Hiển thị trạng thái hiện tại của tracker (đọc từ status.json do lần chạy trước ghi, '
+                                   'đủ nhẹ để shell/editor gọi liên tục; chạy `python -m git_tracker` để dùng bytecode đã cache)')
     action_group.add_argument('--create-hook', action='store_true', help='Tạo/cập nhật git post-commit hook')
+    action_group.add_argument('--watch', action='store_true', help='Chạy thường trực, cập nhật output ngay khi file thay đổi')
+    action_group.add_argument('--drain-queue', action='store_true', help='(Dùng bởi git hook) Xử lý các job cập nhật đang chờ trong hàng đợi')
+    parser.add_argument(
+        '--change-detection',
+        choices=['content', 'git-oid'],
+        default='content',
+        help="Cách phát hiện thay đổi: 'content' hash nội dung file (mặc định),\n"
+             "'git-oid' lấy blob OID từ git index và chỉ hash các file đã sửa trong working tree."
+    )
+    parser.add_argument(
+        '--hash-algo',
+        choices=ContentHasher.SUPPORTED_ALGORITHMS,
+        default='md5',
+        help='Thuật toán hash nội dung file (mặc định: md5). Đổi thuật toán sẽ buộc hash lại toàn bộ.'
+    )
+    parser.add_argument('--digest-size', type=int, help='Kích thước digest (byte) cho blake2b/blake2s.')
+    parser.add_argument('--hash-workers', type=int, help='Số thread dùng để hash song song (1 = tuần tự).')
+    parser.add_argument('--graph-workers', type=int, help='Số tiến trình quét import khi build import graph (1 = tuần tự).')
+    parser.add_argument(
+        '--paranoid',
+        action='store_true',
+        help='Bỏ qua stat cache và hash lại toàn bộ file khi kiểm tra thay đổi.'
+    )
+    parser.add_argument(
+        '--metadata-backend',
+        choices=['auto', 'json', 'sqlite'],
+        default='auto',
+        help="Nơi lưu metadata: 'json' (metadata.json), 'sqlite' (metadata.db, WAL; tự chuyển dữ liệu từ\n"
+             "metadata.json ở lần đầu) hoặc 'auto' (mặc định: sqlite nếu metadata.db đã có, ngược lại json)."
+    )
+    parser.add_argument(
+        '--at',
+        metavar='REV',
+        help="Dựng output từ một commit/branch/tag (ví dụ --at v1.2 hoặc --at main~3) mà không checkout:\n"
+             "file được liệt kê bằng git ls-tree và nội dung đọc qua một tiến trình git cat-file --batch.\n"
+             "Output nằm trong <output-dir>/at-<commit>. Dùng với --initial-scan (mặc định), --merge,\n"
+             "--merge-dir, --merge-error, --merge-deps hoặc --status."
+    )
+    parser.add_argument(
+        '--blob-cache',
+        metavar='DIR',
+        default=os.environ.get('GIT_TRACKER_BLOB_CACHE'),
+        help="Thư mục blob cache dùng chung (mặc định: biến môi trường GIT_TRACKER_BLOB_CACHE, không có thì tắt).\n"
+             "Lưu text đã decode, import và số dòng/token theo hash nội dung, dùng chung giữa branch/worktree."
+    )
+    parser.add_argument('--blob-cache-size', metavar='SIZE', default='256M',
+                        help='Ngân sách dung lượng của blob cache, ví dụ 512M hoặc 2G (mặc định: 256M); vượt thì dọn theo LRU.')
+    parser.add_argument(
+        '--profile',
+        nargs='?',
+        const='',
+        metavar='FILE',
+        help="Ghi báo cáo JSON của lần chạy: thời gian theo phase (git, hash, đọc file, resolve, ghi output...)\n"
+             "và bộ đếm (byte đọc, file hash, stat, tiến trình git, cache hit). Mặc định ghi vào\n"
+             "<output-dir>/profiles/run-<thời điểm>-<pid>.json. Dùng với --create-hook để worker nền cũng ghi báo cáo."
+    )
+    parser.add_argument('--profile-cpu', action='store_true',
+                        help='(Kèm --profile) Chạy cProfile và ghi file .prof cạnh báo cáo (xem bằng python -m pstats).')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='(Kèm --profile) Theo dõi cấp phát bằng tracemalloc, thêm đỉnh bộ nhớ và các dòng cấp phát nhiều nhất.')
+    parser.add_argument('--debounce', type=float, default=0.3, help='(--watch) Gom các thay đổi trong khoảng này (giây) trước khi cập nhật.')
+    parser.add_argument(
+        '--watch-backend',
+        choices=['auto', 'inotify', 'poll'],
+        default='auto',
+        help="(--watch) Nguồn sự kiện: 'auto' dùng inotify nếu có, nếu không thì poll stat."
+    )
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='(--watch) Chu kỳ poll (giây) khi không dùng inotify.')
+    parser.add_argument(
+        '--size-limit',
+        action='append',
+        default=[],
+        metavar='TYPE=SIZE',
+        help="Giới hạn kích thước nội dung theo loại file, ví dụ 'assets=64K' hoặc 'default=4M'.\n"
+             "File lớn hơn (hoặc file nhị phân) chỉ được ghi một dòng stub kèm kích thước và hash."
+    )
     
     action_group.add_argument(
         '--merge-deps',
+        nargs='+',
         metavar='FILE_PATH',
-        help='(MỚI) Tìm và gộp một file cùng tất cả các file phụ thuộc (dependencies) và các file sử dụng nó (usages).'
+        help='(MỚI) Tìm và gộp một file cùng tất cả các file phụ thuộc (dependencies) và các file sử dụng nó (usages).\n'
+             'Nhận nhiều file: import graph được dựng một lần, mỗi file liên quan chỉ đọc một lần,\n'
+             'mỗi file đích ra một deps-<tên>.merged.txt riêng (được ghi song song).'
+    )
+    action_group.add_argument(
+        '--affected',
+        metavar='RANGE',
+        help="Liệt kê mọi file bị ảnh hưởng (bắc cầu qua import) bởi một khoảng commit, ví dụ\n"
+             "--affected main..HEAD, --affected origin/main...HEAD, hoặc --affected main (so với working tree).\n"
+             "In mỗi dòng một file ra stdout và ghi affected-<range>.json (nhóm theo độ sâu)."
+    )
+    parser.add_argument('--affected-depth', type=int, metavar='N', help='(--affected) Chỉ đi ngược tối đa N bước import.')
+    parser.add_argument('--affected-bundle', action='store_true',
+                        help='(--affected) Gộp các file bị ảnh hưởng (theo độ sâu) vào affected-<range>.merged.txt.')
+    parser.add_argument(
+        '--budget',
+        metavar='SIZE',
+        help="(--merge-deps) Giới hạn kích thước mỗi file gộp: số token (32000, 32k) hoặc byte (256KB, 500000B).\n"
+             "File được xếp theo khoảng cách import (file đích, dependencies gần trước, rồi usages) và dừng\n"
+             "khi chạm ngân sách; các file bị cắt được liệt kê ở cuối file gộp. Ước lượng được cache trong metadata."
+    )
+    parser.add_argument(
+        '--merge-deps-manifest',
+        metavar='FILE',
+        help='File liệt kê các file đích cho --merge-deps, mỗi dòng một đường dẫn (tương đối với project-path);\n'
+             "dòng trống và dòng bắt đầu bằng '#' bị bỏ qua. Có thể dùng kèm --merge-deps."
     )
 
     args = parser.parse_args()
@@ -1315,10 +4859,79 @@ def main():
     if args.merge:
         fileList = args.merge # Ghi đè fileList nếu --merge được dùng
 
+    try:
+        hasher = ContentHasher(args.hash_algo, digest_size=args.digest_size, workers=args.hash_workers)
+    except ValueError as e:
+        parser.error(str(e))
+
+    content_size_limits: Dict[str, int] = {}
+    size_units = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    for limit_spec in args.size_limit:
+        limit_match = re.fullmatch(r'([\w-]+)=(\d+)([KMG]?)B?', limit_spec.strip(), re.IGNORECASE)
+        if not limit_match:
+            parser.error(f"--size-limit không hợp lệ: '{limit_spec}' (cần dạng TYPE=SIZE, ví dụ assets=64K)")
+        content_size_limits[limit_match.group(1)] = int(limit_match.group(2)) * size_units[limit_match.group(3).upper()]
+    cache_size_match = re.fullmatch(r'(\d+)([KMG]?)B?', args.blob_cache_size.strip(), re.IGNORECASE)
+    if not cache_size_match or int(cache_size_match.group(1)) == 0:
+        parser.error(f"--blob-cache-size không hợp lệ: '{args.blob_cache_size}' (ví dụ 512M)")
+    blob_cache_size = int(cache_size_match.group(1)) * size_units[cache_size_match.group(2).upper()]
+
+    merge_deps_targets: List[str] = list(args.merge_deps or [])
+    if args.merge_deps_manifest:
+        try:
+            with open(args.merge_deps_manifest, 'r', encoding='utf-8') as f:
+                merge_deps_targets += [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+        except OSError as e:
+            parser.error(f"Không đọc được --merge-deps-manifest: {e}")
+        if not merge_deps_targets:
+            parser.error(f"--merge-deps-manifest không có file đích nào: {args.merge_deps_manifest}")
+
+    budget: tuple[int, str] | None = None
+    if args.budget is not None:
+        budget_match = re.fullmatch(r'(\d+)\s*([KM]?)\s*(B|BYTES?|T|TOKENS?)?', args.budget.strip(), re.IGNORECASE)
+        if not budget_match or int(budget_match.group(1)) == 0:
+            parser.error(f"--budget không hợp lệ: '{args.budget}' (ví dụ 32000, 32k hoặc 256KB)")
+        if not merge_deps_targets:
+            parser.error("--budget chỉ dùng với --merge-deps hoặc --merge-deps-manifest")
+        budget_unit = 'bytes' if (budget_match.group(3) or '').upper().startswith('B') else 'tokens'
+        budget_scale = {'': 1, 'K': 1000, 'M': 1000 ** 2} if budget_unit == 'tokens' else size_units
+        budget = (int(budget_match.group(1)) * budget_scale[budget_match.group(2).upper()], budget_unit)
+
+    if args.affected is not None and (not args.affected or args.affected.startswith('-')):
+        parser.error(f"--affected không hợp lệ: '{args.affected}' (ví dụ main..HEAD)")
+    if args.affected_depth is not None and args.affected_depth < 0:
+        parser.error("--affected-depth phải >= 0")
+
+    if args.at is not None:
+        worktree_actions = [flag for flag, used in (('--check-update', args.check_update), ('--create-hook', args.create_hook),
+                                                    ('--watch', args.watch), ('--drain-queue', args.drain_queue)) if used]
+        if worktree_actions:
+            parser.error(f"--at không dùng được với {', '.join(worktree_actions)}")
+        if not (fileList or args.merge_dir or args.merge_error or merge_deps_targets or args.affected or args.status):
+            args.initial_scan = True
+
     project_path_resolved = Path(args.project_path).resolve()
-    tracker = GitFileTracker(str(project_path_resolved), args.output_dir)
+    if args.status and args.at is None and args.profile is None:
+        # Trả lời từ bản tóm tắt của lần chạy trước: không dựng tracker, không mở log hay đọc metadata
+        status_summary = GitFileTracker.load_status_summary(project_path_resolved / args.output_dir)
+        if status_summary is not None:
+            GitFileTracker.print_status(status_summary, GitFileTracker.head_commit(project_path_resolved))
+            return
+
+    profiler = RunProfiler(enabled=args.profile is not None, cpu=args.profile_cpu, memory=args.profile_memory)
+    try:
+        tracker = GitFileTracker(str(project_path_resolved), args.output_dir, paranoid=args.paranoid,
+                                 change_detection=args.change_detection, hasher=hasher,
+                                 graph_workers=args.graph_workers, content_size_limits=content_size_limits,
+                                 metadata_backend=args.metadata_backend, revision=args.at,
+                                 blob_cache_dir=args.blob_cache, blob_cache_size=blob_cache_size,
+                                 profiler=profiler)
+    except ValueError as e:
+        parser.error(str(e))
 
     # Ưu tiên các hành động merge
+    run_started = time.perf_counter()
+    record_run = True # Lệnh chỉ đọc (status) không được ghi vào lịch sử chạy
     if fileList: # Xử lý --merge hoặc fileList toàn cục
         tracker.merge_specific_files(fileList)
     elif args.merge_dir:
@@ -1332,21 +4945,47 @@ def main():
             # logger đã báo lỗi rồi, có thể không cần print thêm
             pass
     # ===== END: XỬ LÝ HÀNH ĐỘNG MERGE THEO ERROR =====
-    elif args.merge_deps:
-        tracker.merge_dependencies_for_file(args.merge_deps)
+    elif merge_deps_targets:
+        tracker.merge_dependencies_for_files(merge_deps_targets, budget)
+    elif args.affected:
+        tracker.affected_files(args.affected, max_depth=args.affected_depth, bundle=args.affected_bundle)
     elif args.initial_scan:
         tracker.initial_scan()
     elif args.check_update:
         tracker.check_and_update()
     elif args.status:
         tracker.status()
+        record_run = False
     elif args.create_hook:
         tracker.create_git_hook()
+    elif args.drain_queue:
+        tracker.drain_queue()
+    elif args.watch:
+        tracker.watch(debounce=args.debounce, backend=args.watch_backend, poll_interval=args.poll_interval)
     else:
         # Hành động mặc định nếu không có cờ nào được chỉ định VÀ fileList rỗng
         print("Không có hành động nào được chỉ định và fileList rỗng. Hiển thị trạng thái.")
         print("Sử dụng --help để xem các tùy chọn.")
         tracker.status()
+        record_run = False
+
+    run_duration = time.perf_counter() - run_started
+    if record_run:
+        tracker.record_run(' '.join(sys.argv[1:]), run_duration)
+    tracker.close()
+    # Lệnh chỉ đọc (status) không tạo thư mục output nếu nó chưa có
+    if record_run or tracker.output_dir.is_dir():
+        try:
+            tracker.write_status_summary()
+        except OSError as e:
+            tracker.logger.warning(f"Không ghi được bản tóm tắt trạng thái: {e}")
+    if profiler.enabled:
+        try:
+            tracker.write_profile_report(' '.join(sys.argv[1:]), Path(args.profile).resolve() if args.profile else None)
+        except OSError as e:
+            tracker.logger.error(f"Không ghi được báo cáo profile: {e}")
+    if record_run:
+        tracker.logger.info(f"Thời gian chạy: {run_duration:.3f}s, số tiến trình git đã tạo: {tracker.git_call_count}.")
 
 if __name__ == '__main__':
     main()